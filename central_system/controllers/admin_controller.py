@@ -62,6 +62,13 @@ class AdminController(QObject):
             logging.error(f"AdminController: Error getting all students: {e}")
             return []
 
+    def get_students_page(self, limit, after=None):
+        try:
+            return self.db_service.get_students_page(limit, after)
+        except Exception as e:
+            logging.error(f"AdminController: Error getting a page of students: {e}")
+            return None # Not [], which would read as the end of the table
+
     def add_student(self, rfid_tag: str, name: str, student_number: str = None, course: str = None, department: str = None):
         try:
             student = self.db_service.add_student(rfid_tag, name, student_number, course, department)
@@ -110,6 +117,13 @@ class AdminController(QObject):
             logging.error(f"AdminController: Error getting all faculty: {e}")
             return []
 
+    def get_faculty_page(self, limit, after=None):
+        try:
+            return self.db_service.get_faculty_page(limit, after)
+        except Exception as e:
+            logging.error(f"AdminController: Error getting a page of faculty: {e}")
+            return None # Not [], which would read as the end of the table
+
     def add_faculty(self, name, department, ble_identifier, office_location=None, contact_details=None, current_status='Unavailable'):
         try:
             # Note: admin_dashboard_screen doesn't pass current_status, so using default from db_service.add_faculty
@@ -158,6 +172,13 @@ class AdminController(QObject):
             logging.error(f"AdminController: Error getting all consultations: {e}")
             return []
 
+    def get_consultations_page(self, limit, after=None):
+        try:
+            return self.db_service.get_consultations_page(limit, after)
+        except Exception as e:
+            logging.error(f"AdminController: Error getting a page of consultations: {e}")
+            return None # Not [], which would read as the end of the table
+
     def load_consultations(self):
         self._emit_all_data_changed_signals()
 
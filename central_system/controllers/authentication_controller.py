@@ -6,11 +6,12 @@ import logging
 # from ..views import AuthenticationScreen # Adjust if run standalone
 
 class AuthenticationController(QObject):
-    def __init__(self, rfid_service, db_service, auth_view):
+    def __init__(self, rfid_service, db_service, auth_view, roster_snapshot=None):
         super().__init__()
         self.rfid_service = rfid_service
         self.db_service = db_service
         self.auth_view = auth_view
+        self.roster_snapshot = roster_snapshot # Used when the database cannot be queried
 
         # Connect signals from the view to controller slots
         self.auth_view.request_rfid_scan_start.connect(self.start_rfid_scanning)
@@ -48,7 +49,22 @@ class AuthenticationController(QObject):
                 self.auth_view._on_login_failed("RFID tag not recognized.")
         except Exception as e:
             logging.error(f"Error during RFID validation: {e}")
+            self._login_from_snapshot(rfid_tag_id)
+
+    def _login_from_snapshot(self, rfid_tag_id):
+        if self.roster_snapshot is None:
             self.auth_view._on_login_failed("System error during validation.")
+            return
+        student_data = self.roster_snapshot.lookup(rfid_tag_id)
+        if student_data is None:
+            # Unknown to the snapshot too (or there is none yet); without the database we cannot tell which
+            logging.warning(f"RFID tag {rfid_tag_id} not in the offline roster snapshot (version {self.roster_snapshot.version}).")
+            self.auth_view._on_login_failed("RFID tag not recognized (database offline).")
+            return
+        age = self.roster_snapshot.age() or 0.0
+        logging.warning(f"Database unavailable; {student_data['name']} logged in from the roster snapshot "
+                        f"(version {self.roster_snapshot.version}, {age / 60:.0f} min old).")
+        self.auth_view._on_login_success(dict(student_data, offline=True))
 
     def cleanup(self):
         """Called when the controller is no longer needed, e.g., before app shutdown."""
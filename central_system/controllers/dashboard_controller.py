@@ -67,6 +67,7 @@ class DashboardController(QObject):
                 logging.info(f"DashboardController: Consultation request published via MQTT to faculty BLE ID {faculty_ble_id}.")
                 self.dashboard_view.set_request_status_message("Request submitted successfully!", is_error=False, duration_ms=5000)
                 self.dashboard_view.clear_request_form() # Clear form on success
+                self.dashboard_view.load_open_requests()
             else:
                 logging.error("DashboardController: Failed to publish consultation request via MQTT.")
                 # Note: Request is in DB, but not sent. Might need a retry mechanism or admin alert later.
@@ -106,6 +107,8 @@ if __name__ == '__main__':
             print(f"MockView: Status: {msg} (Error: {is_error}, Duration: {duration_ms})")
         def clear_request_form(self):
             print("MockView: Cleared request form.")
+        def load_open_requests(self):
+            print("MockView: Reloading open requests.")
 
     db_m = MockDB()
     mqtt_m = MockMQTT()
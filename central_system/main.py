@@ -6,15 +6,36 @@ from PyQt5.QtWidgets import QApplication, QMainWindow, QStackedWidget, QMessageB
 from PyQt5.QtCore import QTimer
 
 # Assuming services, views, and controllers are in the same package structure
-from services import DatabaseService, RFIDService, MQTTService
+from services import DatabaseService, RFIDService, MQTTService, AsyncMQTTService
+from services.roster_snapshot import RosterSnapshot, RosterSnapshotUpdater, ROSTER_SNAPSHOT_PATH
 from views import AuthenticationScreen, MainDashboardScreen, AdminDashboardScreen
 from controllers import AuthenticationController, DashboardController, AdminController
-
-# Configure basic logging for the main application
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - MainApp - %(message)s')
+from utils.logging_setup import configure_logging
+
+# Logging runs through a queue to a background thread, with repetitive service messages sampled
+# and rate limited (see utils/logging_setup.py). LOG_JSON writes one JSON object per line.
+LOG_LEVEL = "INFO"
+LOG_JSON = False
+LOG_FILE = None # e.g. "consultease.log"; rotated at 10 MB
+configure_logging(level=LOG_LEVEL, json_format=LOG_JSON, log_file=LOG_FILE)
+
+# Run MQTT on the Qt event loop through asyncio (needs qasync) instead of on its own thread
+USE_ASYNC_MQTT = False
+
+# Set when status_consumer.py processes ingest faculty status; the kiosk then only publishes
+# consultation requests and handles their acks
+EXTERNAL_STATUS_CONSUMERS = False
+
+# RFID readers served by RFIDService's I/O thread. None uses one serial reader found by VID:PID;
+# entrance kiosks with a reader per queue lane list them (services/rfid_readers.py), e.g.
+# RFID_READERS = [SerialTagReader("lane-1", port="/dev/ttyUSB0"), SerialTagReader("lane-2", port="/dev/ttyUSB1"),
+#                 EvdevTagReader("lane-3", name_keyword="RFID")]
+RFID_READERS = None
+# Records the readers' raw input for replay with `python -m tools.rfid_replay replay <file>`
+RFID_RECORD_FILE = None # e.g. "rfid_capture.jsonl"
 
 class ConsultEaseApp(QMainWindow):
-    def __init__(self):
+    def __init__(self, use_async_mqtt=False):
         super().__init__()
         self.setWindowTitle("ConsultEase Central System")
         # Screen resolution for RPi Touchscreen is 1024x600
@@ -22,6 +43,7 @@ class ConsultEaseApp(QMainWindow):
         # self.showFullScreen() # For Raspberry Pi display
 
         self.db_service = None
+        self.roster_updater = None
         self.rfid_service = None
         self.mqtt_service = None
         self.auth_controller = None
@@ -34,15 +56,23 @@ class ConsultEaseApp(QMainWindow):
         try:
             self.db_service = DatabaseService()
             logging.info("DatabaseService initialized successfully.")
+            # Exports the roster logins fall back to while the database is unreachable
+            self.roster_updater = RosterSnapshotUpdater(self.db_service, ROSTER_SNAPSHOT_PATH)
+            self.roster_updater.start()
         except RuntimeError as e:
             logging.critical(f"CRITICAL: Failed to initialize DatabaseService: {e}")
             QMessageBox.critical(self, "Startup Error", f"Failed to connect to the database: {e}\nThe application cannot continue.")
             sys.exit(1) # Critical error, exit
             
-        self.rfid_service = RFIDService(simulation_mode=False) # Use actual RFID reader
+        self.rfid_service = RFIDService(simulation_mode=False, readers=RFID_READERS) # Use actual RFID reader(s)
         logging.info("RFIDService initialized (Attempting Actual Hardware Mode).")
+        if RFID_RECORD_FILE:
+            self.rfid_service.start_recording(RFID_RECORD_FILE)
 
-        self.mqtt_service = MQTTService(db_service=self.db_service)
+        if use_async_mqtt:
+            self.mqtt_service = AsyncMQTTService(db_service=self.db_service, ingest_status=not EXTERNAL_STATUS_CONSUMERS)
+        else:
+            self.mqtt_service = MQTTService(db_service=self.db_service, ingest_status=not EXTERNAL_STATUS_CONSUMERS)
         self.mqtt_service.start()
         logging.info("MQTTService started.")
 
@@ -81,7 +111,8 @@ class ConsultEaseApp(QMainWindow):
             self.auth_controller = AuthenticationController(
                 rfid_service=self.rfid_service, 
                 db_service=self.db_service, 
-                auth_view=self.auth_screen
+                auth_view=self.auth_screen,
+                roster_snapshot=RosterSnapshot(ROSTER_SNAPSHOT_PATH)
             )
             logging.info("AuthenticationController initialized.")
 
@@ -96,6 +127,7 @@ class ConsultEaseApp(QMainWindow):
             logging.error("DashboardController NOT initialized due to DB service failure.")
 
         # Connect signals for navigation
+        self.auth_screen.authenticated.connect(self.dashboard_screen.prefetch)
         self.auth_screen.login_successful.connect(self.handle_login_success)
         self.auth_screen.request_open_admin_panel.connect(self.show_admin_dashboard_screen)
         self.dashboard_screen.request_open_admin_panel.connect(self.show_admin_dashboard_screen)
@@ -117,6 +149,7 @@ class ConsultEaseApp(QMainWindow):
         self.stacked_widget.setCurrentWidget(self.auth_screen)
         self.auth_screen.view_did_appear()
         self.current_student_data = None
+        self.dashboard_screen.cancel_prefetch() # The session ended; late results must not show its data
 
     def show_dashboard_screen(self):
         logging.info("Showing Dashboard Screen.")
@@ -156,6 +189,9 @@ class ConsultEaseApp(QMainWindow):
         logging.info("Close event received. Shutting down services...")
         if self.rfid_service: self.rfid_service.close()
         if self.mqtt_service: self.mqtt_service.stop()
+        if self.roster_updater: self.roster_updater.stop()
+        self.dashboard_screen.loader.cancel()
+        self.dashboard_screen.loader.wait(2000) # Let in-flight queries finish before the services go away
         # Controllers might have cleanup, e.g., if they manage threads or external resources
         # if self.auth_controller and hasattr(self.auth_controller, 'cleanup'): self.auth_controller.cleanup()
         # if self.dashboard_controller and hasattr(self.dashboard_controller, 'cleanup'): self.dashboard_controller.cleanup()
@@ -165,7 +201,18 @@ class ConsultEaseApp(QMainWindow):
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
-    main_app = ConsultEaseApp()
+    event_loop = None
+    if USE_ASYNC_MQTT:
+        from utils.qt_asyncio import QASYNC_AVAILABLE, create_qt_event_loop
+        if QASYNC_AVAILABLE:
+            event_loop = create_qt_event_loop(app)
+        else:
+            logging.warning("USE_ASYNC_MQTT is set but qasync is missing; falling back to the threaded MQTTService.")
+    main_app = ConsultEaseApp(use_async_mqtt=event_loop is not None)
     main_app.show() 
     # main_app.resize(1024, 600) # Optional resize for desktop
-    sys.exit(app.exec_()) 
\ No newline at end of file
+    if event_loop:
+        with event_loop:
+            event_loop.run_forever() # Runs the Qt event loop with asyncio tasks on it
+        sys.exit(0)
+    sys.exit(app.exec_()) 
@@ -2,5 +2,6 @@
 from .database_service import DatabaseService
 from .rfid_service import RFIDService
 from .mqtt_service import MQTTService
+from .async_mqtt_service import AsyncMQTTService
 
-__all__ = ["DatabaseService", "RFIDService", "MQTTService"] 
\ No newline at end of file
+__all__ = ["DatabaseService", "RFIDService", "MQTTService", "AsyncMQTTService"] 
\ No newline at end of file
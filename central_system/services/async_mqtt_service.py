@@ -0,0 +1,687 @@
+import paho.mqtt.client as mqtt
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+
+from utils.backoff import ExponentialBackoff
+from services.mqtt_spool import OutboundSpool
+from services.presence_debouncer import PresenceDebouncer
+from services.consultation_delivery import ConsultationDeliveryTracker, parse_ack_payload
+from services.desk_unit_watchdog import DeskUnitWatchdog, OFFLINE_STATUS
+from services.status_warmup import RetainedStatusWarmup
+from services.mqtt_service import (
+    MQTT_BROKER_HOST, MQTT_BROKER_PORT, MQTT_KEEPALIVE,
+    MQTT_RECONNECT_MIN_DELAY, MQTT_RECONNECT_MAX_DELAY, MQTT_LOOP_IDLE_TIMEOUT,
+    MQTT_SPOOL_PATH, MQTT_SPOOL_MAX_INFLIGHT,
+    CONSULTATION_ACK_DEADLINE, CONSULTATION_MAX_DELIVERY_ATTEMPTS, CONSULTATION_ACK_BATCH_MAX, CONSULTATION_ACK_FLUSH_INTERVAL,
+    DESK_UNIT_OFFLINE_AFTER, DESK_UNIT_WATCHDOG_TICK, DESK_UNIT_WATCHDOG_SLOTS, STATUS_WARMUP_WINDOW, STATUS_WARMUP_QUIET,
+    FACULTY_STATUS_TOPIC_WILDCARD, FACULTY_BULK_STATUS_TOPIC_WILDCARD, FACULTY_ACK_TOPIC_WILDCARD, CONSULTATION_REQUEST_TOPIC_TEMPLATE,
+    parse_status_payload, parse_bulk_status_payload, shared_subscription, status_partition, build_announcements,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncMQTTService:
+    """MQTT service driven by an asyncio event loop instead of a dedicated thread.
+
+    paho's socket is registered with the loop (add_reader/add_writer), so packets are read and
+    written by the loop itself and incoming messages are handled by coroutines on the same
+    thread. With utils.qt_asyncio.create_qt_event_loop() that loop is the Qt event loop, which
+    leaves one thread for the GUI and all network I/O. Blocking work (the TCP connect and a
+    synchronous DatabaseService) runs on a single helper thread.
+
+    Public API matches MQTTService: start(), stop(), is_connected(), publish_message(),
+    publish_consultation_request() and get_spool_backlog().
+    """
+
+    def __init__(self, db_service, client_id="ConsultEase_CentralSystem", spool_path=MQTT_SPOOL_PATH, loop=None,
+                 broker_host=MQTT_BROKER_HOST, broker_port=MQTT_BROKER_PORT, presence_debouncer=None,
+                 ingest_status=True, handle_acks=True, shared_group=None, partition=None):
+        # ingest_status, handle_acks, shared_group and partition: see MQTTService.__init__
+        self.shared_group = shared_group
+        self.partition = partition
+        self.ingest_status = ingest_status
+        self.client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv5 if shared_group else mqtt.MQTTv311)
+        self.db_service = db_service
+        self.broker_host = broker_host
+        self.broker_port = broker_port
+        self.presence_debouncer = presence_debouncer or PresenceDebouncer()
+        self.delivery_tracker = ConsultationDeliveryTracker(
+            CONSULTATION_ACK_DEADLINE, CONSULTATION_MAX_DELIVERY_ATTEMPTS,
+            CONSULTATION_ACK_BATCH_MAX, CONSULTATION_ACK_FLUSH_INTERVAL)
+        self.desk_unit_watchdog = DeskUnitWatchdog(DESK_UNIT_OFFLINE_AFTER, DESK_UNIT_WATCHDOG_TICK, DESK_UNIT_WATCHDOG_SLOTS)
+        self.status_warmup = RetainedStatusWarmup(STATUS_WARMUP_WINDOW if ingest_status and not shared_group else 0,
+                                                  STATUS_WARMUP_QUIET)
+        self._loop = loop
+        self._loop_thread_id = None
+        self._is_connected = False
+        self._stopping = False
+        self._supervisor_task = None
+        self._dispatch_task = None
+        self._presence_task = None
+        self._presence_wakeup = None # asyncio.Event, set when a transition is held back
+        self._delivery_task = None
+        self._delivery_wakeup = None # asyncio.Event, set when an ack arrives or a request is tracked
+        self._watchdog_task = None
+        self._warmup_task = None
+        self._warmup_wakeup = None   # asyncio.Event, set when a warm-up starts or its SUBACK arrives
+        self._misc_task = None
+        self._spool_task = None
+        self._spool_wakeup = None    # asyncio.Event, set when a message is spooled, a PUBACK arrives or we connect
+        self._sock_fd = None
+        self._connection_lost = None # asyncio.Event, created on the loop in start()
+        self._inbox = None           # asyncio.Queue of (topic, payload, retain) for the handler coroutines
+        self._blocking_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="AsyncMQTT-blocking")
+
+        # Outbound spool. Its SQLite work runs on the blocking helper thread, in submission order;
+        # the cursor and in-flight window belong to the loop thread
+        self._spool = OutboundSpool(spool_path) if spool_path else None
+        self._spool_cursor = 0
+        self._spool_inflight = {}
+        self._spool_acked_mids = collections.deque()
+
+        self._subscriptions = []
+        if ingest_status:
+            for topic_filter in (FACULTY_STATUS_TOPIC_WILDCARD, FACULTY_BULK_STATUS_TOPIC_WILDCARD):
+                self._subscriptions.append((shared_subscription(shared_group, topic_filter) if shared_group else topic_filter, 0))
+        if handle_acks:
+            self._subscriptions.append((FACULTY_ACK_TOPIC_WILDCARD, 0))
+        self._backoff = ExponentialBackoff(MQTT_RECONNECT_MIN_DELAY, MQTT_RECONNECT_MAX_DELAY)
+
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        self.client.on_subscribe = self._on_subscribe
+        self.client.on_publish = self._on_publish
+        # External event loop hooks: paho never runs its own select() loop
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    # --- Lifecycle ---
+
+    def start(self):
+        """Schedules the connection supervisor and message handlers on the event loop."""
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stopping = False
+        self._connection_lost = asyncio.Event()
+        self._inbox = asyncio.Queue()
+        self._presence_wakeup = asyncio.Event()
+        self._delivery_wakeup = asyncio.Event()
+        self._warmup_wakeup = asyncio.Event()
+        self._spool_wakeup = asyncio.Event()
+        self._dispatch_task = self._loop.create_task(self._dispatch_messages())
+        self._presence_task = self._loop.create_task(self._apply_due_presence())
+        self._delivery_task = self._loop.create_task(self._process_deliveries())
+        if self.ingest_status: # Otherwise the status consumers own Offline too
+            self._watchdog_task = self._loop.create_task(self._sweep_silent_units())
+        self._warmup_task = self._loop.create_task(self._finish_status_warmups())
+        if self._spool:
+            self._spool_task = self._loop.create_task(self._drain_spool())
+        self._supervisor_task = self._loop.create_task(self._supervise())
+        logger.info("AsyncMQTTService: Started on the asyncio event loop.")
+
+    def stop(self):
+        """Disconnects from the broker and cancels the service's tasks. Call from the loop thread."""
+        logger.info("AsyncMQTTService: Received stop signal.")
+        self._stopping = True
+        if self._is_connected:
+            try:
+                self.client.disconnect()
+                self.client.loop_write() # Flush DISCONNECT now rather than on the next loop iteration
+            except Exception as e:
+                logger.debug(f"AsyncMQTTService: disconnect() during stop raised: {e}")
+        for task in (self._supervisor_task, self._dispatch_task, self._presence_task, self._delivery_task, self._watchdog_task,
+                     self._warmup_task, self._spool_task, self._misc_task):
+            if task and not task.done():
+                task.cancel()
+        if self._spool:
+            # After the appends still queued; unacknowledged entries stay on disk for the next start
+            self._blocking_executor.submit(self._spool.close)
+            self._spool = None
+        self._blocking_executor.shutdown(wait=False)
+        self._is_connected = False
+        logger.info("AsyncMQTTService fully stopped.")
+
+    async def wait_closed(self):
+        """Waits until the tasks cancelled by stop() have finished."""
+        tasks = [task for task in (self._supervisor_task, self._dispatch_task, self._presence_task, self._delivery_task, self._watchdog_task,
+                                   self._warmup_task, self._spool_task, self._misc_task) if task]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def is_connected(self):
+        return self._is_connected
+
+    async def _supervise(self):
+        """Connects, waits for the connection to drop and reconnects with jittered exponential backoff."""
+        while not self._stopping:
+            self._connection_lost.clear()
+            if await self._connect_socket():
+                await self._connection_lost.wait()
+                if self._stopping:
+                    break
+                logger.warning("AsyncMQTTService: Connection lost.")
+            delay = self._backoff.next_delay()
+            logger.info(f"AsyncMQTTService: Reconnecting in {delay:.1f}s (attempt {self._backoff.attempts}).")
+            await asyncio.sleep(delay)
+
+    async def _connect_socket(self):
+        # connect() resolves the host and blocks on the TCP handshake, so keep it off the loop
+        try:
+            await self._loop.run_in_executor(
+                self._blocking_executor, self.client.connect, self.broker_host, self.broker_port, MQTT_KEEPALIVE)
+            return True
+        except ConnectionRefusedError:
+            logger.error(f"AsyncMQTTService: Connection refused by broker {self.broker_host}:{self.broker_port}.")
+        except OSError as e:
+            logger.error(f"AsyncMQTTService: OS error connecting to broker: {e}.")
+        except Exception as e:
+            logger.error(f"AsyncMQTTService: Unexpected error during connection: {e}.")
+        return False
+
+    # --- paho socket hooks ---
+
+    def _call_on_loop(self, callback, *args):
+        # paho calls the socket hooks from connect() on the helper thread as well as from the loop
+        if threading.get_ident() == self._loop_thread_id:
+            callback(*args)
+        else:
+            self._loop.call_soon_threadsafe(callback, *args)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._call_on_loop(self._register_socket, sock.fileno())
+
+    def _register_socket(self, fd):
+        self._sock_fd = fd
+        self._loop.add_reader(fd, self._on_readable)
+        self._misc_task = self._loop.create_task(self._misc_loop())
+
+    def _on_socket_close(self, client, userdata, sock):
+        # paho closes the socket right after this returns, so the fd is released synchronously
+        # when possible; a close reported from the helper thread only happens before registration.
+        self._call_on_loop(self._unregister_socket)
+
+    def _unregister_socket(self):
+        if self._sock_fd is not None:
+            self._loop.remove_reader(self._sock_fd)
+            self._loop.remove_writer(self._sock_fd)
+            self._sock_fd = None
+        if self._misc_task:
+            self._misc_task.cancel()
+            self._misc_task = None
+        self._connection_lost.set()
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._call_on_loop(self._add_writer)
+
+    def _add_writer(self):
+        if self._sock_fd is not None:
+            self._loop.add_writer(self._sock_fd, self.client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._call_on_loop(self._remove_writer)
+
+    def _remove_writer(self):
+        if self._sock_fd is not None:
+            self._loop.remove_writer(self._sock_fd)
+
+    def _on_readable(self):
+        if self.client.loop_read() != mqtt.MQTT_ERR_SUCCESS:
+            self._unregister_socket() # paho already closed the socket on a read error
+
+    async def _misc_loop(self):
+        # Keepalive pings and PINGRESP timeouts; everything else is event driven
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(MQTT_LOOP_IDLE_TIMEOUT)
+
+    # --- paho callbacks (run on the loop thread) ---
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None): # properties: MQTT v5 only
+        if rc == 0:
+            logger.info(f"AsyncMQTTService: Connected successfully to broker {self.broker_host}:{self.broker_port}")
+            self._is_connected = True
+            self._backoff.reset()
+            self.delivery_tracker.restart_deadlines() # Time spent disconnected does not count against desk units
+            self.desk_unit_watchdog.restart_deadlines()
+            if self._subscriptions:
+                self.status_warmup.start()
+                self._warmup_wakeup.set()
+                client.subscribe(self._subscriptions)
+            logger.info(f"AsyncMQTTService: Subscribed to {[topic for topic, _ in self._subscriptions]}")
+            self._spool_wakeup.set()
+        else:
+            logger.error(f"AsyncMQTTService: Connection failed with code {rc}. Check broker and network.")
+            self._is_connected = False
+
+    def _on_subscribe(self, client, userdata, mid, granted_qos, properties=None):
+        self.status_warmup.subscribed() # Retained messages follow the SUBACK
+        self._warmup_wakeup.set()
+
+    def _on_disconnect(self, client, userdata, rc, properties=None):
+        if not self._is_connected:
+            return # Already handled; paho reports a requested disconnect more than once
+        self._is_connected = False
+        if self._stopping:
+            logger.info(f"AsyncMQTTService: Disconnected from MQTT broker (rc {rc}).")
+        else:
+            logger.warning(f"AsyncMQTTService: Disconnected from MQTT broker with result code {rc}. Will attempt to reconnect.")
+        if self._connection_lost:
+            self._connection_lost.set()
+
+    def _on_message(self, client, userdata, msg):
+        # Hand off to the handler coroutines; keeps paho's read path short and preserves order
+        self._inbox.put_nowait((msg.topic, msg.payload, msg.retain))
+
+    def _on_publish(self, client, userdata, mid):
+        logger.debug("AsyncMQTTService: Message Published (mid: %s)", mid)
+        self._spool_acked_mids.append(mid)
+        self._spool_wakeup.set()
+
+    # --- Inbound handlers ---
+
+    async def _dispatch_messages(self):
+        while True:
+            topic, payload, retain = await self._inbox.get()
+            try:
+                payload_str = payload.decode('utf-8')
+                if self.status_warmup.active and topic.endswith("/status"):
+                    topic_parts = topic.split('/')
+                    if retain and len(topic_parts) == 4 and topic_parts[:2] == ["consultease", "faculty"]:
+                        self._collect_retained_status(topic_parts[2], payload_str)
+                    else:
+                        self.status_warmup.defer((topic, payload_str)) # Applied after the retained statuses
+                    continue
+                await self._handle_message(topic, payload_str)
+            except Exception as e:
+                logger.error(f"AsyncMQTTService: Error processing message on '{topic}': {e}")
+
+    async def _handle_message(self, topic, payload_str):
+        logger.debug("AsyncMQTTService: Message received on topic '%s': %s", topic, payload_str)
+        topic_parts = topic.split('/')
+        if len(topic_parts) == 4 and topic_parts[0] == "consultease" and topic_parts[3] == "status":
+            if topic_parts[1] == "faculty":
+                await self._handle_status(topic_parts[2], payload_str)
+                return
+            if topic_parts[1] == "gateway":
+                await self._handle_bulk_status(topic_parts[2], payload_str)
+                return
+        if len(topic_parts) == 4 and topic_parts[:2] == ["consultease", "faculty"] and topic_parts[3] == "ack":
+            self._handle_ack(topic, payload_str)
+            return
+        logger.warning(f"AsyncMQTTService: Received message on unhandled topic: {topic}")
+
+    def _owns(self, ble_identifier):
+        return self.partition is None or status_partition(ble_identifier, self.partition[1]) == self.partition[0]
+
+    async def _handle_status(self, ble_identifier, payload_str):
+        if not self._owns(ble_identifier):
+            return # Another consumer's partition
+        self.desk_unit_watchdog.seen(ble_identifier) # Any status message, repeats included, is a sign of life
+        new_status = parse_status_payload(payload_str)
+        if new_status is None:
+            logger.warning(f"AsyncMQTTService: Unknown status format/value '{payload_str}' from {ble_identifier}")
+            return
+        if not new_status:
+            logger.warning(f"AsyncMQTTService: Parsed empty status from payload: {payload_str}")
+            return
+        if not self.presence_debouncer.observe(ble_identifier, new_status):
+            self._presence_wakeup.set() # May have scheduled an earlier transition
+            return
+        if not self.db_service:
+            return
+        try:
+            updated_faculty = await self._call_db("update_faculty_status_by_ble_id", ble_identifier, new_status)
+        except Exception:
+            self.presence_debouncer.reject(ble_identifier, new_status)
+            raise
+        if updated_faculty:
+            logger.debug("AsyncMQTTService: DB status updated for %s.", updated_faculty.get('name'))
+        else:
+            # Not written, so the unit's next report must not be suppressed as a repeat
+            self.presence_debouncer.reject(ble_identifier, new_status)
+            logger.warning(f"AsyncMQTTService: Failed to update status in DB for BLE {ble_identifier}.")
+
+    def _collect_retained_status(self, ble_identifier, payload_str):
+        """Adds a retained desk unit status to the warm-up batch instead of writing it on its own."""
+        if not self._owns(ble_identifier):
+            return
+        self.desk_unit_watchdog.seen(ble_identifier)
+        new_status = parse_status_payload(payload_str)
+        if not new_status:
+            logger.warning(f"AsyncMQTTService: Ignoring retained status '{payload_str}' from {ble_identifier}")
+            self.status_warmup.retained_seen()
+        elif self.presence_debouncer.observe(ble_identifier, new_status):
+            self.status_warmup.add(ble_identifier, new_status)
+        else:
+            self.status_warmup.retained_seen()
+
+    async def _finish_status_warmups(self):
+        """Writes each warm-up's retained statuses as one batched update, then replays the deferred live messages."""
+        while True:
+            due = self.status_warmup.next_due()
+            timeout = MQTT_LOOP_IDLE_TIMEOUT if due is None else max(due - time.monotonic(), 0.0)
+            timer = self._loop.call_later(timeout, self._warmup_wakeup.set)
+            try:
+                await self._warmup_wakeup.wait()
+            finally:
+                timer.cancel()
+            self._warmup_wakeup.clear()
+            if not self.status_warmup.due():
+                continue
+            batch = self.status_warmup.take_batch()
+            if batch and self.db_service:
+                observed_at = datetime.now()
+                updated_rows = None
+                try:
+                    updated_rows = await self._call_db("update_faculty_status_batch", [(ble_id, status, observed_at) for ble_id, status in batch])
+                    logger.info(f"AsyncMQTTService: Warm-up applied {len(updated_rows)}/{len(batch)} retained status(es) in one batch.")
+                except Exception as e:
+                    logger.error(f"AsyncMQTTService: Error applying retained statuses: {e}")
+                self.presence_debouncer.reject_unwritten(batch, updated_rows)
+            # The dispatcher keeps deferring while replayed messages wait on the DB, so loop until none are left
+            while True:
+                for topic, payload_str in self.status_warmup.take_deferred():
+                    try:
+                        await self._handle_message(topic, payload_str)
+                    except Exception as e:
+                        logger.error(f"AsyncMQTTService: Error processing message on '{topic}': {e}")
+                if self.status_warmup.finish():
+                    break
+
+    def get_warmup_stats(self):
+        return self.status_warmup.get_stats()
+
+    async def _handle_bulk_status(self, gateway_id, payload_str):
+        try:
+            latest, skipped = parse_bulk_status_payload(payload_str)
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"AsyncMQTTService: Malformed bulk status payload from gateway {gateway_id}: {e}")
+            return
+        if skipped:
+            logger.warning(f"AsyncMQTTService: Skipped {skipped} malformed entries in bulk status from gateway {gateway_id}.")
+        if not latest or not self.db_service:
+            return
+        status_updates = [(ble_id, status, observed_at) for ble_id, (status, observed_at) in latest.items()
+                          if self._owns(ble_id) and self.presence_debouncer.observe(ble_id, status)]
+        self._presence_wakeup.set()
+        if not status_updates:
+            return
+        updated_rows = None
+        try:
+            updated_rows = await self._call_db("update_faculty_status_batch", status_updates)
+            logger.info(f"AsyncMQTTService: Bulk status from gateway {gateway_id}: {len(updated_rows)}/{len(status_updates)} faculty rows updated.")
+        except Exception as e:
+            logger.error(f"AsyncMQTTService: Error applying bulk status from gateway {gateway_id}: {e}")
+        self.presence_debouncer.reject_unwritten(status_updates, updated_rows)
+
+    async def _apply_due_presence(self):
+        """Writes debounced transitions once their dwell time has passed, batched per wake-up."""
+        while True:
+            due = self.presence_debouncer.next_due()
+            timeout = MQTT_LOOP_IDLE_TIMEOUT if due is None else max(due - time.monotonic(), 0.0)
+            # A timer instead of wait_for(): wait_for can swallow cancellation when both complete at once
+            timer = self._loop.call_later(timeout, self._presence_wakeup.set)
+            try:
+                await self._presence_wakeup.wait()
+            finally:
+                timer.cancel()
+            self._presence_wakeup.clear()
+            released = self.presence_debouncer.pop_due()
+            if not released or not self.db_service:
+                continue
+            observed_at = datetime.now()
+            updated_rows = None
+            try:
+                updated_rows = await self._call_db("update_faculty_status_batch", [(ble_id, status, observed_at) for ble_id, status in released])
+                logger.info(f"AsyncMQTTService: Applied {len(updated_rows)} debounced status transition(s).")
+            except Exception as e:
+                logger.error(f"AsyncMQTTService: Error applying debounced status transitions: {e}")
+            self.presence_debouncer.reject_unwritten(released, updated_rows)
+
+    def _handle_ack(self, topic, payload_str):
+        if self.ingest_status:
+            self.desk_unit_watchdog.seen(topic.split('/')[2])
+        try:
+            consultation_id, event = parse_ack_payload(payload_str)
+        except ValueError as e: # json.JSONDecodeError is a ValueError
+            logger.warning(f"AsyncMQTTService: Malformed ack on '{topic}': {e}")
+            return
+        self.delivery_tracker.record_ack(consultation_id, event)
+        self._delivery_wakeup.set()
+
+    async def _process_deliveries(self):
+        """Applies ack batches to the DB and redelivers requests whose ack deadline passed."""
+        while True:
+            due = self.delivery_tracker.next_due()
+            timeout = MQTT_LOOP_IDLE_TIMEOUT if due is None else max(due - time.monotonic(), 0.0)
+            timer = self._loop.call_later(timeout, self._delivery_wakeup.set)
+            try:
+                await self._delivery_wakeup.wait()
+            finally:
+                timer.cancel()
+            self._delivery_wakeup.clear()
+            try:
+                await self._flush_acks()
+                await self._redeliver_unacknowledged()
+            except Exception as e:
+                logger.error(f"AsyncMQTTService: Error processing consultation acknowledgements: {e}")
+
+    async def _flush_acks(self):
+        if not self.delivery_tracker.ack_batch_due():
+            return
+        batch = self.delivery_tracker.take_ack_batch()
+        if not batch or not self.db_service:
+            return
+        rows = None
+        try:
+            rows = await self._call_db("record_consultation_acks", batch)
+        finally:
+            if rows is None:
+                self.delivery_tracker.requeue_acks(batch)
+        if rows is None:
+            logger.warning(f"AsyncMQTTService: Could not apply {len(batch)} consultation ack(s); retrying with the next batch.")
+            return
+        self.delivery_tracker.record_ack_results(rows)
+        logger.info(f"AsyncMQTTService: Applied {len(batch)} consultation ack(s) ({len(rows or [])} rows updated).")
+
+    async def _redeliver_unacknowledged(self):
+        if not self._is_connected:
+            return
+        redeliveries = self.delivery_tracker.take_redeliveries()
+        for consultation_id, topic, payload in redeliveries:
+            logger.warning(f"AsyncMQTTService: No ack for consultation {consultation_id}; redelivering to '{topic}'.")
+            self.publish_message(topic, payload, qos=1)
+        if redeliveries and self.db_service:
+            await self._call_db("increment_consultation_delivery_attempts", [consultation_id for consultation_id, _, _ in redeliveries])
+
+    def get_delivery_stats(self):
+        """Outstanding requests, redeliveries and submit -> delivered/viewed latency percentiles."""
+        return self.delivery_tracker.get_stats()
+
+    async def _sweep_silent_units(self):
+        """Marks desk units Offline once their silence window passes, one batched update per tick."""
+        while True:
+            await asyncio.sleep(DESK_UNIT_WATCHDOG_TICK)
+            if not self._is_connected:
+                continue # Silence is ours, not the units'; deadlines restart on reconnect
+            silent = self.desk_unit_watchdog.pop_silent()
+            if not silent:
+                continue
+            for ble_id, _ in silent:
+                self.presence_debouncer.force(ble_id, OFFLINE_STATUS)
+            if not self.db_service:
+                continue
+            offline_updates = [(ble_id, OFFLINE_STATUS, last_seen) for ble_id, last_seen in silent]
+            updated_rows = None
+            try:
+                updated_rows = await self._call_db("update_faculty_status_batch", offline_updates)
+                logger.warning(f"AsyncMQTTService: Marked {len(updated_rows)} silent desk unit(s) Offline: {[ble_id for ble_id, _ in silent]}")
+            except Exception as e:
+                logger.error(f"AsyncMQTTService: Error marking silent desk units Offline: {e}")
+            self.presence_debouncer.reject_unwritten(offline_updates, updated_rows)
+
+    def get_desk_unit_last_seen(self, ble_identifier):
+        """When the desk unit last published anything (a datetime), or None if not heard from since startup."""
+        return self.desk_unit_watchdog.get_last_seen(ble_identifier)
+
+    def get_watchdog_stats(self):
+        return self.desk_unit_watchdog.get_stats()
+
+    def get_presence_stats(self):
+        """Counts of status reports written, suppressed repeats and suppressed flapping transitions."""
+        return self.presence_debouncer.get_stats()
+
+    async def _call_db(self, method_name, *args):
+        """Awaits a DB method directly when the DB layer is async, otherwise runs it on the helper thread."""
+        method = getattr(self.db_service, method_name)
+        if asyncio.iscoroutinefunction(method):
+            return await method(*args)
+        return await self._loop.run_in_executor(self._blocking_executor, functools.partial(method, *args))
+
+    # --- Outbound ---
+
+    def publish_message(self, topic, payload, qos=1, retain=False):
+        """Publishes a message. Same delivery semantics as MQTTService.publish_message().
+
+        Safe to call from any thread; the actual publish happens on the loop thread.
+        """
+        if not isinstance(payload, str):
+            payload_str = json.dumps(payload)
+        else:
+            payload_str = payload
+
+        if qos > 0 and self._spool:
+            append = self._blocking_executor.submit(self._spool.append, topic, payload_str, qos, retain)
+            if threading.get_ident() == self._loop_thread_id:
+                # Not waited for, so the loop never blocks on the commit; the drain reads the spool after it
+                append.add_done_callback(functools.partial(self._log_spool_append_failure, topic))
+            else:
+                try:
+                    append.result()
+                except Exception as e:
+                    logger.error(f"AsyncMQTTService: Could not spool message for '{topic}': {e}")
+                    return False
+            if self._is_connected:
+                logger.debug("AsyncMQTTService: Message queued for topic '%s': %s", topic, payload_str)
+            else:
+                logger.warning(f"AsyncMQTTService: Not connected; message for '{topic}' spooled for delivery on reconnect.")
+            if self._spool_wakeup: # Otherwise not started yet; connecting drains the spool
+                self._loop.call_soon_threadsafe(self._spool_wakeup.set)
+            return True
+
+        if not self._is_connected:
+            logger.error("AsyncMQTTService: Cannot publish, not connected to broker.")
+            return False
+        self._loop.call_soon_threadsafe(functools.partial(self.client.publish, topic, payload_str, qos=qos, retain=retain))
+        logger.debug("AsyncMQTTService: Message published to topic '%s': %s", topic, payload_str)
+        return True
+
+    def publish_consultation_request(self, faculty_ble_identifier: str, request_payload: dict):
+        if not faculty_ble_identifier:
+            logger.error("AsyncMQTTService: Cannot publish consultation request, faculty BLE identifier is missing.")
+            return False
+        topic = CONSULTATION_REQUEST_TOPIC_TEMPLATE.format(faculty_ble_identifier)
+        payload_str = request_payload if isinstance(request_payload, str) else json.dumps(request_payload)
+        published = self.publish_message(topic, payload_str, qos=1)
+        consultation_id = request_payload.get("consultation_id") if isinstance(request_payload, dict) else None
+        if published and consultation_id is not None:
+            self.delivery_tracker.track(consultation_id, topic, payload_str)
+            self._loop.call_soon_threadsafe(self._delivery_wakeup.set) # Arm the ack deadline
+        return published
+
+    def publish_announcement(self, title, message, departments=None, retain=False):
+        """Sends an announcement to every desk unit or to the given departments. See MQTTService.publish_announcement()."""
+        directory = self.db_service.get_all_departments() if departments and self.db_service else None
+        announcements = build_announcements(title, message, departments, directory)
+        published = sum(1 for topic, payload in announcements if self.publish_message(topic, payload, qos=1, retain=retain))
+        logger.info(f"AsyncMQTTService: Announcement '{title}' published to {published}/{len(announcements)} topic(s).")
+        return published
+
+    def clear_announcement(self, departments=None):
+        topics = [topic for topic, _ in build_announcements("", "", departments)]
+        return sum(1 for topic in topics if self.publish_message(topic, "", qos=1, retain=True))
+
+    def _log_spool_append_failure(self, topic, append):
+        if append.exception() is not None:
+            logger.error(f"AsyncMQTTService: Could not spool message for '{topic}': {append.exception()}")
+
+    def _call_spool(self, method_name, *args):
+        """Runs an OutboundSpool method on the blocking helper thread, after the appends queued before it."""
+        return self._loop.run_in_executor(self._blocking_executor, functools.partial(getattr(self._spool, method_name), *args))
+
+    async def _drain_spool(self):
+        while True:
+            await self._spool_wakeup.wait()
+            self._spool_wakeup.clear()
+            try:
+                await self._service_spool()
+            except Exception as e:
+                logger.error(f"AsyncMQTTService: Error servicing the outbound spool: {e}")
+
+    async def _service_spool(self):
+        """Applies PUBACKs to the spool and refills the in-flight window."""
+        acked_seqs = []
+        while self._spool_acked_mids:
+            seq = self._spool_inflight.pop(self._spool_acked_mids.popleft(), None)
+            if seq is not None:
+                acked_seqs.append(seq)
+        if acked_seqs:
+            await self._call_spool("ack", acked_seqs)
+        while self._is_connected and len(self._spool_inflight) < MQTT_SPOOL_MAX_INFLIGHT:
+            entries = await self._call_spool("read_after", self._spool_cursor, MQTT_SPOOL_MAX_INFLIGHT - len(self._spool_inflight))
+            if not entries:
+                break
+            for seq, topic, payload, qos, retain in entries:
+                result = self.client.publish(topic, payload, qos=qos, retain=retain)
+                if result.rc not in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+                    logger.error(f"AsyncMQTTService: Failed to publish spooled message {seq} to '{topic}'. RC: {result.rc}")
+                    return
+                self._spool_inflight[result.mid] = seq
+                self._spool_cursor = seq
+        if acked_seqs and not self._spool_inflight and await self._call_spool("backlog_size") == 0:
+            await self._call_spool("compact")
+
+    def get_spool_backlog(self):
+        """Number of spooled messages not yet acknowledged by the broker (0 when the spool is disabled)."""
+        return self._spool.backlog_size() if self._spool else 0
+
+
+# Example Usage
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    class MockDBService:
+        def update_faculty_status_by_ble_id(self, ble_identifier, new_status):
+            print(f"[MockDBService] Updating status for BLE ID {ble_identifier} to {new_status}")
+            return {"name": "Dr. Mock Prof"} if ble_identifier == "KNOWN_BLE_ID" else None
+        def update_faculty_status_batch(self, status_updates):
+            print(f"[MockDBService] Batch updating {len(status_updates)} statuses: {status_updates}")
+            return [{"ble_identifier": ble_id} for ble_id, _, _ in status_updates if ble_id == "KNOWN_BLE_ID"]
+
+    async def main():
+        service = AsyncMQTTService(db_service=MockDBService())
+        service.start()
+        try:
+            for count in range(1, 31):
+                await asyncio.sleep(1)
+                if count % 10 == 0 and service.is_connected():
+                    service.publish_message("consultease/system/heartbeat", f"Test heartbeat {count//10}")
+        finally:
+            print(f"Spool backlog: {service.get_spool_backlog()}")
+            service.stop()
+            await service.wait_closed()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("Test interrupted by user.")
@@ -0,0 +1,161 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+
+from utils.latency import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+ACK_EVENTS = ("delivered", "viewed")
+
+
+def parse_ack_payload(payload_str):
+    """Parses a desk unit ack, {"consultation_id": 42, "event": "delivered"}, into (consultation_id, event).
+
+    Raises ValueError for anything else.
+    """
+    data = json.loads(payload_str)
+    if not isinstance(data, dict):
+        raise ValueError("ack payload must be a JSON object")
+    event = str(data.get("event", "")).strip().lower()
+    if event not in ACK_EVENTS:
+        raise ValueError(f"unknown ack event '{data.get('event')}'")
+    try:
+        consultation_id = int(data["consultation_id"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("ack payload has no valid consultation_id")
+    return consultation_id, event
+
+
+class ConsultationDeliveryTracker:
+    """Bookkeeping for consultation request delivery, shared by the MQTT services.
+
+    Published requests are tracked until the desk unit acknowledges them and handed back for
+    redelivery when no ack arrives within `ack_deadline`. Incoming acks are collected into
+    batches (up to `batch_max`, or whatever arrived within `flush_interval`) so the DB sees one
+    statement per batch, and submit -> delivered/viewed latencies are recorded from the rows the
+    DB returns. Does no I/O itself; the owning service decides when to flush and publish.
+    """
+
+    def __init__(self, ack_deadline=30.0, max_attempts=5, batch_max=50, flush_interval=0.5, clock=time.monotonic):
+        self.ack_deadline = ack_deadline
+        self.max_attempts = max_attempts
+        self.batch_max = batch_max
+        self.flush_interval = flush_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._awaiting = {}        # consultation_id -> [topic, payload, last published (clock), attempts]
+        self._acks = {}            # consultation_id -> [delivered_at, viewed_at] waiting for the DB
+        self._acks_since = None    # clock time the oldest pending ack arrived
+        self.latency = {event: LatencyHistogram() for event in ACK_EVENTS}
+        self.redelivered = 0
+        self.abandoned = 0
+        self.acks_received = 0
+
+    def track(self, consultation_id, topic, payload):
+        with self._lock:
+            self._awaiting[consultation_id] = [topic, payload, self._clock(), 1]
+
+    def record_ack(self, consultation_id, event, received_at=None):
+        """Queues an ack for the next batch and stops redelivery of that request."""
+        received_at = received_at or datetime.now()
+        with self._lock:
+            self.acks_received += 1
+            self._awaiting.pop(consultation_id, None)
+            pending = self._acks.setdefault(consultation_id, [None, None])
+            index = ACK_EVENTS.index(event)
+            if pending[index] is None:
+                pending[index] = received_at
+            if self._acks_since is None:
+                self._acks_since = self._clock()
+
+    def ack_batch_due(self, now=None):
+        now = self._clock() if now is None else now
+        with self._lock:
+            if not self._acks:
+                return False
+            return len(self._acks) >= self.batch_max or now - self._acks_since >= self.flush_interval
+
+    def take_ack_batch(self):
+        """Returns [(consultation_id, delivered_at, viewed_at)] and clears the pending acks."""
+        with self._lock:
+            batch = [(consultation_id, delivered_at, viewed_at) for consultation_id, (delivered_at, viewed_at) in self._acks.items()]
+            self._acks = {}
+            self._acks_since = None
+        return batch
+
+    def requeue_acks(self, batch):
+        """Puts back a batch from take_ack_batch() whose DB write failed, for the next flush.
+
+        Timestamps of acks received since the batch was taken are kept.
+        """
+        with self._lock:
+            for consultation_id, delivered_at, viewed_at in batch:
+                pending = self._acks.setdefault(consultation_id, [None, None])
+                for index, received_at in enumerate((delivered_at, viewed_at)):
+                    if pending[index] is None:
+                        pending[index] = received_at
+            if self._acks and self._acks_since is None:
+                self._acks_since = self._clock()
+
+    def record_ack_results(self, rows):
+        """Records latencies for requests acknowledged for the first time (rows from record_consultation_acks)."""
+        for row in rows or []:
+            requested_at = row.get("requested_at")
+            if not requested_at:
+                continue
+            if row.get("delivered_at") and not row.get("previous_delivered_at"):
+                self.latency["delivered"].record((row["delivered_at"] - requested_at).total_seconds())
+            if row.get("viewed_at") and not row.get("previous_viewed_at"):
+                self.latency["viewed"].record((row["viewed_at"] - requested_at).total_seconds())
+
+    def take_redeliveries(self, now=None):
+        """Returns [(consultation_id, topic, payload)] whose ack deadline passed, counting the attempt.
+
+        Requests that already used max_attempts are dropped (their status stays 'Pending').
+        """
+        now = self._clock() if now is None else now
+        due = []
+        with self._lock:
+            for consultation_id, entry in list(self._awaiting.items()):
+                if now - entry[2] < self.ack_deadline:
+                    continue
+                if entry[3] >= self.max_attempts:
+                    del self._awaiting[consultation_id]
+                    self.abandoned += 1
+                    logger.warning(f"ConsultationDeliveryTracker: No ack for consultation {consultation_id} after {entry[3]} attempts; giving up.")
+                    continue
+                entry[2] = now
+                entry[3] += 1
+                self.redelivered += 1
+                due.append((consultation_id, entry[0], entry[1]))
+        return due
+
+    def restart_deadlines(self):
+        """Gives every outstanding request a full deadline again, e.g. after a reconnect."""
+        now = self._clock()
+        with self._lock:
+            for entry in self._awaiting.values():
+                entry[2] = now
+
+    def next_due(self):
+        """Earliest clock time at which an ack batch or a redelivery is due, or None."""
+        with self._lock:
+            candidates = [entry[2] + self.ack_deadline for entry in self._awaiting.values()]
+            if self._acks:
+                candidates.append(self._acks_since + self.flush_interval)
+        return min(candidates) if candidates else None
+
+    def get_stats(self):
+        with self._lock:
+            outstanding = len(self._awaiting)
+        return {
+            "outstanding": outstanding,
+            "acks_received": self.acks_received,
+            "redelivered": self.redelivered,
+            "abandoned": self.abandoned,
+            "submit_to_delivered": self.latency["delivered"].summary(),
+            "submit_to_viewed": self.latency["viewed"].summary(),
+        }
@@ -1,14 +1,16 @@
 import psycopg2
 from psycopg2 import sql
-from psycopg2.extras import RealDictCursor
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.extras import RealDictCursor, execute_values
 from datetime import datetime
 import logging
+import threading
+import time
 
 # Import models once they are defined, assuming they are in ../models
 # from ..models import Student, Faculty # This relative import might need adjustment based on execution context
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
 
 # --- Configuration ---
 # Replace with your actual database connection details
@@ -17,6 +19,15 @@ DB_USER = "consultease_user"
 DB_PASSWORD = "app_password" # Make sure to use a strong password and manage it securely
 DB_HOST = "localhost"
 DB_PORT = "5432"
+# Seconds before giving up on connecting, so an unreachable server fails over to the roster snapshot
+# quickly instead of blocking a login for the OS TCP timeout (libpq's minimum is 2)
+DB_CONNECT_TIMEOUT = 3
+
+# Channel the students table's trigger notifies with {"op", "student_id"} for every row change
+STUDENT_CHANGES_CHANNEL = "student_changes"
+
+# Consultation statuses a student is still waiting on
+OPEN_CONSULTATION_STATUSES = ('Pending', 'Delivered', 'Viewed')
 
 class DatabaseService:
     def __init__(self):
@@ -26,7 +37,14 @@ class DatabaseService:
             "password": DB_PASSWORD,
             "host": DB_HOST,
             "port": DB_PORT,
+            "connect_timeout": DB_CONNECT_TIMEOUT,
         }
+        # Filter of every registered RFID tag (utils.bloom_filter.BloomFilter), installed by
+        # RosterSnapshotUpdater; while set, get_student_by_rfid answers unknown tags without a query
+        self.known_tags = None
+        self._known_tags_lock = threading.Lock()
+        self._tags_added = [] # (time.monotonic(), rfid_tag) committed here since the filter's roster was read
+        self.known_tag_stats = {"rejected": 0, "passed": 0, "false_positives": 0}
         self._ensure_tables_exist()
 
     def _get_connection(self):
@@ -35,7 +53,7 @@ class DatabaseService:
             conn = psycopg2.connect(**self.conn_params)
             return conn
         except psycopg2.Error as e:
-            logging.error(f"Error connecting to PostgreSQL database: {e}")
+            logger.error(f"Error connecting to PostgreSQL database: {e}")
             raise
 
     def _execute_query(self, query, params=None, fetch_one=False, fetch_all=False, commit=False):
@@ -56,7 +74,7 @@ class DatabaseService:
                     return cur.fetchall()
             return None # Should not reach here if fetch_one or fetch_all is True and query is valid
         except psycopg2.Error as e:
-            logging.error(f"Database query error: {e}\nQuery: {query}\nParams: {params}")
+            logger.error(f"Database query error: {e}\nQuery: {query}\nParams: {params}")
             if conn and not commit: # Rollback if it was not a commit operation that failed
                 conn.rollback()
             raise
@@ -64,6 +82,26 @@ class DatabaseService:
             if conn:
                 conn.close()
 
+    def _execute_values_query(self, query, values, template=None, fetch_all=False):
+        """Helper function to run a multi-row statement (VALUES %s) as a single round trip."""
+        conn = None
+        try:
+            conn = self._get_connection()
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                # page_size covers every row so the batch is sent as one statement, not pages of 100
+                rows = execute_values(cur, query, values, template=template,
+                                      page_size=max(len(values), 1), fetch=fetch_all)
+                conn.commit()
+                return rows if fetch_all else None
+        except psycopg2.Error as e:
+            logger.error(f"Database batch query error: {e}\nQuery: {query}\nRows: {len(values)}")
+            if conn:
+                conn.rollback()
+            raise
+        finally:
+            if conn:
+                conn.close()
+
     def _ensure_tables_exist(self):
         """Checks if the required tables exist and creates them if not."""
         create_students_table_sql = """
@@ -78,6 +116,7 @@ class DatabaseService:
             updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
         );
         CREATE INDEX IF NOT EXISTS idx_students_rfid_tag ON students(rfid_tag);
+        CREATE INDEX IF NOT EXISTS idx_students_name_id ON students(name, student_id);
         """
 
         create_faculty_table_sql = """
@@ -95,6 +134,7 @@ class DatabaseService:
         );
         CREATE INDEX IF NOT EXISTS idx_faculty_ble_identifier ON faculty(ble_identifier);
         CREATE INDEX IF NOT EXISTS idx_faculty_department ON faculty(department);
+        CREATE INDEX IF NOT EXISTS idx_faculty_name_id ON faculty(name, faculty_id);
         """
 
         create_consultations_table_sql = """
@@ -107,18 +147,50 @@ class DatabaseService:
             request_details TEXT,
             status VARCHAR(20) NOT NULL DEFAULT 'Pending',
             requested_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            delivered_at TIMESTAMPTZ,
+            viewed_at TIMESTAMPTZ,
+            delivery_attempts INTEGER NOT NULL DEFAULT 1
         );
         CREATE INDEX IF NOT EXISTS idx_consultations_student_id ON consultations(student_id);
         CREATE INDEX IF NOT EXISTS idx_consultations_faculty_id ON consultations(faculty_id);
         CREATE INDEX IF NOT EXISTS idx_consultations_status ON consultations(status);
+        CREATE INDEX IF NOT EXISTS idx_consultations_requested_at_id ON consultations(requested_at, consultation_id);
+        """
+
+        # Change events for RosterSnapshotUpdater, which keeps the offline login roster current
+        create_students_notify_sql = f"""
+        CREATE OR REPLACE FUNCTION notify_student_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify('{STUDENT_CHANGES_CHANNEL}', json_build_object('op', TG_OP, 'student_id', OLD.student_id)::text);
+            ELSE
+                PERFORM pg_notify('{STUDENT_CHANGES_CHANNEL}', json_build_object('op', TG_OP, 'student_id', NEW.student_id)::text);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        DROP TRIGGER IF EXISTS students_changed ON students;
+        CREATE TRIGGER students_changed AFTER INSERT OR UPDATE OR DELETE ON students
+            FOR EACH ROW EXECUTE PROCEDURE notify_student_change();
+        """
+
+        # Columns added after the first release; CREATE TABLE IF NOT EXISTS leaves older tables untouched
+        migrate_consultations_delivery_sql = """
+        ALTER TABLE consultations ADD COLUMN IF NOT EXISTS delivered_at TIMESTAMPTZ;
+        ALTER TABLE consultations ADD COLUMN IF NOT EXISTS viewed_at TIMESTAMPTZ;
+        ALTER TABLE consultations ADD COLUMN IF NOT EXISTS delivery_attempts INTEGER NOT NULL DEFAULT 1;
         """
 
         try:
-            logging.info("Ensuring database tables exist...")
-            logging.info("Attempting to create/verify 'students' table...")
+            logger.info("Ensuring database tables exist...")
+            logger.info("Attempting to create/verify 'students' table...")
             self._execute_query(create_students_table_sql, commit=True)
-            logging.info("'students' table creation/verification attempt complete.")
+            logger.info("'students' table creation/verification attempt complete.")
+            try:
+                self._execute_query(create_students_notify_sql, commit=True)
+            except psycopg2.Error as e: # e.g. no permission to create functions; the snapshot then only refreshes periodically
+                logger.warning(f"Could not install the students change trigger: {e}")
 
             # Diagnostic: Check actual schema of students table
             inspect_students_sql = sql.SQL("""
@@ -127,32 +199,33 @@ class DatabaseService:
                 WHERE table_name = 'students' AND table_schema = 'public' ORDER BY ordinal_position;
             """)
             try:
-                logging.info("Querying actual schema of 'students' table from information_schema...")
+                logger.info("Querying actual schema of 'students' table from information_schema...")
                 students_columns = self._execute_query(inspect_students_sql, fetch_all=True)
                 if students_columns:
-                    logging.info("Actual columns found in 'students' table:")
+                    logger.info("Actual columns found in 'students' table:")
                     for col in students_columns:
-                        logging.info(f"  Column: {col['column_name']}, Type: {col['data_type']}")
+                        logger.info(f"  Column: {col['column_name']}, Type: {col['data_type']}")
                 else:
-                    logging.warning("Could not retrieve column information for 'students' table, or table does not exist after creation attempt.")
+                    logger.warning("Could not retrieve column information for 'students' table, or table does not exist after creation attempt.")
             except Exception as e_inspect:
-                logging.error(f"Error during diagnostic inspection of 'students' table schema: {e_inspect}")
+                logger.error(f"Error during diagnostic inspection of 'students' table schema: {e_inspect}")
 
-            logging.info("Attempting to create/verify 'faculty' table...")
+            logger.info("Attempting to create/verify 'faculty' table...")
             self._execute_query(create_faculty_table_sql, commit=True)
-            logging.info("'faculty' table creation/verification complete.")
+            logger.info("'faculty' table creation/verification complete.")
             
-            logging.info("Attempting to create/verify 'consultations' table...")
+            logger.info("Attempting to create/verify 'consultations' table...")
             self._execute_query(create_consultations_table_sql, commit=True)
-            logging.info("'consultations' table creation/verification complete.")
+            self._execute_query(migrate_consultations_delivery_sql, commit=True)
+            logger.info("'consultations' table creation/verification complete.")
             
-            logging.info("Database tables checked/created successfully.")
+            logger.info("Database tables checked/created successfully.")
             self._seed_initial_data()
         except psycopg2.Error as e:
-            logging.error(f"Error creating database tables: {e}")
+            logger.error(f"Error creating database tables: {e}")
             raise RuntimeError(f"Failed to create essential database tables: {e}")
         except Exception as e_main_ensure:
-            logging.error(f"Unexpected error in _ensure_tables_exist: {e_main_ensure}")
+            logger.error(f"Unexpected error in _ensure_tables_exist: {e_main_ensure}")
             raise
 
     def _seed_initial_data(self):
@@ -160,17 +233,17 @@ class DatabaseService:
         try:
             # Check if students table is empty
             # if not self.get_all_students():
-            #     logging.info("Students table is empty. Seeding initial student data...")
+            #     logger.info("Students table is empty. Seeding initial student data...")
             #     self.add_student(
             #         rfid_tag="SIM_STU_001",
             #         name="John Doe (Sample)",
             #         department="Computer Science"
             #     )
-            #     logging.info("Sample student added.")
+            #     logger.info("Sample student added.")
 
             # Check if faculty table is empty
             if not self.get_all_faculty(): # Assuming get_all_faculty returns a list
-                logging.info("Faculty table is empty. Seeding initial faculty data...")
+                logger.info("Faculty table is empty. Seeding initial faculty data...")
                 self.add_faculty(
                     name="Dr. Jane Smith (Sample)",
                     department="Software Engineering",
@@ -179,12 +252,12 @@ class DatabaseService:
                     contact_details="jane.smith@example.com",
                     current_status="Available"
                 )
-                logging.info("Sample faculty added.")
+                logger.info("Sample faculty added.")
             
-            logging.info("Initial data seeding check complete.")
+            logger.info("Initial data seeding check complete.")
 
         except Exception as e:
-            logging.error(f"Error during initial data seeding: {e}")
+            logger.error(f"Error during initial data seeding: {e}")
             # Depending on the severity, you might want to raise this or just log it
             # For now, just logging, as failure to seed might not be critical for app startup
 
@@ -198,15 +271,63 @@ class DatabaseService:
         """)
         try:
             now = datetime.now()
-            return self._execute_query(query, (rfid_tag, name, student_number, course, department, now), fetch_one=True, commit=True)
+            student = self._execute_query(query, (rfid_tag, name, student_number, course, department, now), fetch_one=True, commit=True)
+            if student:
+                self._note_tag_added(rfid_tag)
+            return student
         except psycopg2.IntegrityError as e:
-            logging.warning(f"Could not add student with RFID {rfid_tag}. It might already exist. Error: {e}")
+            logger.warning(f"Could not add student with RFID {rfid_tag}. It might already exist. Error: {e}")
             return None # Or re-raise a custom exception
 
     def get_student_by_rfid(self, rfid_tag: str):
-        """Retrieves a student by their RFID tag."""
+        """Retrieves a student by their RFID tag. Returns None for unknown tags, without a query if known_tags rules them out."""
+        known_tags = self.known_tags
+        if known_tags is not None:
+            if rfid_tag not in known_tags:
+                self.known_tag_stats["rejected"] += 1
+                return None
+            self.known_tag_stats["passed"] += 1
         query = sql.SQL("SELECT * FROM students WHERE rfid_tag = %s;")
-        return self._execute_query(query, (rfid_tag,), fetch_one=True)
+        student = self._execute_query(query, (rfid_tag,), fetch_one=True)
+        if student is None and known_tags is not None:
+            self.known_tag_stats["false_positives"] += 1
+        return student
+
+    def set_known_tag_filter(self, known_tags, built_from=None):
+        """Installs a filter of all registered tags, or removes it (None) so every lookup queries again.
+
+        `built_from` is the time.monotonic() at which the roster the filter was built from began to
+        be read; tags added through this service since then are added to it, as that read may have
+        missed them.
+        """
+        with self._known_tags_lock:
+            if known_tags is not None and built_from is not None:
+                for added_at, rfid_tag in self._tags_added:
+                    if added_at >= built_from:
+                        known_tags.add(rfid_tag)
+            self._tags_added = []
+            self.known_tags = known_tags
+
+    def _note_tag_added(self, rfid_tag):
+        with self._known_tags_lock:
+            if self.known_tags is not None:
+                self.known_tags.add(rfid_tag)
+            self._tags_added.append((time.monotonic(), rfid_tag))
+
+    def get_known_tag_stats(self):
+        """Counts of lookups the known-tag filter rejected and passed, with its expected and observed false-positive rates.
+
+        The observed rate is the share of unregistered tags the filter let through to the database.
+        """
+        stats = dict(self.known_tag_stats)
+        unknown = stats["rejected"] + stats["false_positives"]
+        stats["observed_false_positive_rate"] = stats["false_positives"] / unknown if unknown else None
+        known_tags = self.known_tags
+        stats["active"] = known_tags is not None
+        if known_tags is not None:
+            stats.update(tags=len(known_tags), capacity=known_tags.capacity, size_bytes=known_tags.size_bytes(),
+                         hashes=known_tags.num_hashes, expected_false_positive_rate=known_tags.false_positive_rate())
+        return stats
 
     def get_student_by_id(self, student_id: int):
         """Retrieves a student by their ID."""
@@ -218,6 +339,39 @@ class DatabaseService:
         query = sql.SQL("SELECT student_id, rfid_tag, name, student_number, course, department, created_at FROM students ORDER BY name;")
         return self._execute_query(query, fetch_all=True)
 
+    def get_students_page(self, limit: int, after=None):
+        """Returns up to `limit` students ordered by name, following `after` (the last row of the previous page).
+
+        Pages continue from the previous page's sort key rather than an OFFSET, so every page costs
+        the same index range scan however far into the table it is.
+        """
+        columns = "student_id, rfid_tag, name, student_number, course, department, created_at"
+        if after is None:
+            query = sql.SQL(f"SELECT {columns} FROM students ORDER BY name, student_id LIMIT %s;")
+            return self._execute_query(query, (limit,), fetch_all=True)
+        query = sql.SQL(f"SELECT {columns} FROM students WHERE (name, student_id) > (%s, %s) ORDER BY name, student_id LIMIT %s;")
+        return self._execute_query(query, (after['name'], after['student_id'], limit), fetch_all=True)
+
+    def get_roster(self, student_ids=None):
+        """Returns the fields the offline roster snapshot keeps, for all students or those in student_ids."""
+        columns = "student_id, rfid_tag, name, student_number, course, department"
+        if student_ids is None:
+            return self._execute_query(sql.SQL(f"SELECT {columns} FROM students;"), fetch_all=True)
+        query = sql.SQL(f"SELECT {columns} FROM students WHERE student_id = ANY(%s);")
+        return self._execute_query(query, (list(student_ids),), fetch_all=True)
+
+    def open_change_listener(self, channel=STUDENT_CHANGES_CHANNEL):
+        """Returns a dedicated autocommit connection LISTENing on `channel`; poll() it and read conn.notifies.
+
+        TCP keepalives make a silently dropped connection fail within about a minute, so the
+        caller notices and reconnects. The caller closes the connection.
+        """
+        conn = psycopg2.connect(**self.conn_params, keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3)
+        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("LISTEN {};").format(sql.Identifier(channel)))
+        return conn
+
     def update_student(self, student_id: int, rfid_tag: str, name: str, student_number: str = None, course: str = None, department: str = None):
         """Updates an existing student's details in the database."""
         query = sql.SQL("""
@@ -228,12 +382,15 @@ class DatabaseService:
         """)
         try:
             now = datetime.now()
-            return self._execute_query(query, (rfid_tag, name, student_number, course, department, now, student_id), fetch_one=True, commit=True)
+            student = self._execute_query(query, (rfid_tag, name, student_number, course, department, now, student_id), fetch_one=True, commit=True)
+            if student:
+                self._note_tag_added(rfid_tag)
+            return student
         except psycopg2.IntegrityError as e: # Catch issues like duplicate RFID tag on update
-            logging.error(f"Error updating student ID {student_id} due to integrity constraint: {e}")
+            logger.error(f"Error updating student ID {student_id} due to integrity constraint: {e}")
             return None
         except Exception as e:
-            logging.error(f"Error updating student ID {student_id}: {e}")
+            logger.error(f"Error updating student ID {student_id}: {e}")
             return None
 
     def delete_student(self, student_id: int):
@@ -244,13 +401,13 @@ class DatabaseService:
             self._execute_query(query, (student_id,), commit=True) # No RETURNING needed for simple delete
             # To confirm deletion, we could check if execute_query affected rows, but basic success is usually enough
             # For simplicity, if no exception, assume success.
-            logging.info(f"Student with ID {student_id} deleted successfully.")
+            logger.info(f"Student with ID {student_id} deleted successfully.")
             return True
         except psycopg2.Error as e: # Specific psycopg2 errors, e.g. foreign key if not cascaded
-            logging.error(f"Database error deleting student ID {student_id}: {e}")
+            logger.error(f"Database error deleting student ID {student_id}: {e}")
             return False
         except Exception as e:
-            logging.error(f"Unexpected error deleting student ID {student_id}: {e}")
+            logger.error(f"Unexpected error deleting student ID {student_id}: {e}")
             return False
 
     # --- Faculty Management (MVP: Add and Get) ---
@@ -267,7 +424,7 @@ class DatabaseService:
             now = datetime.now()
             return self._execute_query(query, (name, department, ble_identifier, office_location, contact_details, current_status, now, now), fetch_one=True, commit=True)
         except psycopg2.IntegrityError as e:
-            logging.warning(f"Could not add faculty {name} with BLE ID {ble_identifier}. It might already exist. Error: {e}")
+            logger.warning(f"Could not add faculty {name} with BLE ID {ble_identifier}. It might already exist. Error: {e}")
             return None
 
     def get_faculty_by_id(self, faculty_id: int):
@@ -301,6 +458,27 @@ class DatabaseService:
         query = sql.SQL(query_string)
         return self._execute_query(query, tuple(params) if params else None, fetch_all=True)
 
+    def get_faculty_page(self, limit: int, after=None):
+        """Returns up to `limit` faculty members ordered by name, following `after` (see get_students_page)."""
+        columns = ("faculty_id, name, department, ble_identifier, office_location, contact_details, "
+                   "current_status, status_updated_at")
+        if after is None:
+            query = sql.SQL(f"SELECT {columns} FROM faculty ORDER BY name, faculty_id LIMIT %s;")
+            return self._execute_query(query, (limit,), fetch_all=True)
+        query = sql.SQL(f"SELECT {columns} FROM faculty WHERE (name, faculty_id) > (%s, %s) ORDER BY name, faculty_id LIMIT %s;")
+        return self._execute_query(query, (after['name'], after['faculty_id'], limit), fetch_all=True)
+
+    def get_all_departments(self):
+        """Returns the faculty directory's departments with how many faculty each has, sorted by name."""
+        query = sql.SQL("""
+            SELECT department, COUNT(*) AS faculty_count
+            FROM faculty
+            WHERE department IS NOT NULL AND department <> ''
+            GROUP BY department
+            ORDER BY department;
+        """)
+        return self._execute_query(query, fetch_all=True)
+
     def update_faculty_details(self, faculty_id: int, name: str, department: str, 
                                ble_identifier: str, office_location: str = None, 
                                contact_details: str = None):
@@ -316,10 +494,10 @@ class DatabaseService:
             now = datetime.now()
             return self._execute_query(query, (name, department, ble_identifier, office_location, contact_details, now, faculty_id), fetch_one=True, commit=True)
         except psycopg2.IntegrityError as e: # Catch issues like duplicate BLE ID
-            logging.error(f"Error updating faculty ID {faculty_id} due to integrity constraint: {e}")
+            logger.error(f"Error updating faculty ID {faculty_id} due to integrity constraint: {e}")
             return None
         except Exception as e:
-            logging.error(f"Error updating faculty details for ID {faculty_id}: {e}")
+            logger.error(f"Error updating faculty details for ID {faculty_id}: {e}")
             return None
 
     def delete_faculty(self, faculty_id: int):
@@ -328,13 +506,13 @@ class DatabaseService:
         query = sql.SQL("DELETE FROM faculty WHERE faculty_id = %s;")
         try:
             self._execute_query(query, (faculty_id,), commit=True)
-            logging.info(f"Faculty with ID {faculty_id} deleted successfully.")
+            logger.info(f"Faculty with ID {faculty_id} deleted successfully.")
             return True
         except psycopg2.Error as e:
-            logging.error(f"Database error deleting faculty ID {faculty_id}: {e}")
+            logger.error(f"Database error deleting faculty ID {faculty_id}: {e}")
             return False
         except Exception as e:
-            logging.error(f"Unexpected error deleting faculty ID {faculty_id}: {e}")
+            logger.error(f"Unexpected error deleting faculty ID {faculty_id}: {e}")
             return False
 
     def update_faculty_status(self, faculty_id: int, new_status: str):
@@ -350,7 +528,7 @@ class DatabaseService:
             now = datetime.now()
             return self._execute_query(query, (new_status, now, now, faculty_id), fetch_one=True, commit=True)
         except Exception as e:
-            logging.error(f"Error updating faculty status for ID {faculty_id}: {e}")
+            logger.error(f"Error updating faculty status for ID {faculty_id}: {e}")
             return None
             
     def update_faculty_status_by_ble_id(self, ble_identifier: str, new_status: str):
@@ -365,14 +543,35 @@ class DatabaseService:
             now = datetime.now()
             updated_faculty = self._execute_query(query, (new_status, now, now, ble_identifier), fetch_one=True, commit=True)
             if updated_faculty:
-                logging.info(f"Status for faculty {updated_faculty.get('name')} (BLE: {ble_identifier}) updated to {new_status}")
+                logger.debug("Status for faculty %s (BLE: %s) updated to %s", updated_faculty.get('name'), ble_identifier, new_status)
             else:
-                logging.warning(f"No faculty found with BLE ID {ble_identifier} to update status.")
+                logger.warning(f"No faculty found with BLE ID {ble_identifier} to update status.")
             return updated_faculty
         except Exception as e:
-            logging.error(f"Error updating faculty status for BLE ID {ble_identifier}: {e}")
+            logger.error(f"Error updating faculty status for BLE ID {ble_identifier}: {e}")
             return None
 
+    def update_faculty_status_batch(self, status_updates):
+        """Updates the status of many faculty members, keyed by BLE identifier, in one statement.
+
+        status_updates is a list of (ble_identifier, new_status, observed_at) tuples.
+        Returns the updated rows; unknown BLE identifiers are simply absent from the result.
+        """
+        if not status_updates:
+            return []
+        query = """
+            UPDATE faculty AS f
+            SET current_status = v.new_status, status_updated_at = v.observed_at, updated_at = NOW()
+            FROM (VALUES %s) AS v(ble_identifier, new_status, observed_at)
+            WHERE f.ble_identifier = v.ble_identifier
+            RETURNING f.faculty_id, f.name, f.ble_identifier, f.current_status, f.status_updated_at;
+        """
+        updated_rows = self._execute_values_query(query, status_updates, template="(%s, %s, %s::timestamptz)", fetch_all=True)
+        unknown = len(status_updates) - len(updated_rows)
+        if unknown:
+            logger.warning(f"Batch status update: {unknown} of {len(status_updates)} BLE IDs did not match any faculty.")
+        return updated_rows
+
     # --- Consultation Management ---
     def add_consultation_request(self, student_id: int, faculty_id: int, course_code: str = None, 
                                subject: str = None, request_details: str = None):
@@ -386,7 +585,7 @@ class DatabaseService:
             now = datetime.now()
             return self._execute_query(query, (student_id, faculty_id, course_code, subject, request_details, now), fetch_one=True, commit=True)
         except psycopg2.Error as e:
-            logging.error(f"Error adding consultation request for student {student_id} to faculty {faculty_id}: {e}")
+            logger.error(f"Error adding consultation request for student {student_id} to faculty {faculty_id}: {e}")
             return None
 
     def get_consultations_for_faculty(self, faculty_id: int, status_filter: str = None):
@@ -409,6 +608,18 @@ class DatabaseService:
         query = sql.SQL(query_string)
         return self._execute_query(query, tuple(params), fetch_all=True)
 
+    def get_open_consultations_for_student(self, student_id: int):
+        """Retrieves a student's consultation requests that are still open, newest first, with faculty names."""
+        query = sql.SQL("""
+            SELECT c.consultation_id, c.faculty_id, f.name AS faculty_name, c.course_code, c.subject,
+                   c.status, c.requested_at
+            FROM consultations c
+            JOIN faculty f ON c.faculty_id = f.faculty_id
+            WHERE c.student_id = %s AND c.status = ANY(%s)
+            ORDER BY c.requested_at DESC;
+        """)
+        return self._execute_query(query, (student_id, list(OPEN_CONSULTATION_STATUSES)), fetch_all=True)
+
     def get_all_consultations_with_details(self):
         """Retrieves all consultation requests with student and faculty names."""
         query = sql.SQL("""
@@ -425,9 +636,30 @@ class DatabaseService:
         try:
             return self._execute_query(query, fetch_all=True)
         except Exception as e:
-            logging.error(f"Error retrieving all consultations with details: {e}")
+            logger.error(f"Error retrieving all consultations with details: {e}")
             return []
 
+    def get_consultations_page(self, limit: int, after=None):
+        """Returns up to `limit` consultations with student and faculty names, newest first, following `after` (see get_students_page)."""
+        query_string = """
+            SELECT 
+                c.consultation_id, c.student_id, s.name as student_name, 
+                c.faculty_id, f.name as faculty_name,
+                c.course_code, c.subject, c.request_details, c.status, 
+                c.requested_at, c.updated_at
+            FROM consultations c
+            JOIN students s ON c.student_id = s.student_id
+            JOIN faculty f ON c.faculty_id = f.faculty_id
+            {where}
+            ORDER BY c.requested_at DESC, c.consultation_id DESC
+            LIMIT %s;
+        """
+        if after is None:
+            query = sql.SQL(query_string.format(where=""))
+            return self._execute_query(query, (limit,), fetch_all=True)
+        query = sql.SQL(query_string.format(where="WHERE (c.requested_at, c.consultation_id) < (%s, %s)"))
+        return self._execute_query(query, (after['requested_at'], after['consultation_id'], limit), fetch_all=True)
+
     def update_consultation_status(self, consultation_id: int, new_status: str):
         """Updates the status of a consultation request."""
         query = sql.SQL("""
@@ -440,11 +672,56 @@ class DatabaseService:
             now = datetime.now()
             return self._execute_query(query, (new_status, now, consultation_id), fetch_one=True, commit=True)
         except Exception as e:
-            logging.error(f"Error updating consultation status for ID {consultation_id}: {e}")
+            logger.error(f"Error updating consultation status for ID {consultation_id}: {e}")
             return None
 
+    def record_consultation_acks(self, acks):
+        """Applies desk unit delivery acknowledgements in one statement.
+
+        acks is a list of (consultation_id, delivered_at, viewed_at) tuples with at most one entry
+        per consultation; either timestamp may be None. Status only moves forward
+        (Pending -> Delivered -> Viewed) and the first timestamp recorded is kept. Returns the
+        updated rows with the previous delivered_at/viewed_at, so callers can tell first acks apart,
+        or None when the update failed.
+        """
+        if not acks:
+            return []
+        query = """
+            UPDATE consultations AS c
+            SET status = CASE
+                    WHEN v.viewed_at IS NOT NULL AND c.status IN ('Pending', 'Delivered') THEN 'Viewed'
+                    WHEN c.status = 'Pending' THEN 'Delivered'
+                    ELSE c.status END,
+                delivered_at = COALESCE(c.delivered_at, v.delivered_at, v.viewed_at),
+                viewed_at = COALESCE(c.viewed_at, v.viewed_at),
+                updated_at = NOW()
+            FROM (VALUES %s) AS v(consultation_id, delivered_at, viewed_at), consultations AS old
+            WHERE c.consultation_id = v.consultation_id AND old.consultation_id = c.consultation_id
+            RETURNING c.consultation_id, c.status, c.requested_at, c.delivered_at, c.viewed_at,
+                      old.delivered_at AS previous_delivered_at, old.viewed_at AS previous_viewed_at;
+        """
+        try:
+            return self._execute_values_query(query, acks, template="(%s, %s::timestamptz, %s::timestamptz)", fetch_all=True)
+        except Exception as e:
+            logger.error(f"Error recording {len(acks)} consultation acknowledgements: {e}")
+            return None # Not [], so the caller requeues the acks
+
+    def increment_consultation_delivery_attempts(self, consultation_ids):
+        """Counts a redelivery for each consultation in consultation_ids."""
+        if not consultation_ids:
+            return
+        query = sql.SQL("""
+            UPDATE consultations SET delivery_attempts = delivery_attempts + 1, updated_at = NOW()
+            WHERE consultation_id = ANY(%s);
+        """)
+        try:
+            self._execute_query(query, (list(consultation_ids),), commit=True)
+        except Exception as e:
+            logger.error(f"Error counting redeliveries for consultations {consultation_ids}: {e}")
+
 # Example Usage (for testing this service directly)
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     # IMPORTANT: Ensure your PostgreSQL server is running and configured
     # with the DB_NAME, DB_USER, and DB_PASSWORD specified above.
     # The user DB_USER must have CREATETABLE privileges on DB_NAME for _ensure_tables_exist.
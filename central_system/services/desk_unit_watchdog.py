@@ -0,0 +1,83 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+from utils.timing_wheel import TimingWheel
+
+logger = logging.getLogger(__name__)
+
+OFFLINE_STATUS = "Offline"
+
+
+class DeskUnitWatchdog:
+    """Notices desk units that have gone silent, e.g. after losing power.
+
+    Every status message from a unit counts as a sign of life and pushes its deadline out to
+    `offline_after` seconds from now. All deadlines live in one TimingWheel, so there are no
+    per-unit timers or threads, and seen() and pop_silent() cost the same for 10 or 10,000 units.
+    pop_silent() returns the units whose deadline passed; each is reported once and armed again
+    by its next message. Does no I/O itself; the owning service writes the Offline status.
+    """
+
+    def __init__(self, offline_after=60.0, tick=1.0, slots=512, clock=time.monotonic):
+        self.offline_after = offline_after
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._wheel = TimingWheel(tick, slots, now=clock())
+        self._last_seen = {} # ble_id -> (clock time, wall time) of the last message
+        self._offline = set()
+        self.marked_offline = 0
+        self.came_back = 0
+
+    def seen(self, ble_id, now=None):
+        """Records a message from `ble_id`. Returns True when the unit was previously reported silent."""
+        now = self._clock() if now is None else now
+        with self._lock:
+            self._last_seen[ble_id] = (now, datetime.now())
+            self._wheel.schedule(ble_id, now + self.offline_after)
+            if ble_id in self._offline:
+                self._offline.discard(ble_id)
+                self.came_back += 1
+                return True
+            return False
+
+    def pop_silent(self, now=None):
+        """Returns [(ble_id, last_seen)] for units silent for `offline_after` seconds, last_seen as a datetime."""
+        now = self._clock() if now is None else now
+        with self._lock:
+            silent = []
+            for ble_id in self._wheel.advance(now):
+                silent.append((ble_id, self._last_seen[ble_id][1]))
+                self._offline.add(ble_id)
+            self.marked_offline += len(silent)
+            return silent
+
+    def restart_deadlines(self, now=None):
+        """Gives every unit not already reported silent a full window again, e.g. after the central
+        system itself was disconnected from the broker and could not have heard anything."""
+        now = self._clock() if now is None else now
+        with self._lock:
+            for ble_id in self._last_seen:
+                if ble_id not in self._offline:
+                    self._wheel.schedule(ble_id, now + self.offline_after)
+
+    def next_due(self):
+        """Earliest clock time pop_silent() may return something, or None."""
+        with self._lock:
+            return self._wheel.next_tick_time()
+
+    def get_last_seen(self, ble_id):
+        """Wall time of the last message from `ble_id`, or None if it has not been heard from."""
+        with self._lock:
+            entry = self._last_seen.get(ble_id)
+            return entry[1] if entry else None
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "tracked": len(self._last_seen),
+                "offline": len(self._offline),
+                "marked_offline": self.marked_offline,
+                "came_back": self.came_back,
+            }
@@ -1,62 +1,331 @@
 import paho.mqtt.client as mqtt
 import logging
 import json
+import os
+import re
 import time
 import threading
+import collections
+import zlib
+from datetime import datetime
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from utils.backoff import ExponentialBackoff
+from services.mqtt_spool import OutboundSpool
+from services.presence_debouncer import PresenceDebouncer
+from services.consultation_delivery import ConsultationDeliveryTracker, parse_ack_payload
+from services.desk_unit_watchdog import DeskUnitWatchdog, OFFLINE_STATUS
+from services.status_warmup import RetainedStatusWarmup
+
+logger = logging.getLogger(__name__)
 
 # --- Configuration ---
 MQTT_BROKER_HOST = "localhost" # Assuming Mosquitto is running on the same RPi
 MQTT_BROKER_PORT = 1883
 MQTT_KEEPALIVE = 60
 
+# --- Connection Supervisor ---
+MQTT_RECONNECT_MIN_DELAY = 0.5  # seconds; first retry after a broker restart happens quickly
+MQTT_RECONNECT_MAX_DELAY = 30.0 # seconds; cap for the jittered exponential backoff
+# Upper bound for how long the network loop blocks in select() while nothing is happening.
+# Incoming packets, publishes from other threads and stop() all wake it immediately.
+MQTT_LOOP_IDLE_TIMEOUT = MQTT_KEEPALIVE / 4
+
+# --- Outbound Spool ---
+# QoS 1+ publishes are written here first and removed once the broker acknowledges them,
+# so consultation notifications survive broker restarts and central system restarts.
+MQTT_SPOOL_PATH = os.path.join(os.path.expanduser("~"), ".consultease", "mqtt_spool.sqlite3")
+MQTT_SPOOL_MAX_INFLIGHT = 10 # Unacknowledged QoS 1 publishes allowed at once while replaying a backlog
+
+# --- Consultation Delivery Acknowledgements ---
+CONSULTATION_ACK_DEADLINE = 30.0          # seconds without an ack before a request is published again
+CONSULTATION_MAX_DELIVERY_ATTEMPTS = 5
+CONSULTATION_ACK_BATCH_MAX = 50           # acks applied to the DB in one statement
+CONSULTATION_ACK_FLUSH_INTERVAL = 0.5     # seconds an ack may wait for others to share its DB round trip
+
+# --- Desk Unit Liveness ---
+# Desk units publish their status at least every ~6s; a unit silent for this long is marked Offline
+DESK_UNIT_OFFLINE_AFTER = 60.0
+DESK_UNIT_WATCHDOG_TICK = 1.0    # seconds; resolution of the staleness sweep
+DESK_UNIT_WATCHDOG_SLOTS = 512   # timing wheel slots; one revolution (tick * slots) should exceed OFFLINE_AFTER
+
+# --- Retained Status Warm-up ---
+# After subscribing, the broker replays every desk unit's retained status at once. These are collected
+# and written as one batched update; live status messages wait until the warm-up ends (0 disables it)
+STATUS_WARMUP_WINDOW = 2.0  # seconds after subscribing at most
+STATUS_WARMUP_QUIET = 0.25  # seconds without a retained message that end the warm-up early
+
 # Topic for faculty status updates (ESP32s will publish here)
 # Using a wildcard for faculty_id for subscription
 FACULTY_STATUS_TOPIC_TEMPLATE = "consultease/faculty/{}/status"
 FACULTY_STATUS_TOPIC_WILDCARD = "consultease/faculty/+/status"
 
+# Topic for gateway-aggregated status reports (corridor BLE gateways will publish here)
+# One message carries many beacon sightings, either as a JSON list or as {"entries": [...]}
+# where each entry looks like {"ble_id": "...", "status": "Available", "rssi": -61, "ts": 1700000000}
+FACULTY_BULK_STATUS_TOPIC_TEMPLATE = "consultease/gateway/{}/status"
+FACULTY_BULK_STATUS_TOPIC_WILDCARD = "consultease/gateway/+/status"
+
 # Topic for consultation requests (Central system will publish here)
 CONSULTATION_REQUEST_TOPIC_TEMPLATE = "consultease/faculty/{}/requests"
 
+# Topics for announcements. Every desk unit subscribes to the broadcast topic and to its department's
+# topic, so one publish reaches all of them and the broker does the fan-out
+ANNOUNCEMENT_BROADCAST_TOPIC = "consultease/announcements/all"
+ANNOUNCEMENT_DEPARTMENT_TOPIC_TEMPLATE = "consultease/announcements/department/{}"
+
+# Topic for delivery acknowledgements (ESP32s publish {"consultation_id": 42, "event": "delivered" | "viewed"})
+FACULTY_ACK_TOPIC_TEMPLATE = "consultease/faculty/{}/ack"
+FACULTY_ACK_TOPIC_WILDCARD = "consultease/faculty/+/ack"
+
+# --- Scaled-out Status Ingestion ---
+# Headless consumers (status_consumer.py) share the status topics through an MQTT v5 shared
+# subscription, so the broker hands each message to one member of the group
+STATUS_CONSUMER_GROUP = "consultease-status"
+
+def shared_subscription(group, topic_filter):
+    return f"$share/{group}/{topic_filter}"
+
+def status_partition(ble_identifier, partition_count):
+    """Stable partition index for a BLE identifier; the same hash as topic-hash affinity brokers use."""
+    return zlib.crc32(ble_identifier.encode('utf-8')) % partition_count
+
+def department_topic_id(department):
+    """Topic level for a department name, e.g. "Computer Science" -> "computer-science".
+
+    Lowercase, with every run of other characters replaced by '-'; the desk unit firmware derives
+    its subscription from FACULTY_DEPARTMENT the same way.
+    """
+    return re.sub(r'[^a-z0-9]+', '-', department.lower()).strip('-')
+
+def build_announcements(title, message, departments=None, directory=None):
+    """Resolves an announcement's audience into [(topic, payload)], one per topic.
+
+    departments=None addresses every desk unit. Otherwise each department must appear in
+    `directory` (rows from DatabaseService.get_all_departments(); None skips the check) and maps to
+    one department topic. Unknown departments are logged and skipped rather than reaching nobody.
+    """
+    payload = {"title": title, "message": message, "sent_at": datetime.now().isoformat()}
+    if not departments:
+        return [(ANNOUNCEMENT_BROADCAST_TOPIC, dict(payload, scope="all"))]
+    known = {row["department"]: row.get("faculty_count") for row in directory} if directory is not None else None
+    announcements = {}
+    for department in departments:
+        if known is not None and department not in known:
+            logger.warning(f"MQTTService: Announcement department '{department}' is not in the faculty directory; skipped.")
+            continue
+        topic = ANNOUNCEMENT_DEPARTMENT_TOPIC_TEMPLATE.format(department_topic_id(department))
+        announcements.setdefault(topic, dict(payload, scope="department", department=department))
+    return list(announcements.items())
+
+def normalize_status(raw_status):
+    """Maps the status spellings used by desk units and gateways onto the DB values."""
+    if not isinstance(raw_status, str):
+        return None
+    value = raw_status.strip().lower()
+    if value in ["available", "present"]:
+        return "Available"
+    if value in ["unavailable", "absent"]:
+        return "Unavailable"
+    return None
+
+def parse_status_payload(payload_str):
+    """Parses a desk unit status payload: plain text ("Available") or JSON ({"status": "Available"}).
+
+    Returns the status to store, "" for JSON without a status, or None for an unrecognised plain-text value.
+    """
+    try:
+        data = json.loads(payload_str)
+    except json.JSONDecodeError:
+        data = None
+    if isinstance(data, dict):
+        return data.get("status") or ""
+    # Assume plain text if the payload is not a JSON object
+    return normalize_status(payload_str)
+
+def parse_bulk_status_payload(payload_str):
+    """Parses a gateway bulk status payload into {ble_id: (status, observed_at)}.
+
+    When a beacon appears more than once in the same report, the newest entry wins.
+    Malformed entries are skipped rather than failing the whole batch.
+    """
+    data = json.loads(payload_str)
+    entries = data.get("entries", []) if isinstance(data, dict) else data
+    if not isinstance(entries, list):
+        raise ValueError("bulk status payload must be a list or contain an 'entries' list")
+
+    latest = {}
+    skipped = 0
+    for entry in entries:
+        if not isinstance(entry, dict):
+            skipped += 1
+            continue
+        ble_id = entry.get("ble_id")
+        status = normalize_status(entry.get("status"))
+        if not ble_id or not status:
+            skipped += 1
+            continue
+        ts = entry.get("ts")
+        try:
+            observed_at = datetime.fromtimestamp(float(ts)) if ts is not None else datetime.now()
+        except (TypeError, ValueError, OverflowError, OSError):
+            observed_at = datetime.now()
+        previous = latest.get(ble_id)
+        if previous is None or observed_at >= previous[1]:
+            latest[ble_id] = (status, observed_at)
+    return latest, skipped
+
 class MQTTService(threading.Thread):
-    def __init__(self, db_service, client_id="ConsultEase_CentralSystem"):
+    def __init__(self, db_service, client_id="ConsultEase_CentralSystem", spool_path=MQTT_SPOOL_PATH,
+                 broker_host=MQTT_BROKER_HOST, broker_port=MQTT_BROKER_PORT, presence_debouncer=None,
+                 ingest_status=True, handle_acks=True, shared_group=None, partition=None):
+        """
+        ingest_status: subscribe to desk unit and gateway status topics. The kiosk turns this off
+            when headless status consumers (status_consumer.py) do the ingestion instead.
+        handle_acks: subscribe to consultation acks; only the instance that publishes requests needs them.
+        shared_group: subscribe to the status topics as a member of this MQTT v5 shared subscription
+            group (connects with MQTT v5). Per-device ordering needs a broker that assigns members by
+            topic hash (EMQX: shared_subscription_strategy = hash_topic).
+        partition: (index, count) to only process BLE identifiers with status_partition() == index,
+            from a regular subscription. Keeps per-device ordering on any broker.
+        """
         super().__init__(daemon=True)
-        self.client = mqtt.Client(client_id=client_id)
+        self.shared_group = shared_group
+        self.partition = partition
+        # Only the instance that ingests status owns the faculty status column, Offline included
+        self.ingest_status = ingest_status
+        protocol = mqtt.MQTTv5 if shared_group else mqtt.MQTTv311
+        self.client = mqtt.Client(client_id=client_id, protocol=protocol)
         self.db_service = db_service # To update faculty status in DB
+        self.broker_host = broker_host # e.g. tools.inproc_broker.InProcessBroker for tests and benchmarks
+        self.broker_port = broker_port
+        # Presence hysteresis in front of every status write (see services/presence_debouncer.py)
+        self.presence_debouncer = presence_debouncer or PresenceDebouncer()
+        self.delivery_tracker = ConsultationDeliveryTracker(
+            CONSULTATION_ACK_DEADLINE, CONSULTATION_MAX_DELIVERY_ATTEMPTS,
+            CONSULTATION_ACK_BATCH_MAX, CONSULTATION_ACK_FLUSH_INTERVAL)
+        self.desk_unit_watchdog = DeskUnitWatchdog(DESK_UNIT_OFFLINE_AFTER, DESK_UNIT_WATCHDOG_TICK, DESK_UNIT_WATCHDOG_SLOTS)
+        # Brokers do not send retained messages to shared subscriptions, so those have nothing to warm up
+        self.status_warmup = RetainedStatusWarmup(STATUS_WARMUP_WINDOW if ingest_status and not shared_group else 0,
+                                                  STATUS_WARMUP_QUIET)
         self._is_connected = False
         self._stop_event = threading.Event()
 
+        # Outbound spool (spool_path=None disables it: QoS 1 publishes then fail while disconnected)
+        self._spool = OutboundSpool(spool_path) if spool_path else None
+        self._spool_lock = threading.Lock()
+        self._spool_cursor = 0         # Highest spool seq handed to paho so far
+        self._spool_inflight = {}      # paho mid -> spool seq, awaiting PUBACK
+        self._spool_acked_mids = collections.deque() # Filled by _on_publish, drained on the network thread
+
+        # Subscriptions are (re)sent on every successful connect, since the session is clean
+        self._subscriptions = []
+        if ingest_status:
+            for topic_filter in (FACULTY_STATUS_TOPIC_WILDCARD, FACULTY_BULK_STATUS_TOPIC_WILDCARD):
+                self._subscriptions.append((shared_subscription(shared_group, topic_filter) if shared_group else topic_filter, 0))
+        if handle_acks:
+            self._subscriptions.append((FACULTY_ACK_TOPIC_WILDCARD, 0))
+
+        # Connection supervisor state
+        self._backoff = ExponentialBackoff(MQTT_RECONNECT_MIN_DELAY, MQTT_RECONNECT_MAX_DELAY)
+        self._stats_lock = threading.Lock()
+        self._connected_since = None     # monotonic time of the current session's CONNACK
+        self._disconnected_since = None  # monotonic time the last session was lost
+        self._total_uptime = 0.0
+        self._connect_count = 0
+        self._reconnect_count = 0
+        self._last_time_to_reconnect = None
+        self._max_time_to_reconnect = None
+
         # Assign callbacks
         self.client.on_connect = self._on_connect
         self.client.on_disconnect = self._on_disconnect
         self.client.on_message = self._on_message
+        self.client.on_subscribe = self._on_subscribe
         self.client.on_publish = self._on_publish # Optional: for confirming publishes
         self.client.on_log = self._on_log # Optional: for detailed MQTT logging
 
-    def _on_connect(self, client, userdata, flags, rc):
+    def _on_connect(self, client, userdata, flags, rc, properties=None): # properties: MQTT v5 only
         if rc == 0:
-            logging.info(f"MQTTService: Connected successfully to broker {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT}")
+            logger.info(f"MQTTService: Connected successfully to broker {self.broker_host}:{self.broker_port}")
             self._is_connected = True
-            # Subscribe to topics upon successful connection
-            client.subscribe(FACULTY_STATUS_TOPIC_WILDCARD)
-            logging.info(f"MQTTService: Subscribed to {FACULTY_STATUS_TOPIC_WILDCARD}")
-            # Add other subscriptions if needed
+            self._backoff.reset()
+            self._record_connected()
+            self.delivery_tracker.restart_deadlines() # Time spent disconnected does not count against desk units
+            self.desk_unit_watchdog.restart_deadlines()
+            # Subscribe to all topics in a single SUBSCRIBE packet (also restores them after a reconnect)
+            if self._subscriptions:
+                self.status_warmup.start()
+                client.subscribe(self._subscriptions)
+            logger.info(f"MQTTService: Subscribed to {[topic for topic, _ in self._subscriptions]}")
         else:
-            logging.error(f"MQTTService: Connection failed with code {rc}. Check broker and network.")
+            logger.error(f"MQTTService: Connection failed with code {rc}. Check broker and network.")
             self._is_connected = False
 
-    def _on_disconnect(self, client, userdata, rc):
-        logging.warning(f"MQTTService: Disconnected from MQTT broker with result code {rc}. Will attempt to reconnect.")
+    def _on_subscribe(self, client, userdata, mid, granted_qos, properties=None):
+        self.status_warmup.subscribed() # Retained messages follow the SUBACK
+
+    def _on_disconnect(self, client, userdata, rc, properties=None):
+        if not self._is_connected and self._stop_event.is_set():
+            return # Already handled; paho reports a requested disconnect more than once
+        if self._stop_event.is_set():
+            logger.info(f"MQTTService: Disconnected from MQTT broker (rc {rc}).")
+        else:
+            logger.warning(f"MQTTService: Disconnected from MQTT broker with result code {rc}. Will attempt to reconnect.")
         self._is_connected = False
-        # Reconnection logic is handled by the loop method or an external monitor
+        self._record_disconnected()
+        # Reconnection is driven by the supervisor loop in run()
+
+    def _record_connected(self):
+        now = time.monotonic()
+        with self._stats_lock:
+            self._connected_since = now
+            self._connect_count += 1
+            if self._disconnected_since is not None:
+                self._reconnect_count += 1
+                self._last_time_to_reconnect = now - self._disconnected_since
+                self._max_time_to_reconnect = max(self._max_time_to_reconnect or 0.0, self._last_time_to_reconnect)
+                logger.info(f"MQTTService: Reconnected after {self._last_time_to_reconnect:.2f}s (reconnect #{self._reconnect_count}).")
+                self._disconnected_since = None
+
+    def _record_disconnected(self):
+        now = time.monotonic()
+        with self._stats_lock:
+            if self._connected_since is not None:
+                self._total_uptime += now - self._connected_since
+                self._connected_since = None
+                self._disconnected_since = now
+
+    def get_connection_stats(self):
+        """Returns a snapshot of connection health: uptime, reconnect counts and time-to-reconnect."""
+        now = time.monotonic()
+        with self._stats_lock:
+            session_uptime = now - self._connected_since if self._connected_since is not None else 0.0
+            return {
+                "connected": self._is_connected,
+                "session_uptime_s": session_uptime,
+                "total_uptime_s": self._total_uptime + session_uptime,
+                "connect_count": self._connect_count,
+                "reconnect_count": self._reconnect_count,
+                "last_time_to_reconnect_s": self._last_time_to_reconnect,
+                "max_time_to_reconnect_s": self._max_time_to_reconnect,
+                "disconnected_for_s": now - self._disconnected_since if self._disconnected_since is not None else None,
+            }
 
     def _on_message(self, client, userdata, msg):
         topic = msg.topic
         payload_str = msg.payload.decode('utf-8')
-        logging.info(f"MQTTService: Message received on topic '{topic}': {payload_str}")
+        logger.debug("MQTTService: Message received on topic '%s': %s", topic, payload_str)
 
+        if self.status_warmup.active and topic.endswith("/status"):
+            topic_parts = topic.split('/')
+            if msg.retain and len(topic_parts) == 4 and topic_parts[:2] == ["consultease", "faculty"]:
+                self._collect_retained_status(topic_parts[2], payload_str)
+            else:
+                self.status_warmup.defer((topic, payload_str)) # Applied after the retained statuses
+            return
+        self._handle_message(topic, payload_str)
+
+    def _handle_message(self, topic, payload_str):
         if topic.startswith("consultease/faculty/") and topic.endswith("/status"):
             try:
                 # Extract faculty BLE identifier or ID from topic if needed, or expect it in payload
@@ -65,134 +334,425 @@ class MQTTService(threading.Thread):
                 topic_parts = topic.split('/')
                 if len(topic_parts) == 4 and topic_parts[0] == "consultease" and topic_parts[1] == "faculty" and topic_parts[3] == "status":
                     ble_identifier = topic_parts[2]
-                    # Payload could be simple string "Available"/"Unavailable" or JSON
-                    # For MVP, let's assume simple string or simple JSON like {"status": "Available"}
-                    status_data = payload_str
-                    new_status = ""
-                    try:
-                        data = json.loads(payload_str)
-                        new_status = data.get("status")
-                    except json.JSONDecodeError:
-                        # Assume plain text if JSON parsing fails
-                        if payload_str.lower() in ["available", "present"]:
-                            new_status = "Available"
-                        elif payload_str.lower() in ["unavailable", "absent"]:
-                            new_status = "Unavailable"
-                        else:
-                            logging.warning(f"MQTTService: Unknown status format/value '{payload_str}' from {ble_identifier}")
-                            return
+                    if not self._owns(ble_identifier):
+                        return # Another consumer's partition
+                    self.desk_unit_watchdog.seen(ble_identifier) # Any status message, repeats included, is a sign of life
+                    new_status = parse_status_payload(payload_str)
+                    if new_status is None:
+                        logger.warning(f"MQTTService: Unknown status format/value '{payload_str}' from {ble_identifier}")
+                        return
+                    if new_status and not self.presence_debouncer.observe(ble_identifier, new_status):
+                        logger.debug("MQTTService: Status '%s' from %s held back by presence debouncing.", new_status, ble_identifier)
+                        return
 
                     if new_status and self.db_service:
-                        logging.info(f"MQTTService: Updating status for faculty (BLE: {ble_identifier}) to '{new_status}'")
-                        updated_faculty = self.db_service.update_faculty_status_by_ble_id(ble_identifier, new_status)
+                        logger.debug("MQTTService: Updating status for faculty (BLE: %s) to '%s'", ble_identifier, new_status)
+                        try:
+                            updated_faculty = self.db_service.update_faculty_status_by_ble_id(ble_identifier, new_status)
+                        except Exception:
+                            self.presence_debouncer.reject(ble_identifier, new_status)
+                            raise
                         if updated_faculty:
-                            logging.info(f"MQTTService: DB status updated for {updated_faculty.get('name')}.")
+                            logger.debug("MQTTService: DB status updated for %s.", updated_faculty.get('name'))
                             # Here you could emit a signal if UI needs live update beyond DB polling
                         else:
-                            logging.warning(f"MQTTService: Failed to update status in DB for BLE {ble_identifier}.")
+                            # Not written, so the unit's next report must not be suppressed as a repeat
+                            self.presence_debouncer.reject(ble_identifier, new_status)
+                            logger.warning(f"MQTTService: Failed to update status in DB for BLE {ble_identifier}.")
                     elif not new_status:
-                        logging.warning(f"MQTTService: Parsed empty status from payload: {payload_str}")
+                        logger.warning(f"MQTTService: Parsed empty status from payload: {payload_str}")
                 else:
-                    logging.warning(f"MQTTService: Received status message on unexpected topic structure: {topic}")
+                    logger.warning(f"MQTTService: Received status message on unexpected topic structure: {topic}")
 
             except Exception as e:
-                logging.error(f"MQTTService: Error processing faculty status message: {e}")
+                logger.error(f"MQTTService: Error processing faculty status message: {e}")
+        elif topic.startswith("consultease/gateway/") and topic.endswith("/status"):
+            topic_parts = topic.split('/')
+            if len(topic_parts) == 4:
+                self._handle_bulk_status(topic_parts[2], payload_str)
+            else:
+                logger.warning(f"MQTTService: Received bulk status message on unexpected topic structure: {topic}")
+        elif topic.startswith("consultease/faculty/") and topic.endswith("/ack"):
+            self._handle_ack(topic, payload_str)
+        else:
+            logger.warning(f"MQTTService: Received message on unhandled topic: {topic}")
+
+    def _collect_retained_status(self, ble_identifier, payload_str):
+        """Adds a retained desk unit status to the warm-up batch instead of writing it on its own."""
+        if not self._owns(ble_identifier):
+            return
+        self.desk_unit_watchdog.seen(ble_identifier) # Arms the deadline, so a unit that is gone is marked Offline
+        new_status = parse_status_payload(payload_str)
+        if not new_status:
+            logger.warning(f"MQTTService: Ignoring retained status '{payload_str}' from {ble_identifier}")
+            self.status_warmup.retained_seen()
+        elif self.presence_debouncer.observe(ble_identifier, new_status):
+            self.status_warmup.add(ble_identifier, new_status)
         else:
-            logging.warning(f"MQTTService: Received message on unhandled topic: {topic}")
+            self.status_warmup.retained_seen() # Usually a repeat after a reconnect
+
+    def _finish_status_warmup(self):
+        """Writes the retained statuses as one batched update, then replays the deferred live messages."""
+        if not self.status_warmup.due():
+            return
+        batch = self.status_warmup.take_batch()
+        if batch and self.db_service:
+            observed_at = datetime.now()
+            updated_rows = None
+            try:
+                updated_rows = self.db_service.update_faculty_status_batch([(ble_id, status, observed_at) for ble_id, status in batch])
+                logger.info(f"MQTTService: Warm-up applied {len(updated_rows)}/{len(batch)} retained status(es) in one batch.")
+            except Exception as e:
+                logger.error(f"MQTTService: Error applying retained statuses: {e}")
+            self.presence_debouncer.reject_unwritten(batch, updated_rows)
+        while True:
+            for topic, payload_str in self.status_warmup.take_deferred():
+                self._handle_message(topic, payload_str)
+            if self.status_warmup.finish():
+                break
+
+    def get_warmup_stats(self):
+        return self.status_warmup.get_stats()
+
+    def _handle_bulk_status(self, gateway_id, payload_str):
+        """Applies a gateway bulk status report to the DB as a single batched statement."""
+        try:
+            latest, skipped = parse_bulk_status_payload(payload_str)
+        except (ValueError, AttributeError) as e: # json.JSONDecodeError is a ValueError
+            logger.warning(f"MQTTService: Malformed bulk status payload from gateway {gateway_id}: {e}")
+            return
+        if skipped:
+            logger.warning(f"MQTTService: Skipped {skipped} malformed entries in bulk status from gateway {gateway_id}.")
+        if not latest or not self.db_service:
+            return
+
+        status_updates = [(ble_id, status, observed_at) for ble_id, (status, observed_at) in latest.items()
+                          if self._owns(ble_id) and self.presence_debouncer.observe(ble_id, status)]
+        if not status_updates:
+            return
+        updated_rows = None
+        try:
+            updated_rows = self.db_service.update_faculty_status_batch(status_updates)
+            logger.info(f"MQTTService: Bulk status from gateway {gateway_id}: {len(updated_rows)}/{len(status_updates)} faculty rows updated.")
+        except Exception as e:
+            logger.error(f"MQTTService: Error applying bulk status from gateway {gateway_id}: {e}")
+        self.presence_debouncer.reject_unwritten(status_updates, updated_rows)
+
+    def _owns(self, ble_identifier):
+        return self.partition is None or status_partition(ble_identifier, self.partition[1]) == self.partition[0]
+
+    def _handle_ack(self, topic, payload_str):
+        if self.ingest_status:
+            self.desk_unit_watchdog.seen(topic.split('/')[2])
+        try:
+            consultation_id, event = parse_ack_payload(payload_str)
+        except ValueError as e: # json.JSONDecodeError is a ValueError
+            logger.warning(f"MQTTService: Malformed ack on '{topic}': {e}")
+            return
+        self.delivery_tracker.record_ack(consultation_id, event)
+
+    def _flush_acks(self, force=False):
+        """Applies collected delivery acks to the DB as one batched statement."""
+        if not (force or self.delivery_tracker.ack_batch_due()):
+            return
+        batch = self.delivery_tracker.take_ack_batch()
+        if not batch or not self.db_service:
+            return
+        rows = None
+        try:
+            rows = self.db_service.record_consultation_acks(batch)
+        finally:
+            if rows is None:
+                self.delivery_tracker.requeue_acks(batch)
+        if rows is None:
+            logger.warning(f"MQTTService: Could not apply {len(batch)} consultation ack(s); retrying with the next batch.")
+            return
+        self.delivery_tracker.record_ack_results(rows)
+        logger.info(f"MQTTService: Applied {len(batch)} consultation ack(s) ({len(rows or [])} rows updated).")
+
+    def _redeliver_unacknowledged(self):
+        """Publishes requests again whose desk unit has not acknowledged them within the deadline."""
+        if not self._is_connected:
+            return
+        redeliveries = self.delivery_tracker.take_redeliveries()
+        for consultation_id, topic, payload in redeliveries:
+            logger.warning(f"MQTTService: No ack for consultation {consultation_id}; redelivering to '{topic}'.")
+            self.publish_message(topic, payload, qos=1)
+        if redeliveries and self.db_service:
+            self.db_service.increment_consultation_delivery_attempts([consultation_id for consultation_id, _, _ in redeliveries])
+
+    def get_delivery_stats(self):
+        """Outstanding requests, redeliveries and submit -> delivered/viewed latency percentiles."""
+        return self.delivery_tracker.get_stats()
+
+    def _apply_due_presence(self):
+        """Writes debounced transitions whose dwell time has passed, as one batched update."""
+        released = self.presence_debouncer.pop_due()
+        if not released or not self.db_service:
+            return
+        observed_at = datetime.now()
+        updated_rows = None
+        try:
+            updated_rows = self.db_service.update_faculty_status_batch([(ble_id, status, observed_at) for ble_id, status in released])
+            logger.info(f"MQTTService: Applied {len(updated_rows)} debounced status transition(s).")
+        except Exception as e:
+            logger.error(f"MQTTService: Error applying debounced status transitions: {e}")
+        self.presence_debouncer.reject_unwritten(released, updated_rows)
+
+    def _mark_silent_units_offline(self):
+        """Writes Offline for desk units whose silence window has passed, as one batched update."""
+        if not self.ingest_status or not self._is_connected:
+            return # Silence is ours, not the units'; deadlines restart on reconnect
+        silent = self.desk_unit_watchdog.pop_silent()
+        if not silent:
+            return
+        for ble_id, _ in silent:
+            # The next report from the unit is then a transition out of Offline rather than a repeat
+            self.presence_debouncer.force(ble_id, OFFLINE_STATUS)
+        if not self.db_service:
+            return
+        offline_updates = [(ble_id, OFFLINE_STATUS, last_seen) for ble_id, last_seen in silent]
+        updated_rows = None
+        try:
+            # status_updated_at records when the unit was last heard from
+            updated_rows = self.db_service.update_faculty_status_batch(offline_updates)
+            logger.warning(f"MQTTService: Marked {len(updated_rows)} silent desk unit(s) Offline: {[ble_id for ble_id, _ in silent]}")
+        except Exception as e:
+            logger.error(f"MQTTService: Error marking silent desk units Offline: {e}")
+        self.presence_debouncer.reject_unwritten(offline_updates, updated_rows)
+
+    def get_desk_unit_last_seen(self, ble_identifier):
+        """When the desk unit last published anything (a datetime), or None if not heard from since startup."""
+        return self.desk_unit_watchdog.get_last_seen(ble_identifier)
+
+    def get_watchdog_stats(self):
+        return self.desk_unit_watchdog.get_stats()
+
+    def _loop_timeout(self):
+        # Wake up in time for the end of the warm-up, the next debounced transition, ack batch, redelivery
+        # or staleness sweep, otherwise idle until traffic arrives
+        watchdog_due = self.desk_unit_watchdog.next_due() if self.ingest_status else None
+        due_times = [due for due in (self.presence_debouncer.next_due(), self.delivery_tracker.next_due(),
+                                     watchdog_due, self.status_warmup.next_due()) if due is not None]
+        if not due_times:
+            return MQTT_LOOP_IDLE_TIMEOUT
+        return min(MQTT_LOOP_IDLE_TIMEOUT, max(min(due_times) - time.monotonic(), 0.0))
+
+    def _run_maintenance(self):
+        """Deferred work done on the network thread after every loop iteration."""
+        self._service_spool()
+        self._finish_status_warmup()
+        self._apply_due_presence()
+        self._mark_silent_units_offline()
+        try:
+            self._flush_acks()
+            self._redeliver_unacknowledged()
+        except Exception as e:
+            logger.error(f"MQTTService: Error processing consultation acknowledgements: {e}")
+
+    def get_presence_stats(self):
+        """Counts of status reports written, suppressed repeats and suppressed flapping transitions."""
+        return self.presence_debouncer.get_stats()
 
     def _on_publish(self, client, userdata, mid):
-        logging.debug(f"MQTTService: Message Published (mid: {mid})")
+        logger.debug("MQTTService: Message Published (mid: %s)", mid)
+        # Called with paho's internal locks held, so only record the ack here;
+        # _service_spool() applies it after the network loop returns.
+        self._spool_acked_mids.append(mid)
 
     def _on_log(self, client, userdata, level, buf):
         # Be cautious with log level, MQTT can be very verbose
         if level <= mqtt.MQTT_LOG_WARNING: # Log warnings and errors from Paho client
-            logging.log(logging.INFO if level == mqtt.MQTT_LOG_INFO else logging.WARNING if level == mqtt.MQTT_LOG_WARNING else logging.DEBUG, f"PAHO-MQTT: {buf}")
+            logger.log(logging.INFO if level == mqtt.MQTT_LOG_INFO else logging.WARNING if level == mqtt.MQTT_LOG_WARNING else logging.DEBUG, "PAHO-MQTT: %s", buf)
 
     def publish_message(self, topic, payload, qos=1, retain=False):
+        """Publishes a message.
+
+        QoS 1+ messages go through the outbound spool: they are accepted (True) even while
+        disconnected and delivered in order once the broker is reachable. QoS 0 messages are
+        sent directly and dropped (False) when disconnected.
+        """
+        if not isinstance(payload, str):
+            payload_str = json.dumps(payload) # Assume JSON if not string
+        else:
+            payload_str = payload
+
+        if qos > 0 and self._spool:
+            try:
+                self._spool.append(topic, payload_str, qos, retain)
+            except Exception as e:
+                logger.error(f"MQTTService: Could not spool message for '{topic}': {e}")
+                return False
+            if self._is_connected:
+                self._pump_spool()
+                logger.debug("MQTTService: Message queued for topic '%s': %s", topic, payload_str)
+            else:
+                logger.warning(f"MQTTService: Not connected; message for '{topic}' spooled for delivery on reconnect.")
+            return True
+
         if not self._is_connected:
-            logging.error("MQTTService: Cannot publish, not connected to broker.")
+            logger.error("MQTTService: Cannot publish, not connected to broker.")
             return False
         try:
-            if not isinstance(payload, str):
-                payload_str = json.dumps(payload) # Assume JSON if not string
-            else:
-                payload_str = payload
-            
             result = self.client.publish(topic, payload_str, qos=qos, retain=retain)
             if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                logging.info(f"MQTTService: Message published to topic '{topic}': {payload_str}")
+                logger.debug("MQTTService: Message published to topic '%s': %s", topic, payload_str)
                 return True
             else:
-                logging.error(f"MQTTService: Failed to publish message to '{topic}'. RC: {result.rc}")
+                logger.error(f"MQTTService: Failed to publish message to '{topic}'. RC: {result.rc}")
                 return False
         except Exception as e:
-            logging.error(f"MQTTService: Exception during publish: {e}")
+            logger.error(f"MQTTService: Exception during publish: {e}")
             return False
 
+    def _pump_spool(self):
+        """Hands spooled messages to paho, oldest first, keeping at most MQTT_SPOOL_MAX_INFLIGHT unacknowledged."""
+        with self._spool_lock:
+            while self._is_connected and len(self._spool_inflight) < MQTT_SPOOL_MAX_INFLIGHT:
+                entries = self._spool.read_after(self._spool_cursor, MQTT_SPOOL_MAX_INFLIGHT - len(self._spool_inflight))
+                if not entries:
+                    return
+                for seq, topic, payload, qos, retain in entries:
+                    result = self.client.publish(topic, payload, qos=qos, retain=retain)
+                    # With NO_CONN paho still keeps the QoS 1 message and sends it after reconnecting
+                    if result.rc not in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+                        logger.error(f"MQTTService: Failed to publish spooled message {seq} to '{topic}'. RC: {result.rc}")
+                        return
+                    self._spool_inflight[result.mid] = seq
+                    self._spool_cursor = seq
+                    if result.rc == mqtt.MQTT_ERR_NO_CONN:
+                        return
+
+    def _service_spool(self):
+        """Applies PUBACKs to the spool and refills the in-flight window. Runs on the network thread."""
+        if not self._spool:
+            return
+        acked_seqs = []
+        with self._spool_lock:
+            while self._spool_acked_mids:
+                seq = self._spool_inflight.pop(self._spool_acked_mids.popleft(), None)
+                if seq is not None:
+                    acked_seqs.append(seq)
+        if acked_seqs:
+            self._spool.ack(acked_seqs)
+        if self._is_connected:
+            self._pump_spool()
+        if acked_seqs and not self._spool_inflight and self._spool.backlog_size() == 0:
+            self._spool.compact() # Backlog fully drained: release the space it used
+
+    def get_spool_backlog(self):
+        """Number of spooled messages not yet acknowledged by the broker (0 when the spool is disabled)."""
+        return self._spool.backlog_size() if self._spool else 0
+
     def publish_consultation_request(self, faculty_ble_identifier: str, request_payload: dict):
         if not faculty_ble_identifier:
-            logging.error("MQTTService: Cannot publish consultation request, faculty BLE identifier is missing.")
+            logger.error("MQTTService: Cannot publish consultation request, faculty BLE identifier is missing.")
             return False
             
         topic = CONSULTATION_REQUEST_TOPIC_TEMPLATE.format(faculty_ble_identifier)
         # request_payload should be a dict, will be converted to JSON string by publish_message
         # Ensure it contains student_name, course_code, subject, details, timestamp for the ESP32
         # e.g., {"student_name": "John Doe", "course": "CS101", "subject": "Help!", "details": "...", "timestamp": "2023-01-01T12:00:00"}
-        return self.publish_message(topic, request_payload, qos=1) # QoS 1 for some reliability
+        payload_str = request_payload if isinstance(request_payload, str) else json.dumps(request_payload)
+        published = self.publish_message(topic, payload_str, qos=1) # QoS 1 for some reliability
+        consultation_id = request_payload.get("consultation_id") if isinstance(request_payload, dict) else None
+        if published and consultation_id is not None:
+            # Redelivered until the desk unit acks it on consultease/faculty/<ble_id>/ack
+            self.delivery_tracker.track(consultation_id, topic, payload_str)
+        return published
+
+    def publish_announcement(self, title, message, departments=None, retain=False):
+        """Sends an announcement to every desk unit, or to the units of the given departments.
+
+        Costs one publish per target (one in total for a broadcast) however many units are
+        listening. With retain=True units that connect later also receive it, until
+        clear_announcement() removes it. Returns the number of topics published to.
+        """
+        directory = self.db_service.get_all_departments() if departments and self.db_service else None
+        announcements = build_announcements(title, message, departments, directory)
+        published = sum(1 for topic, payload in announcements if self.publish_message(topic, payload, qos=1, retain=retain))
+        logger.info(f"MQTTService: Announcement '{title}' published to {published}/{len(announcements)} topic(s).")
+        return published
+
+    def clear_announcement(self, departments=None):
+        """Removes a retained announcement from the broadcast topic or the given departments' topics."""
+        topics = [topic for topic, _ in build_announcements("", "", departments)]
+        return sum(1 for topic in topics if self.publish_message(topic, "", qos=1, retain=True)) # Empty retained payload clears it
 
     def run(self):
-        logging.info("MQTTService: Starting connection attempts...")
+        """Connection supervisor.
+
+        The paho network loop runs on this thread (no loop_start() helper thread). It blocks in
+        select() until the broker sends something, another thread publishes or stop() is called,
+        so an idle connection costs no CPU. When the connection drops, the next attempt is
+        scheduled with jittered exponential backoff; subscriptions are restored in _on_connect.
+        """
+        logger.info("MQTTService: Connection supervisor started.")
         while not self._stop_event.is_set():
-            if not self._is_connected:
-                try:
-                    self.client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT, MQTT_KEEPALIVE)
-                    self.client.loop_start() # Starts a background thread for network traffic, callbacks
-                    logging.info("MQTTService: loop_start() called. Waiting for connection...")
-                    # Wait for on_connect to set self._is_connected or timeout
-                    connect_timeout = 10 # seconds
-                    wait_start = time.time()
-                    while not self._is_connected and (time.time() - wait_start < connect_timeout) and not self._stop_event.is_set():
-                        time.sleep(0.1)
-                    
-                    if not self._is_connected and not self._stop_event.is_set():
-                        logging.warning(f"MQTTService: Connection attempt timed out after {connect_timeout}s. Retrying soon.")
-                        self.client.loop_stop(force=True) # Stop if connect didn't establish fully
-
-                except ConnectionRefusedError:
-                    logging.error(f"MQTTService: Connection refused by broker {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT}. Retrying in 5s.")
-                except OSError as e: # Catches [Errno 113] No route to host etc.
-                    logging.error(f"MQTTService: OS error connecting to broker: {e}. Retrying in 5s.")
-                except Exception as e:
-                    logging.error(f"MQTTService: Unexpected error during connection: {e}. Retrying in 5s.")
-                
-                if not self._is_connected: # If connection failed, wait before retry
-                    self._stop_event.wait(5) # Wait 5 seconds or until stop_event is set
-            else:
-                # If connected, just sleep a bit to allow stop_event checking
-                self._stop_event.wait(1)
-        
+            if not self._connect_socket():
+                self._wait_before_reconnect()
+                continue
+
+            # Service the connection until it drops or stop() is requested
+            rc = mqtt.MQTT_ERR_SUCCESS
+            while rc == mqtt.MQTT_ERR_SUCCESS and not self._stop_event.is_set():
+                rc = self.client.loop(timeout=self._loop_timeout())
+                self._run_maintenance()
+
+            if not self._stop_event.is_set():
+                if self._is_connected: # Socket error without a disconnect callback
+                    self._is_connected = False
+                    self._record_disconnected()
+                logger.warning(f"MQTTService: Network loop ended (rc {rc}).")
+                self._wait_before_reconnect()
+
         # Cleanup when thread is stopping
+        try:
+            self._flush_acks(force=True)
+        except Exception as e:
+            logger.error(f"MQTTService: Could not apply remaining acks on shutdown: {e}")
         if self._is_connected:
-            self.client.loop_stop() # Stop the network loop
             self.client.disconnect()
-            logging.info("MQTTService: Disconnected and loop stopped.")
-        logging.info("MQTTService thread finished.")
+            logger.info("MQTTService: Disconnected from broker.")
+        if self._spool:
+            self._spool.close() # Unacknowledged entries stay on disk for the next start
+        logger.info("MQTTService thread finished.")
+
+    def _connect_socket(self):
+        """Opens the TCP connection and sends CONNECT. The CONNACK arrives later through _on_connect."""
+        try:
+            self.client.connect(self.broker_host, self.broker_port, MQTT_KEEPALIVE)
+            return True
+        except ConnectionRefusedError:
+            logger.error(f"MQTTService: Connection refused by broker {self.broker_host}:{self.broker_port}.")
+        except OSError as e: # Catches [Errno 113] No route to host, timeouts etc.
+            logger.error(f"MQTTService: OS error connecting to broker: {e}.")
+        except Exception as e:
+            logger.error(f"MQTTService: Unexpected error during connection: {e}.")
+        return False
+
+    def _wait_before_reconnect(self):
+        delay = self._backoff.next_delay()
+        logger.info(f"MQTTService: Reconnecting in {delay:.1f}s (attempt {self._backoff.attempts}).")
+        self._stop_event.wait(delay) # Returns immediately when stop() is called
 
     def stop(self):
-        logging.info("MQTTService: Received stop signal.")
+        logger.info("MQTTService: Received stop signal.")
         self._stop_event.set()
+        try:
+            self.client.disconnect() # Wakes the network loop so the thread exits promptly
+        except Exception as e:
+            logger.debug(f"MQTTService: disconnect() during stop raised: {e}")
         if self.is_alive():
             self.join(timeout=5) # Wait for the thread to finish
-        if self.client and self._is_connected:
-             self.client.loop_stop(force=True) # Ensure loop is stopped
-             self.client.disconnect() # Ensure disconnected
-        logging.info("MQTTService fully stopped.")
+        logger.info("MQTTService fully stopped.")
 
     def is_connected(self):
         return self._is_connected
 
 # Example Usage
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     print("Testing MQTTService...")
     # For this test, you need an MQTT broker (like Mosquitto) running on localhost.
     # You also need a DatabaseService instance for the MQTTService to use.
@@ -204,6 +764,14 @@ if __name__ == '__main__':
             if ble_identifier == "KNOWN_BLE_ID":
                 return {"name": "Dr. Mock Prof", "ble_identifier": ble_identifier, "current_status": new_status}
             return None
+        def update_faculty_status_batch(self, status_updates):
+            print(f"[MockDBService] Batch updating {len(status_updates)} statuses: {status_updates}")
+            return [{"ble_identifier": ble_id, "current_status": status} for ble_id, status, _ in status_updates if ble_id == "KNOWN_BLE_ID"]
+        def record_consultation_acks(self, acks):
+            print(f"[MockDBService] Recording {len(acks)} consultation acks: {acks}")
+            return []
+        def increment_consultation_delivery_attempts(self, consultation_ids):
+            print(f"[MockDBService] Redelivering consultations {consultation_ids}")
     
     mock_db = MockDBService()
     mqtt_service = MQTTService(db_service=mock_db)
@@ -216,6 +784,7 @@ if __name__ == '__main__':
         example_payload_json = "{\"status\": \"Unavailable\"}" # Escaped for print
         print(f"Publish to '{example_topic}' with payload 'Available' or '{example_payload_json}'")
         print(f"Example: mosquitto_pub -h {MQTT_BROKER_HOST} -t consultease/faculty/TEST_BLE_001/status -m \"{{\\\"status\\\": \\\"Available\\\"}}\"")
+        print(f"Bulk example: mosquitto_pub -h {MQTT_BROKER_HOST} -t {FACULTY_BULK_STATUS_TOPIC_TEMPLATE.format('GW_01')} -m '[{{\"ble_id\": \"KNOWN_BLE_ID\", \"status\": \"Available\", \"rssi\": -60, \"ts\": {int(time.time())}}}]'")
         
         # Keep main thread alive to observe logs and allow MQTT thread to run
         while not mqtt_service.is_connected():
@@ -240,6 +809,11 @@ if __name__ == '__main__':
     except KeyboardInterrupt:
         print("Test interrupted by user.")
     finally:
+        print(f"Connection stats: {mqtt_service.get_connection_stats()}")
+        print(f"Spool backlog: {mqtt_service.get_spool_backlog()}")
+        print(f"Presence debouncing: {mqtt_service.get_presence_stats()}")
+        print(f"Consultation delivery: {mqtt_service.get_delivery_stats()}")
+        print(f"Desk unit watchdog: {mqtt_service.get_watchdog_stats()}")
         print("Stopping MQTTService...")
         mqtt_service.stop()
         print("MQTTService test finished.") 
\ No newline at end of file
@@ -0,0 +1,81 @@
+import os
+import sqlite3
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class OutboundSpool:
+    """Disk-backed FIFO of outbound MQTT publishes.
+
+    Entries are appended to a SQLite table (WAL mode) in publish order and deleted once the
+    broker has acknowledged them, so anything not yet acknowledged survives broker restarts
+    and restarts of the central system itself. Sequence numbers are strictly increasing and
+    define replay order.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # auto_vacuum must be set before the first table is created to take effect
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL") # Durable across app crashes; WAL keeps appends cheap
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbound (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                topic TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                qos INTEGER NOT NULL,
+                retain INTEGER NOT NULL,
+                enqueued_at REAL NOT NULL
+            )
+        """)
+        backlog = self.backlog_size()
+        if backlog:
+            logger.info(f"OutboundSpool: {backlog} unacknowledged message(s) recovered from {path}.")
+
+    def append(self, topic, payload, qos, retain):
+        """Durably appends a publish and returns its sequence number."""
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO outbound (topic, payload, qos, retain, enqueued_at) VALUES (?, ?, ?, ?, ?)",
+                (topic, payload, qos, int(retain), time.time()))
+            return cur.lastrowid
+
+    def read_after(self, seq, limit):
+        """Returns up to `limit` entries with a sequence number greater than `seq`, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, topic, payload, qos, retain FROM outbound WHERE seq > ? ORDER BY seq LIMIT ?",
+                (seq, limit)).fetchall()
+        return [(row[0], row[1], bytes(row[2]), row[3], bool(row[4])) for row in rows]
+
+    def ack(self, seqs):
+        """Removes acknowledged entries."""
+        if not seqs:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM outbound WHERE seq = ?", [(seq,) for seq in seqs])
+
+    def backlog_size(self):
+        """Number of entries not yet acknowledged by the broker (queued plus in flight)."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbound").fetchone()[0]
+
+    def compact(self):
+        """Returns pages freed by acknowledged entries to the filesystem."""
+        with self._lock:
+            self._conn.execute("PRAGMA incremental_vacuum")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,179 @@
+import collections
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Transition rules: target status (or a (from, to) tuple for a specific transition) ->
+# (minimum seconds the current status must have been held, consecutive reports required).
+# Arrivals are confirmed quickly; departures need a second report, which the desk unit's 5s
+# heartbeat provides, so a faculty member sitting at the edge of BLE range no longer flaps.
+DEFAULT_TRANSITION_RULES = {
+    "Available": (10.0, 1),
+    "Unavailable": (30.0, 2),
+    # A unit marked Offline for silence (services/desk_unit_watchdog.py) is back as soon as it reports
+    ("Offline", "Available"): (0.0, 1),
+    ("Offline", "Unavailable"): (0.0, 1),
+}
+DEFAULT_RULE = (0.0, 1) # Statuses without a rule are applied immediately
+DEFAULT_REFRESH_INTERVAL = 300.0 # Seconds after which a repeated status is written again
+
+
+class PresenceDebouncer:
+    """Hysteresis for faculty presence reports, applied before anything is written to the DB.
+
+    observe() decides whether a reported status should be written now. A transition is accepted
+    once it has been reported `confirmations` times in a row and the current status has been
+    held for at least `min_dwell` seconds; a report that flips back before then abandons the
+    transition (counted as a suppressed flap). Transitions that are confirmed but still inside
+    the dwell time are released by pop_due() once it expires. Repeats of the current status are
+    suppressed too, so periodic heartbeats cause no writes, except one every `refresh_interval`
+    seconds (None: never) so the row converges even if it was changed or lost elsewhere.
+    Acceptance assumes the write succeeds; callers reject() a status whose write failed, so the
+    next report of it is written again.
+    """
+
+    def __init__(self, rules=None, suppress_repeats=True, refresh_interval=DEFAULT_REFRESH_INTERVAL, clock=time.monotonic):
+        self.rules = dict(DEFAULT_TRANSITION_RULES if rules is None else rules)
+        self.suppress_repeats = suppress_repeats
+        self.refresh_interval = refresh_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._accepted = {}   # ble_id -> (status, accepted_at)
+        self._replaced = {}   # ble_id -> the (status, accepted_at) the current one replaced, or None
+        self._written_at = {} # ble_id -> time the accepted status was last let through
+        self._repeated = set() # ble_ids whose last report let through was a refresh or repeat, not a transition
+        self._candidates = {} # ble_id -> [status, consecutive reports, first reported at]
+        self._due = {}        # ble_id -> time the confirmed candidate may be applied
+        self.stats = collections.Counter()
+
+    def _rule(self, current, target):
+        rule = self.rules.get((current, target))
+        if rule is None:
+            rule = self.rules.get(target, DEFAULT_RULE)
+        return rule
+
+    def observe(self, ble_id, status, now=None):
+        """Records a reported status. Returns True when it should be written to the DB now."""
+        now = self._clock() if now is None else now
+        with self._lock:
+            self.stats["observations"] += 1
+            accepted = self._accepted.get(ble_id)
+            if accepted is None:
+                self._accept(ble_id, status, now)
+                return True
+
+            current, accepted_at = accepted
+            if status == current:
+                flapped_back = self._candidates.pop(ble_id, None) is not None
+                if flapped_back:
+                    self._due.pop(ble_id, None)
+                    self.stats["suppressed_flaps"] += 1
+                if self.suppress_repeats:
+                    refresh_due = (self.refresh_interval is not None
+                                   and now - self._written_at.get(ble_id, accepted_at) >= self.refresh_interval)
+                    if refresh_due:
+                        self._written_at[ble_id] = now
+                        self._repeated.add(ble_id)
+                        self.stats["refreshes"] += 1
+                        return True
+                    if not flapped_back:
+                        self.stats["suppressed_repeats"] += 1
+                    return False
+                self._written_at[ble_id] = now
+                self._repeated.add(ble_id)
+                self.stats["accepted"] += 1
+                return True
+
+            candidate = self._candidates.get(ble_id)
+            if candidate is None or candidate[0] != status:
+                if candidate is not None:
+                    self.stats["suppressed_flaps"] += 1 # Switched to a different third status
+                candidate = [status, 0, now]
+                self._candidates[ble_id] = candidate
+                self._due.pop(ble_id, None)
+            candidate[1] += 1
+
+            min_dwell, confirmations = self._rule(current, status)
+            if candidate[1] < confirmations:
+                self.stats["suppressed_observations"] += 1
+                return False
+            due_at = accepted_at + min_dwell
+            if now >= due_at:
+                self._accept(ble_id, status, now)
+                return True
+            self._due[ble_id] = due_at
+            self.stats["suppressed_observations"] += 1
+            return False
+
+    def pop_due(self, now=None):
+        """Accepts confirmed transitions whose dwell time has passed. Returns [(ble_id, status)]."""
+        now = self._clock() if now is None else now
+        released = []
+        with self._lock:
+            for ble_id, due_at in list(self._due.items()):
+                if due_at <= now:
+                    status = self._candidates[ble_id][0]
+                    self._accept(ble_id, status, now)
+                    released.append((ble_id, status))
+        return released
+
+    def next_due(self):
+        """Earliest time pop_due() will release something, or None."""
+        with self._lock:
+            return min(self._due.values()) if self._due else None
+
+    def force(self, ble_id, status, now=None):
+        """Sets the accepted status directly, e.g. after the DB was updated by another path."""
+        with self._lock:
+            self._accept(ble_id, status, self._clock() if now is None else now)
+
+    def reject(self, ble_id, status):
+        """Undoes the acceptance of `status` after writing it to the DB failed.
+
+        For a transition, the status accepted before it is restored (for a unit's first report,
+        nothing is), so the next report of `status` counts as a transition and is written instead
+        of being suppressed as a repeat. A failed refresh or repeat leaves the status, which the DB
+        already holds, and only makes the next report refresh it again.
+        """
+        with self._lock:
+            accepted = self._accepted.get(ble_id)
+            if accepted is None or accepted[0] != status:
+                return # Superseded already
+            self.stats["rejected"] += 1
+            if ble_id in self._repeated:
+                self._repeated.discard(ble_id)
+                self._written_at.pop(ble_id, None) # Refresh due again, counted from accepted_at
+                return
+            previous = self._replaced.pop(ble_id, None)
+            self._written_at.pop(ble_id, None)
+            if previous is None:
+                del self._accepted[ble_id]
+            else:
+                self._accepted[ble_id] = previous
+
+    def reject_unwritten(self, requested, updated_rows):
+        """Rejects every (ble_id, status, ...) in `requested` missing from the rows a batched status update returned.
+
+        updated_rows is None when the update failed as a whole.
+        """
+        written = {row['ble_identifier'] for row in updated_rows or []}
+        for ble_id, status, *_ in requested:
+            if ble_id not in written:
+                self.reject(ble_id, status)
+
+    def _accept(self, ble_id, status, now):
+        self._replaced[ble_id] = self._accepted.get(ble_id)
+        self._accepted[ble_id] = (status, now)
+        self._written_at[ble_id] = now
+        self._repeated.discard(ble_id)
+        self._candidates.pop(ble_id, None)
+        self._due.pop(ble_id, None)
+        self.stats["accepted"] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["pending_transitions"] = len(self._candidates)
+            return stats
@@ -0,0 +1,99 @@
+import re
+import time
+
+# CR/LF end a tag on keyboard-style readers; STX (0x02) ... ETX (0x03) frames are used by many 125 kHz modules
+FRAME_END = re.compile(rb'[\r\n\x03]')
+FRAME_STRIP = b'\x02 \t'
+
+# Keyboard-emulating (HID) readers type the tag and press Enter. Codes are the kernel's
+# (linux/input-event-codes.h, a stable ABI), so recorded evdev streams decode without evdev installed.
+EV_KEY = 0x01
+KEY_DOWN = 1 # Key event value for a press (0 = release, 2 = autorepeat)
+KEY_ENTER = 28
+KEY_KPENTER = 96
+ENTER_KEYS = (KEY_ENTER, KEY_KPENTER)
+KEY_MAP = dict(zip((2, 3, 4, 5, 6, 7, 8, 9, 10, 11), "1234567890"))
+KEY_MAP.update(zip((16, 17, 18, 19, 20, 21, 22, 23, 24, 25), "QWERTYUIOP"))
+KEY_MAP.update(zip((30, 31, 32, 33, 34, 35, 36, 37, 38), "ASDFGHJKL"))
+KEY_MAP.update(zip((44, 45, 46, 47, 48, 49, 50), "ZXCVBNM"))
+KEY_MAP.update(zip((71, 72, 73, 75, 76, 77, 79, 80, 81, 82), "7894561230")) # Keypad
+
+
+class TagFramer:
+    """Splits a serial reader's byte stream into tag IDs as the bytes arrive.
+
+    feed() takes whatever read() returned, which may be part of a tag or several tags, and
+    returns the tags completed by it together with the time their first byte was fed, so the
+    caller can measure how long a scan took to reach its callback. A partial frame longer than
+    `max_length` is line noise and is discarded.
+    """
+
+    def __init__(self, max_length=64, clock=time.monotonic):
+        self.max_length = max_length
+        self._clock = clock
+        self._buffer = b""
+        self._first_byte_at = None
+        self.tags = 0
+        self.discarded = 0
+
+    def feed(self, data, now=None):
+        """Returns [(tag, first_byte_at)] for the frames `data` completes."""
+        if not data:
+            return []
+        now = self._clock() if now is None else now
+        if not self._buffer:
+            self._first_byte_at = now
+        self._buffer += data
+        completed = []
+        while True:
+            match = FRAME_END.search(self._buffer)
+            if match is None:
+                break
+            frame, self._buffer = self._buffer[:match.start()], self._buffer[match.end():]
+            tag = frame.strip(FRAME_STRIP).decode('ascii', errors='ignore').strip()
+            if tag:
+                completed.append((tag, self._first_byte_at))
+                self.tags += 1
+            # A frame already following in this chunk started no earlier than this read
+            self._first_byte_at = now
+        if len(self._buffer) > self.max_length:
+            self.discarded += 1
+            self._buffer = b""
+        return completed
+
+    def reset(self):
+        self._buffer = b""
+        self._first_byte_at = None
+
+
+class KeystrokeFramer:
+    """Assembles the key presses of a keyboard-emulating reader into tag IDs, like TagFramer does for bytes.
+
+    feed() takes one input event and returns (tag, first_key_at) when it is the Enter that ends a
+    tag, else None. `at` is when the event happened, on the caller's clock.
+    """
+
+    def __init__(self):
+        self._chars = []
+        self._first_key_at = None
+        self.tags = 0
+
+    def feed(self, event_type, code, value, at):
+        if event_type != EV_KEY or value != KEY_DOWN:
+            return None
+        if code in ENTER_KEYS:
+            if not self._chars:
+                return None
+            tag, self._chars = "".join(self._chars), []
+            self.tags += 1
+            return tag, self._first_key_at
+        char = KEY_MAP.get(code)
+        if char:
+            if not self._chars:
+                self._first_key_at = at
+            self._chars.append(char)
+        return None
+
+    def reset(self):
+        self._chars = []
+        self._first_key_at = None
@@ -0,0 +1,152 @@
+import collections
+import glob
+import logging
+import os
+import socket
+import struct
+
+logger = logging.getLogger(__name__)
+
+NETLINK_KOBJECT_UEVENT = 15
+UDEV_MONITOR_GROUP = 2 # Events re-broadcast by udevd once the device node exists and has its permissions
+UDEV_MESSAGE_PREFIX = b"libudev\0"
+UDEV_MESSAGE_MAGIC = 0xFEEDCAFE
+WATCHED_SUBSYSTEMS = ("tty", "input")
+
+HOTPLUG_AVAILABLE = hasattr(socket, "AF_NETLINK")
+
+# action is "add", "remove", "change", ...; vid/pid are ints or None; name is an input device's name
+DeviceEvent = collections.namedtuple("DeviceEvent", "action subsystem devnode vid pid name")
+
+
+def _read_sysfs(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _usb_ids(sys_path):
+    """Walks up from a sysfs device directory to the USB device that carries idVendor/idProduct."""
+    path = os.path.realpath(sys_path)
+    while path.startswith("/sys/devices/"):
+        vid, pid = _read_sysfs(os.path.join(path, "idVendor")), _read_sysfs(os.path.join(path, "idProduct"))
+        if vid and pid:
+            return int(vid, 16), int(pid, 16)
+        path = os.path.dirname(path)
+    return None, None
+
+
+def usb_ids_of_tty(devnode):
+    """Returns (vid, pid) of the USB device behind a serial port such as /dev/ttyUSB0, or (None, None)."""
+    return _usb_ids(f"/sys/class/tty/{os.path.basename(devnode)}/device")
+
+
+def _hex_id(value):
+    try:
+        return int(value, 16) if value else None
+    except ValueError:
+        return None
+
+
+def _event_from_properties(properties):
+    subsystem = properties.get("SUBSYSTEM")
+    devnode = properties.get("DEVNAME")
+    if subsystem not in WATCHED_SUBSYSTEMS or not devnode:
+        return None
+    if not devnode.startswith("/dev/"):
+        devnode = "/dev/" + devnode # Kernel-format events carry the name relative to /dev
+    action = properties.get("ACTION")
+    vid = _hex_id(properties.get("ID_USB_VENDOR_ID") or properties.get("ID_VENDOR_ID"))
+    pid = _hex_id(properties.get("ID_USB_MODEL_ID") or properties.get("ID_MODEL_ID"))
+    name = None
+    if action != "remove": # sysfs is already gone for removed devices; they are matched by devnode
+        sys_path = "/sys" + properties.get("DEVPATH", "")
+        if vid is None or pid is None:
+            vid, pid = _usb_ids(os.path.join(sys_path, "device"))
+        if subsystem == "input":
+            name = _read_sysfs(os.path.join(sys_path, "device", "name"))
+    return DeviceEvent(action, subsystem, devnode, vid, pid, name)
+
+
+def parse_uevent(data):
+    """Parses one netlink uevent message (udevd's libudev format or the kernel's). Returns a DeviceEvent or None."""
+    if data.startswith(UDEV_MESSAGE_PREFIX):
+        if len(data) < 24 or struct.unpack_from("!I", data, 8)[0] != UDEV_MESSAGE_MAGIC:
+            return None
+        _, properties_offset, properties_length = struct.unpack_from("=III", data, 12)
+        fields = data[properties_offset:properties_offset + properties_length].split(b"\0")
+    else:
+        fields = data.split(b"\0")[1:] # First field is "action@devpath"
+    properties = {}
+    for field in fields:
+        key, sep, value = field.partition(b"=")
+        if sep:
+            properties[key.decode("ascii", errors="replace")] = value.decode("utf-8", errors="replace")
+    return _event_from_properties(properties)
+
+
+def list_devices():
+    """Returns an "add" DeviceEvent for every serial and evdev device present, read from sysfs without opening any."""
+    events = []
+    for sys_path in glob.glob("/sys/class/tty/*/device"):
+        tty = os.path.basename(os.path.dirname(sys_path))
+        vid, pid = _usb_ids(sys_path)
+        events.append(DeviceEvent("add", "tty", f"/dev/{tty}", vid, pid, None))
+    for sys_path in glob.glob("/sys/class/input/event*"):
+        vid, pid = _usb_ids(os.path.join(sys_path, "device"))
+        name = _read_sysfs(os.path.join(sys_path, "device", "name"))
+        events.append(DeviceEvent("add", "input", f"/dev/input/{os.path.basename(sys_path)}", vid, pid, name))
+    return events
+
+
+class DeviceMonitor:
+    """Reports serial and input devices as they are plugged in and removed.
+
+    Listens on the kernel's uevent netlink socket for the events udevd re-broadcasts once a
+    device node is ready, so no udev library is needed. fileno() goes into RFIDService's
+    selector; read_events() is non-blocking and returns the DeviceEvents received since the last
+    call. `sock` may be any datagram socket delivering uevent messages.
+    """
+
+    def __init__(self, sock=None):
+        if sock is None:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20) # Replugging a hub sends bursts
+            sock.bind((0, UDEV_MONITOR_GROUP))
+        sock.setblocking(False)
+        self.sock = sock
+        self.events = 0
+
+    @classmethod
+    def create(cls):
+        """Returns a monitor, or None when netlink is not available (not Linux, or not permitted)."""
+        if not HOTPLUG_AVAILABLE:
+            return None
+        try:
+            return cls()
+        except OSError as e:
+            logger.warning(f"Cannot monitor device hot-plug events: {e}")
+            return None
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def read_events(self):
+        events = []
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return events
+            except OSError as e: # ENOBUFS: the kernel dropped events; the caller's periodic retry covers them
+                logger.warning(f"Device hot-plug monitor: {e}")
+                return events
+            event = parse_uevent(data)
+            if event:
+                self.events += 1
+                events.append(event)
+
+    def close(self):
+        self.sock.close()
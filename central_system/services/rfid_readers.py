@@ -0,0 +1,358 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+from utils.latency import LatencyHistogram
+from services.rfid_framing import TagFramer, KeystrokeFramer
+from services.rfid_hotplug import usb_ids_of_tty
+
+logger = logging.getLogger(__name__)
+
+try:
+    import serial
+    import serial.tools.list_ports
+    PYSERIAL_AVAILABLE = True
+except ImportError:
+    PYSERIAL_AVAILABLE = False
+    logger.warning("pyserial library not found. Real RFID reader functionality will be unavailable. Please install it: pip install pyserial")
+
+try:
+    import evdev
+    EVDEV_AVAILABLE = True
+except ImportError:
+    EVDEV_AVAILABLE = False
+    logger.warning("evdev library not found. evdev RFID reader functionality will be unavailable.")
+
+# --- Configuration for Actual Serial Reader ---
+SERIAL_HARDWARE_VID = 0xFFFF # Provided by user
+SERIAL_HARDWARE_PID = 0x0035 # Provided by user
+SERIAL_BAUD_RATE = 9600      # Common default, adjust if your reader uses a different rate
+
+
+class TagReader:
+    """One physical RFID reader, read by RFIDService's selector thread.
+
+    Subclasses resolve and open the device in _open(), expose its file descriptor through
+    fileno() and turn whatever is readable into tags in _read(). read_tags() must not block: it
+    is only called after select() reported the descriptor readable. Errors from it (OSError,
+    which includes serial.SerialException) mean the device is gone; the service then closes
+    the reader and opens it again later. While scanning is stopped the reader is paused rather
+    than closed, so a restart does not have to find and open the device again.
+    """
+
+    kind = None
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.latency = LatencyHistogram() # First byte / key event -> callback
+        self.state = "closed"
+        self.paused = False
+        self.opens = 0
+        self.failures = 0
+        self.tags = 0
+        self.last_tag_at = None
+        self.last_error = None
+        self.opened_at = None
+        self.recorder = None # RFIDRecorder capturing this reader's raw input, see RFIDService.start_recording()
+        # Device node to try before searching for the device: the last one that worked, or the one
+        # a hot-plug event just reported for this reader
+        self.device_hint = None
+
+    @property
+    def is_open(self):
+        return self.state == "open"
+
+    def open(self):
+        """Resolves and opens the device. Returns True on success."""
+        try:
+            opened = self._open()
+        except OSError as e: # Also serial.SerialException
+            opened = False
+            self.last_error = str(e)
+        if not opened:
+            self.device_hint = None # Stale; search again next time
+            # Retried every few seconds while missing; only the first failure is worth an error
+            log = logger.debug if self.state == "unavailable" else logger.error
+            log(f"RFID reader '{self.name}': could not open device: {self.last_error}")
+        with self._lock:
+            if opened:
+                self.device_hint = self.device_path()
+                self.state = "open"
+                self.paused = False
+                self.opens += 1
+                self.opened_at = datetime.now()
+            else:
+                self.state = "unavailable"
+        return opened
+
+    def read_tags(self):
+        """Returns [(tag, first_byte_at)] completed by the data that is ready now."""
+        return self._read()
+
+    def pause(self):
+        """Stops taking input while scanning is stopped; the device stays open."""
+        try:
+            self._pause()
+        except OSError as e:
+            self.fail(e)
+            return
+        self.paused = True
+
+    def resume(self):
+        """Takes input again after pause(), dropping anything read in the meantime. Returns False if the device is gone."""
+        try:
+            self._resume()
+        except OSError as e:
+            self.fail(e)
+            return False
+        self.paused = False
+        return True
+
+    def fail(self, error):
+        """Closes the reader after a read error, e.g. when it was unplugged."""
+        logger.error(f"RFID reader '{self.name}' failed: {error}")
+        self._close()
+        with self._lock:
+            self.state = "failed"
+            self.failures += 1
+            self.last_error = str(error)
+
+    def close(self):
+        self._close()
+        with self._lock:
+            self.state = "closed"
+
+    def record_tag(self, latency):
+        self.latency.record(latency)
+        with self._lock:
+            self.tags += 1
+            self.last_tag_at = datetime.now()
+
+    def get_stats(self):
+        with self._lock:
+            uptime = (datetime.now() - self.opened_at).total_seconds() if self.state == "open" and self.opened_at else 0.0
+            return {
+                "kind": self.kind,
+                "state": "paused" if self.state == "open" and self.paused else self.state,
+                "device": self.device_path(),
+                "opens": self.opens,
+                "failures": self.failures,
+                "tags": self.tags,
+                "tags_per_hour": self.tags / uptime * 3600 if uptime else None,
+                "last_tag_at": self.last_tag_at,
+                "last_error": self.last_error,
+                "latency": self.latency.summary(),
+            }
+
+    def device_path(self):
+        return None
+
+    def matches(self, device):
+        """Whether a hot-plugged device (services.rfid_hotplug.DeviceEvent) is this reader's."""
+        return False
+
+    def fileno(self):
+        raise NotImplementedError
+
+    def _open(self):
+        raise NotImplementedError
+
+    def _read(self):
+        raise NotImplementedError
+
+    def _pause(self):
+        pass
+
+    def _resume(self):
+        pass
+
+    def _close(self):
+        raise NotImplementedError
+
+
+class SerialTagReader(TagReader):
+    """Serial (USB CDC / UART) reader, found by `port` or by USB VID:PID."""
+
+    kind = "serial"
+
+    def __init__(self, name, port=None, vid=SERIAL_HARDWARE_VID, pid=SERIAL_HARDWARE_PID, baud=SERIAL_BAUD_RATE):
+        super().__init__(name)
+        self.port = port
+        self.vid = vid
+        self.pid = pid
+        self.baud = baud
+        self.conn = None
+        self._resolved_port = port
+        self._framer = TagFramer()
+
+    def device_path(self):
+        return self._resolved_port
+
+    def matches(self, device):
+        if device.subsystem != "tty":
+            return False
+        if self.port:
+            return device.devnode == self.port
+        return device.vid == self.vid and device.pid == self.pid
+
+    def _open(self):
+        if not PYSERIAL_AVAILABLE:
+            self.last_error = "pyserial is not installed"
+            return False
+        # A cached port only counts while the reader is still what is plugged in there
+        if not self.port and self.device_hint and usb_ids_of_tty(self.device_hint) == (self.vid, self.pid):
+            self._resolved_port = self.device_hint
+        elif not self.port:
+            logger.debug(f"RFID reader '{self.name}': looking for a serial reader with VID:PID {self.vid:04X}:{self.pid:04X}")
+            ports = serial.tools.list_ports.comports()
+            self._resolved_port = next((port.device for port in ports if port.vid == self.vid and port.pid == self.pid), None)
+            if not self._resolved_port:
+                self.last_error = f"no serial port matches. Available: {[p.device for p in ports] or 'None'}"
+                return False
+        # A zero timeout makes read() return what is buffered; the selector tells us when that is something
+        self.conn = serial.Serial(self._resolved_port, self.baud, timeout=0)
+        self._framer.reset()
+        logger.info(f"RFID reader '{self.name}': connected to {self._resolved_port} at {self.baud} baud.")
+        return True
+
+    def fileno(self):
+        return self.conn.fileno()
+
+    def _read(self):
+        data = self.conn.read(self.conn.in_waiting or 1)
+        now = time.monotonic()
+        recorder = self.recorder
+        if recorder and data:
+            recorder.record_bytes(self.name, data, now)
+        completed = self._framer.feed(data, now)
+        if self._framer.discarded:
+            logger.warning(f"RFID reader '{self.name}': discarded {self._framer.discarded} unterminated frame(s).")
+            self._framer.discarded = 0
+        return completed
+
+    def _resume(self):
+        self.conn.reset_input_buffer() # Cards read while stopped are not logins now
+        self._framer.reset()
+
+    def _close(self):
+        if self.conn:
+            try:
+                self.conn.close()
+            except Exception as e:
+                logger.warning(f"RFID reader '{self.name}': error closing serial port: {e}")
+        self.conn = None
+
+
+class EvdevTagReader(TagReader):
+    """Keyboard-emulating (HID) reader read through evdev, found by path, name keyword or VID:PID.
+
+    The device is grabbed so the card numbers it types do not reach other applications.
+    """
+
+    kind = "evdev"
+
+    def __init__(self, name, path=None, name_keyword=None, vid=None, pid=None):
+        super().__init__(name)
+        self.path = path
+        self.name_keyword = name_keyword
+        self.vid = vid
+        self.pid = pid
+        self.device = None
+        self._keys = KeystrokeFramer()
+
+    def device_path(self):
+        return self.device.path if self.device else self.path
+
+    def matches(self, device):
+        if device.subsystem != "input" or not device.devnode.startswith("/dev/input/event"):
+            return False
+        if self.path:
+            return device.devnode == self.path
+        return bool((self.name_keyword and device.name and self.name_keyword.lower() in device.name.lower()) or
+                    (self.vid is not None and self.pid is not None and device.vid == self.vid and device.pid == self.pid))
+
+    def _is_reader(self, device):
+        return bool((self.name_keyword and self.name_keyword.lower() in device.name.lower()) or
+                    (self.vid is not None and self.pid is not None and
+                     device.info.vendor == self.vid and device.info.product == self.pid))
+
+    def _find_device(self):
+        if self.path:
+            return evdev.InputDevice(self.path)
+        if self.device_hint:
+            try:
+                device = evdev.InputDevice(self.device_hint)
+            except OSError:
+                device = None
+            if device is not None and self._is_reader(device): # Event numbers are reused after a replug
+                return device
+            if device is not None:
+                device.close()
+        found = None
+        for path in evdev.list_devices():
+            device = evdev.InputDevice(path)
+            if found is None and self._is_reader(device):
+                found = device
+            else:
+                device.close()
+        return found
+
+    def _open(self):
+        if not EVDEV_AVAILABLE:
+            self.last_error = "evdev is not installed"
+            return False
+        device = self._find_device()
+        if device is None:
+            self.last_error = "no evdev device matches the name keyword or VID/PID"
+            return False
+        try:
+            device.grab() # Exclusive access
+        except OSError:
+            device.close()
+            raise
+        self.device = device
+        self._keys.reset()
+        logger.info(f"RFID reader '{self.name}': grabbed evdev device {device.name} ({device.path}).")
+        return True
+
+    def fileno(self):
+        return self.device.fd
+
+    def _read(self):
+        completed = []
+        try:
+            events = list(self.device.read()) # Non-blocking; everything queued since the last read
+        except BlockingIOError:
+            return completed
+        recorder = self.recorder
+        # The kernel stamps events with wall-clock time; express it on the monotonic clock
+        mono_now, wall_now = time.monotonic(), time.time()
+        for event in events:
+            at = mono_now - max(wall_now - event.timestamp(), 0.0)
+            if recorder:
+                recorder.record_event(self.name, event.type, event.code, event.value, at)
+            tag = self._keys.feed(event.type, event.code, event.value, at)
+            if tag:
+                completed.append(tag)
+        return completed
+
+    def _pause(self):
+        self.device.ungrab() # Works as a keyboard again while scanning is stopped
+        self._keys.reset()
+
+    def _resume(self):
+        while self.device.read_one() is not None: # Drop keys typed while stopped
+            pass
+        self._keys.reset()
+        self.device.grab()
+
+    def _close(self):
+        if self.device:
+            for release in (self.device.ungrab, self.device.close):
+                try:
+                    release()
+                except OSError:
+                    pass # Already gone when the reader was unplugged
+        self.device = None
@@ -0,0 +1,228 @@
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from datetime import datetime
+
+from services.rfid_framing import TagFramer, KeystrokeFramer
+from services.rfid_readers import TagReader
+
+logger = logging.getLogger(__name__)
+
+RECORDING_FORMAT = "consultease-rfid-recording"
+RECORDING_VERSION = 1
+
+# A replayed chunk travels through the reader's pipe as (written_at, length) + body. An evdev
+# body is one or more (type, code, value) events; a zero-length chunk marks the end of the replay
+_CHUNK_HEADER = struct.Struct('<dI')
+_EVENT = struct.Struct('<HHi')
+
+
+class RFIDRecorder:
+    """Writes the raw input of RFID readers to a file for ReplayTagReader.
+
+    One JSON object per line: a header, then one entry per serial read ("data" as hex) or evdev
+    input event ("type", "code", "value"), each with the reader name and "t", the seconds since
+    recording started. Every entry is flushed, so a kiosk that crashes keeps what led up to it.
+    Readers call it from the RFID I/O thread; see RFIDService.start_recording().
+    """
+
+    def __init__(self, path, clock=time.monotonic):
+        self.path = path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._file = open(path, "w", encoding="utf-8")
+        self._started_at = clock()
+        self.entries = 0
+        self._write({"format": RECORDING_FORMAT, "version": RECORDING_VERSION, "recorded_at": datetime.now().isoformat()})
+
+    def record_bytes(self, reader_name, data, at=None):
+        self._write({"t": self._offset(at), "reader": reader_name, "kind": "serial", "data": data.hex()}, entry=True)
+
+    def record_event(self, reader_name, event_type, code, value, at=None):
+        self._write({"t": self._offset(at), "reader": reader_name, "kind": "evdev",
+                     "type": event_type, "code": code, "value": value}, entry=True)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def _offset(self, at):
+        return round((self._clock() if at is None else at) - self._started_at, 6)
+
+    def _write(self, record, entry=False):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line)
+            self._file.flush()
+            if entry:
+                self.entries += 1
+
+
+def load_recording(path):
+    """Reads an RFIDRecorder file. Returns {reader_name: (kind, [(t, payload), ...])}.
+
+    payload is the bytes read for serial readers and a (type, code, value) tuple for evdev readers.
+    """
+    readers = {}
+    with open(path, encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("format") != RECORDING_FORMAT:
+            raise ValueError(f"{path} is not an RFID recording")
+        if header.get("version") != RECORDING_VERSION:
+            raise ValueError(f"{path}: unsupported RFID recording version {header.get('version')}")
+        for line_number, line in enumerate(f, start=2):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                kind = entry["kind"]
+                if kind == "serial":
+                    payload = bytes.fromhex(entry["data"])
+                elif kind == "evdev":
+                    payload = (entry["type"], entry["code"], entry["value"])
+                else:
+                    raise ValueError(f"unknown kind {kind!r}")
+                recorded_kind, entries = readers.setdefault(entry["reader"], (kind, []))
+                if recorded_kind != kind:
+                    raise ValueError(f"reader {entry['reader']!r} recorded as both {recorded_kind} and {kind}")
+                entries.append((float(entry["t"]), payload))
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"{path}:{line_number}: bad entry: {e}") from e
+    return readers
+
+
+class ReplayTagReader(TagReader):
+    """Plays one reader's recorded input back into RFIDService, in place of the hardware.
+
+    A feeder thread writes the recorded chunks into a pipe on the recorded schedule, divided by
+    `speed` (0 plays them back to back), and the RFID I/O thread selects on the pipe like on a
+    serial port. Tags are framed by the same code as the real reader, and each is stamped with
+    the time its first chunk was written, so the service's latency figures cover the whole path
+    from "bytes arrive" to the callback. first_byte_at[tag] holds that time for the tag's most
+    recent read.
+    """
+
+    kind = "replay"
+
+    def __init__(self, name, source_kind, entries, speed=1.0, clock=time.monotonic):
+        super().__init__(name)
+        if source_kind not in ("serial", "evdev"):
+            raise ValueError(f"Cannot replay a {source_kind!r} reader")
+        self.source_kind = source_kind
+        self.entries = entries
+        self.speed = speed
+        self._clock = clock
+        self._read_fd = self._write_fd = None
+        self._feeder = None
+        self._stop = threading.Event()
+        self._pending = b""
+        self._framer = TagFramer()
+        self._keys = KeystrokeFramer()
+        self.finished = threading.Event() # Set once the end of the recording has been read
+        self.first_byte_at = {}
+        self.tags_read = 0
+
+    def device_path(self):
+        return f"replay:{self.source_kind}"
+
+    def wait_finished(self, timeout=None):
+        return self.finished.wait(timeout)
+
+    def _open(self):
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+        self._pending = b""
+        self._framer.reset()
+        self._keys.reset()
+        self._stop.clear()
+        self.finished.clear()
+        self._feeder = threading.Thread(target=self._feed, name=f"RFIDReplay-{self.name}", daemon=True)
+        self._feeder.start()
+        logger.info(f"RFID reader '{self.name}': replaying {len(self.entries)} recorded {self.source_kind} chunk(s) at {f'{self.speed:g}x' if self.speed else 'full'} speed.")
+        return True
+
+    def _feed(self):
+        started_at = self._clock()
+        chunks = self.entries
+        index = 0
+        try:
+            while index < len(chunks):
+                if self.speed > 0:
+                    delay = started_at + chunks[index][0] / self.speed - self._clock()
+                    if delay > 0 and self._stop.wait(delay):
+                        return
+                elif self._stop.is_set():
+                    return
+                # Events due together (an evdev key press and its SYN) go out as one chunk
+                t = chunks[index][0]
+                body = b""
+                while index < len(chunks) and chunks[index][0] <= t:
+                    payload = chunks[index][1]
+                    body += payload if self.source_kind == "serial" else _EVENT.pack(*payload)
+                    index += 1
+                os.write(self._write_fd, _CHUNK_HEADER.pack(self._clock(), len(body)) + body)
+            os.write(self._write_fd, _CHUNK_HEADER.pack(self._clock(), 0))
+        except OSError:
+            pass # Closed while feeding
+
+    def fileno(self):
+        return self._read_fd
+
+    def _read(self):
+        try:
+            self._pending += os.read(self._read_fd, 65536)
+        except BlockingIOError:
+            return []
+        completed = []
+        while len(self._pending) >= _CHUNK_HEADER.size:
+            written_at, length = _CHUNK_HEADER.unpack_from(self._pending)
+            end = _CHUNK_HEADER.size + length
+            if len(self._pending) < end:
+                break
+            body, self._pending = self._pending[_CHUNK_HEADER.size:end], self._pending[end:]
+            if not length:
+                self.finished.set()
+            elif self.source_kind == "serial":
+                completed.extend(self._framer.feed(body, written_at))
+            else:
+                for event in _EVENT.iter_unpack(body):
+                    tag = self._keys.feed(*event, written_at)
+                    if tag:
+                        completed.append(tag)
+        for tag, first_byte_at in completed:
+            self.first_byte_at[tag] = first_byte_at
+        self.tags_read += len(completed)
+        return completed
+
+    def _resume(self):
+        # Like a real reader, input that arrived while scanning was stopped is dropped
+        self._read()
+        self.first_byte_at.clear()
+        self._framer.reset()
+        self._keys.reset()
+
+    def _close(self):
+        self._stop.set()
+        # Closing the read end first fails a write the feeder is blocked in, so it exits before
+        # its descriptor is closed (and could be reused)
+        for fd in (self._read_fd, self._write_fd):
+            if fd is None:
+                continue
+            if fd == self._write_fd and self._feeder:
+                self._feeder.join(timeout=1.0)
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._read_fd = self._write_fd = self._feeder = None
+
+
+def replay_readers(path, speed=1.0):
+    """Returns a ReplayTagReader for every reader in the recording at `path`, named as recorded."""
+    return [ReplayTagReader(name, kind, entries, speed=speed) for name, (kind, entries) in load_recording(path).items()]
@@ -0,0 +1,329 @@
+import json
+import logging
+import mmap
+import os
+import select
+import struct
+import threading
+import time
+
+from utils.backoff import ExponentialBackoff
+from utils.bloom_filter import BloomFilter
+
+logger = logging.getLogger(__name__)
+
+ROSTER_SNAPSHOT_PATH = os.path.join(os.path.expanduser("~"), ".consultease", "roster.snapshot")
+ROSTER_FULL_REFRESH_INTERVAL = 900.0 # seconds; a full export also follows every (re)connect
+ROSTER_CHANGE_DEBOUNCE = 0.2         # seconds to gather further change events, e.g. during a bulk import
+KNOWN_TAG_ERROR_RATE = 0.001         # false-positive rate the known-tag filter is sized for
+KNOWN_TAG_REBUILD_CHANGES = 50       # changed students in one burst, or stale tags, that rebuild the filter instead of adding to it
+
+# File layout (little-endian):
+#   header  magic, format version, entry count, roster version, generated_at (epoch s), index offset, data offset
+#   index   one (data offset, tag length, record length) entry per student, sorted by tag bytes
+#   data    per student: the tag, then the record: student_id and length-prefixed UTF-8 fields
+_HEADER = struct.Struct('<4sHHIQdII')
+_INDEX_ENTRY = struct.Struct('<IHH')
+_STUDENT_ID = struct.Struct('<I')
+_FIELD_LENGTH = struct.Struct('<H')
+_NULL_FIELD = 0xFFFF
+SNAPSHOT_MAGIC = b'CERS'
+SNAPSHOT_FORMAT_VERSION = 1
+RECORD_FIELDS = ("name", "student_number", "course", "department")
+
+
+def _encode_record(student):
+    parts = [_STUDENT_ID.pack(student["student_id"])]
+    for field in RECORD_FIELDS:
+        value = student.get(field)
+        if value is None:
+            parts.append(_FIELD_LENGTH.pack(_NULL_FIELD))
+        else:
+            encoded = str(value).encode("utf-8")[:_NULL_FIELD - 1]
+            parts.append(_FIELD_LENGTH.pack(len(encoded)) + encoded)
+    return b"".join(parts)
+
+
+def _decode_record(buffer, offset):
+    student = {"student_id": _STUDENT_ID.unpack_from(buffer, offset)[0]}
+    offset += _STUDENT_ID.size
+    for field in RECORD_FIELDS:
+        length = _FIELD_LENGTH.unpack_from(buffer, offset)[0]
+        offset += _FIELD_LENGTH.size
+        if length == _NULL_FIELD:
+            student[field] = None
+        else:
+            student[field] = bytes(buffer[offset:offset + length]).decode("utf-8")
+            offset += length
+    return student
+
+
+def write_roster_snapshot(path, students, version):
+    """Writes `students` (dicts with rfid_tag, student_id and RECORD_FIELDS) as a snapshot file.
+
+    The file is written next to `path` and renamed over it, so a RosterSnapshot that has the
+    previous file mapped keeps a consistent view until it reopens.
+    """
+    entries = sorted((student["rfid_tag"].encode("utf-8"), _encode_record(student)) for student in students)
+    index_offset = _HEADER.size
+    data_offset = index_offset + len(entries) * _INDEX_ENTRY.size
+    index, data = [], []
+    position = data_offset
+    for tag, record in entries:
+        index.append(_INDEX_ENTRY.pack(position, len(tag), len(record)))
+        data.append(tag + record)
+        position += len(tag) + len(record)
+    header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, 0, len(entries), version, time.time(),
+                          index_offset, data_offset)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(header)
+        f.write(b"".join(index))
+        f.write(b"".join(data))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    return len(entries)
+
+
+class RosterSnapshot:
+    """Read-only, memory-mapped view of a roster snapshot for logging students in while the database is unreachable.
+
+    Opening maps the file and checks its header; nothing is parsed or copied. lookup() binary
+    searches the sorted tag index in the mapping and decodes only the record it finds. A newer
+    file written by RosterSnapshotUpdater (in this or another process) is picked up on the next
+    lookup.
+    """
+
+    def __init__(self, path=ROSTER_SNAPSHOT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mmap = None
+        self._file_id = None
+        self.count = 0
+        self.version = None
+        self.generated_at = None
+
+    def lookup(self, rfid_tag):
+        """Returns the student dict for `rfid_tag` (with "rfid_tag" set), or None if unknown or there is no snapshot."""
+        key = rfid_tag.encode("utf-8")
+        with self._lock:
+            self._reopen_if_replaced()
+            buffer = self._mmap
+            if buffer is None:
+                return None
+            _, _, _, count, _, _, index_offset, _ = _HEADER.unpack_from(buffer, 0)
+            low, high = 0, count
+            while low < high:
+                middle = (low + high) // 2
+                position, tag_length, _ = _INDEX_ENTRY.unpack_from(buffer, index_offset + middle * _INDEX_ENTRY.size)
+                tag = buffer[position:position + tag_length]
+                if tag == key:
+                    student = _decode_record(buffer, position + tag_length)
+                    student["rfid_tag"] = rfid_tag
+                    return student
+                if tag < key:
+                    low = middle + 1
+                else:
+                    high = middle
+            return None
+
+    def refresh(self):
+        """Maps the current file if it was replaced; updates count, version and generated_at."""
+        with self._lock:
+            self._reopen_if_replaced()
+
+    def age(self):
+        """Seconds since the snapshot was generated, or None without one."""
+        self.refresh()
+        return time.time() - self.generated_at if self.generated_at is not None else None
+
+    def close(self):
+        with self._lock:
+            self._unmap()
+
+    def _reopen_if_replaced(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._unmap()
+            return
+        file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if file_id == self._file_id:
+            return
+        self._unmap()
+        try:
+            with open(self.path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e: # ValueError: empty file
+            logger.error(f"Cannot map roster snapshot {self.path}: {e}")
+            return
+        header = _HEADER.unpack_from(mapped, 0) if len(mapped) >= _HEADER.size else None
+        if not header or header[0] != SNAPSHOT_MAGIC or header[1] != SNAPSHOT_FORMAT_VERSION:
+            logger.error(f"{self.path} is not a roster snapshot this version can read.")
+            mapped.close()
+            return
+        _, _, _, count, version, generated_at, _, _ = header
+        self._mmap, self._file_id = mapped, file_id
+        self.count, self.version, self.generated_at = count, version, generated_at
+
+    def _unmap(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._mmap = self._file_id = None
+        self.count, self.version, self.generated_at = 0, None, None
+
+
+class RosterSnapshotUpdater:
+    """Keeps the roster snapshot file in step with the students table.
+
+    A thread holds a LISTEN connection on the channel DatabaseService's students trigger
+    notifies. After each (re)connect it exports the whole roster, since changes may have been
+    missed; afterwards it re-reads only the students named in change events (gathered for
+    ROSTER_CHANGE_DEBOUNCE seconds) and rewrites the snapshot from its in-memory copy. A full
+    export also runs every `full_refresh_interval` seconds. While the database is unreachable
+    the last snapshot stays in place and reconnects back off.
+
+    It also keeps the database service's known-tag filter (see DatabaseService.set_known_tag_filter):
+    rebuilt on every full export and on bursts of changes, otherwise added to. Deleted or re-tagged
+    students leave their old tag in the filter until the next rebuild, which only costs a query.
+    Without a listener, changes made by other clients would go unseen, so the filter is removed
+    while disconnected.
+    """
+
+    def __init__(self, db_service, path=ROSTER_SNAPSHOT_PATH, full_refresh_interval=ROSTER_FULL_REFRESH_INTERVAL,
+                 debounce=ROSTER_CHANGE_DEBOUNCE):
+        self.db_service = db_service
+        self.path = path
+        self.full_refresh_interval = full_refresh_interval
+        self.debounce = debounce
+        self._roster = {} # student_id -> student dict
+        previous = RosterSnapshot(path)
+        previous.refresh()
+        self._version = previous.version or 0 # Versions keep increasing across restarts
+        previous.close()
+        self._thread = None
+        self._stop = threading.Event()
+        self._wakeup_read_fd, self._wakeup_write_fd = os.pipe()
+        self.stats = {"full_exports": 0, "incremental_updates": 0, "changes_applied": 0, "reconnects": 0,
+                      "tag_filter_rebuilds": 0}
+        self._stale_tags = 0 # Tags in the known-tag filter that no student has any more
+        self.last_export_at = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="RosterSnapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        os.write(self._wakeup_write_fd, b'\0')
+        if self._thread:
+            self._thread.join(timeout=5.0)
+        self._thread = None
+
+    def get_stats(self):
+        return dict(self.stats, version=self._version, students=len(self._roster), last_export_at=self.last_export_at)
+
+    def _run(self):
+        backoff = ExponentialBackoff(min_delay=1.0, max_delay=60.0)
+        while not self._stop.is_set():
+            try:
+                conn = self.db_service.open_change_listener()
+            except Exception as e:
+                delay = backoff.next_delay()
+                logger.warning(f"Roster snapshot: database unreachable ({e}); retrying in {delay:.1f}s.")
+                self._stop.wait(delay)
+                continue
+            backoff.reset()
+            try:
+                self._export_all()
+                self._listen(conn)
+            except Exception as e: # Connection lost; the snapshot on disk stays valid
+                logger.warning(f"Roster snapshot: change listener lost its database connection: {e}")
+                self.db_service.set_known_tag_filter(None)
+                self.stats["reconnects"] += 1
+            finally:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+    def _listen(self, conn):
+        next_full_export = time.monotonic() + self.full_refresh_interval
+        while not self._stop.is_set():
+            timeout = max(next_full_export - time.monotonic(), 0.0)
+            readable, _, _ = select.select([conn, self._wakeup_read_fd], [], [], timeout)
+            if self._wakeup_read_fd in readable:
+                os.read(self._wakeup_read_fd, 64)
+            changed = self._take_changes(conn)
+            if changed:
+                # Bulk imports notify once per row; collect the burst before touching the file
+                self._stop.wait(self.debounce)
+                changed |= self._take_changes(conn)
+                self._apply_changes(changed)
+            if time.monotonic() >= next_full_export:
+                self._export_all()
+                next_full_export = time.monotonic() + self.full_refresh_interval
+
+    def _take_changes(self, conn):
+        conn.poll()
+        changed = set()
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            try:
+                changed.add(int(json.loads(notify.payload)["student_id"]))
+            except (ValueError, KeyError, TypeError):
+                logger.warning(f"Roster snapshot: ignoring malformed change event {notify.payload!r}")
+        return changed
+
+    def _export_all(self):
+        read_from = time.monotonic()
+        self._roster = {student["student_id"]: dict(student) for student in self.db_service.get_roster()}
+        self._write()
+        self._rebuild_tag_filter(read_from)
+        self.stats["full_exports"] += 1
+
+    def _apply_changes(self, student_ids):
+        read_from = time.monotonic()
+        current = {student["student_id"]: dict(student) for student in self.db_service.get_roster(student_ids)}
+        for student_id in student_ids:
+            previous = self._roster.get(student_id)
+            if student_id in current:
+                self._roster[student_id] = current[student_id]
+                if previous and previous["rfid_tag"] != current[student_id]["rfid_tag"]:
+                    self._stale_tags += 1
+            elif previous:
+                del self._roster[student_id]
+                self._stale_tags += 1
+        self._write()
+        self._update_tag_filter(current.values(), len(student_ids), read_from)
+        self.stats["incremental_updates"] += 1
+        self.stats["changes_applied"] += len(student_ids)
+
+    def _update_tag_filter(self, changed_students, change_count, read_from):
+        known_tags = self.db_service.known_tags
+        if (known_tags is None or change_count >= KNOWN_TAG_REBUILD_CHANGES or known_tags.is_full
+                or self._stale_tags >= KNOWN_TAG_REBUILD_CHANGES):
+            self._rebuild_tag_filter(read_from)
+            return
+        for student in changed_students:
+            known_tags.add(student["rfid_tag"])
+
+    def _rebuild_tag_filter(self, read_from):
+        known_tags = BloomFilter.from_items((student["rfid_tag"] for student in self._roster.values()),
+                                            error_rate=KNOWN_TAG_ERROR_RATE)
+        self.db_service.set_known_tag_filter(known_tags, built_from=read_from)
+        self._stale_tags = 0
+        self.stats["tag_filter_rebuilds"] += 1
+        logger.debug("Known-tag filter rebuilt for %d tags: %d bytes, %d hashes, expected false-positive rate %.5f",
+                     len(known_tags), known_tags.size_bytes(), known_tags.num_hashes, known_tags.false_positive_rate())
+
+    def _write(self):
+        self._version += 1
+        count = write_roster_snapshot(self.path, self._roster.values(), self._version)
+        self.last_export_at = time.time()
+        logger.debug("Roster snapshot version %d written with %d students", self._version, count)
@@ -0,0 +1,113 @@
+import threading
+import time
+
+
+class RetainedStatusWarmup:
+    """Collects the retained desk unit statuses a broker sends right after subscribing.
+
+    After a (re)connect the broker replays one retained status per desk unit, all at once. While
+    a warm-up is active those statuses are gathered here instead of being written one by one,
+    and any live message that arrives in the meantime is deferred so it is applied after them,
+    in order. The warm-up ends `quiet` seconds after the last retained message (counted from
+    the SUBACK until one arrives), and never later than `window` seconds after it started. The
+    owning service then writes take_batch() as one statement, replays take_deferred() and calls
+    finish(). Does no I/O itself.
+    """
+
+    def __init__(self, window=2.0, quiet=0.25, clock=time.monotonic):
+        self.window = window
+        self.quiet = quiet
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._active = False
+        self._started_at = None
+        self._last_activity = None # None until the SUBACK arrives
+        self._statuses = {}        # ble_id -> status, latest retained message wins
+        self._deferred = []
+        self.warmups = 0
+        self.retained_batched = 0
+        self.deferred_replayed = 0
+
+    def start(self, now=None):
+        """Begins a warm-up, e.g. when subscribing. Statuses not yet taken from an earlier one are kept."""
+        now = self._clock() if now is None else now
+        with self._lock:
+            self._active = self.window > 0
+            self._started_at = now
+            self._last_activity = None
+            if self._active:
+                self.warmups += 1
+
+    def subscribed(self, now=None):
+        """Called on SUBACK; retained messages follow it immediately."""
+        now = self._clock() if now is None else now
+        with self._lock:
+            if self._active and self._last_activity is None:
+                self._last_activity = now
+
+    @property
+    def active(self):
+        return self._active
+
+    def add(self, ble_id, status, now=None):
+        """Records a retained status to be written in the warm-up batch."""
+        now = self._clock() if now is None else now
+        with self._lock:
+            self._statuses[ble_id] = status
+            self._last_activity = now
+
+    def retained_seen(self, now=None):
+        """Records a retained message that needs no write (e.g. a repeat), which still extends the quiet period."""
+        now = self._clock() if now is None else now
+        with self._lock:
+            self._last_activity = now
+
+    def defer(self, message):
+        with self._lock:
+            self._deferred.append(message)
+
+    def next_due(self):
+        """Time at which the warm-up ends unless more retained messages arrive, or None when inactive."""
+        with self._lock:
+            if not self._active:
+                return None
+            deadline = self._started_at + self.window
+            if self._last_activity is not None:
+                deadline = min(deadline, self._last_activity + self.quiet)
+            return deadline
+
+    def due(self, now=None):
+        due_at = self.next_due()
+        return due_at is not None and (self._clock() if now is None else now) >= due_at
+
+    def take_batch(self):
+        """Returns [(ble_id, status)] collected so far and clears them."""
+        with self._lock:
+            batch = list(self._statuses.items())
+            self._statuses.clear()
+            self.retained_batched += len(batch)
+            return batch
+
+    def take_deferred(self):
+        """Returns the deferred live messages in arrival order and clears them."""
+        with self._lock:
+            deferred, self._deferred = self._deferred, []
+            self.deferred_replayed += len(deferred)
+            return deferred
+
+    def finish(self):
+        """Ends the warm-up; messages are handled live from now on. Returns False if more were deferred meanwhile."""
+        with self._lock:
+            if self._deferred:
+                return False
+            self._active = False
+            return True
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "active": self._active,
+                "warmups": self.warmups,
+                "retained_batched": self.retained_batched,
+                "deferred_replayed": self.deferred_replayed,
+            }
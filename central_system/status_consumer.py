@@ -0,0 +1,109 @@
+"""Runs faculty status ingestion without the kiosk UI, as one or more consumer processes.
+
+Each process has its own MQTTService (status topics only, no consultation acks) and its own
+database connection. Work is split between them in one of two ways:
+
+  --affinity broker  every process joins the MQTT v5 shared subscription group --group and the
+                     broker gives each message to one member. Per-device ordering needs a broker
+                     that picks the member by topic hash (EMQX: shared_subscription_strategy =
+                     hash_topic); Mosquitto round-robins, so use client affinity there.
+  --affinity client  every process subscribes normally and only handles BLE identifiers in its own
+                     partition (crc32 % --partitions). Works with any broker; each process receives
+                     all status traffic but does 1/N of the processing and DB writes.
+
+Several hosts can share the load: with broker affinity, run the same --group everywhere; with
+client affinity, give each host its own range, e.g. `--partitions 8 --first-partition 4`.
+Set EXTERNAL_STATUS_CONSUMERS in main.py so the kiosk stops ingesting status itself.
+
+    python status_consumer.py --processes 4
+    python status_consumer.py --processes 4 --affinity client --partitions 8 --first-partition 0
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+
+from services.mqtt_service import MQTTService, MQTT_BROKER_HOST, MQTT_BROKER_PORT, STATUS_CONSUMER_GROUP
+from utils.logging_setup import configure_logging, get_logging_stats
+
+STATS_LOG_INTERVAL = 60.0 # seconds between per-process stats lines
+
+
+def run_consumer(args, partition_index, stop_event):
+    """Entry point of one consumer process."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # The parent handles Ctrl+C and sets stop_event
+    configure_logging(level=args.log_level, json_format=args.log_json,
+                      fmt=f'%(asctime)s - %(levelname)s - StatusConsumer[{partition_index}] - %(name)s - %(message)s')
+    from services.database_service import DatabaseService
+    try:
+        db_service = DatabaseService()
+    except RuntimeError as e:
+        logging.critical(f"Failed to initialize DatabaseService: {e}")
+        sys.exit(1)
+
+    client_affinity = args.affinity == "client"
+    service = MQTTService(
+        db_service,
+        client_id=f"ConsultEase_StatusConsumer_{socket.gethostname()}_{partition_index}",
+        spool_path=None, # Consumers publish nothing that has to survive a restart
+        broker_host=args.broker_host, broker_port=args.broker_port,
+        handle_acks=False,
+        shared_group=None if client_affinity else args.group,
+        partition=(partition_index, args.partitions) if client_affinity else None,
+    )
+    service.start()
+    logging.info(f"Consuming faculty status ({'partition %d/%d' % (partition_index, args.partitions) if client_affinity else 'shared group ' + args.group}).")
+    while not stop_event.wait(STATS_LOG_INTERVAL):
+        logging.info(f"Presence: {service.get_presence_stats()} | Watchdog: {service.get_watchdog_stats()} | Logging: {get_logging_stats()}")
+    service.stop()
+    service.join(timeout=5)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Headless faculty status consumers for ConsultEase.")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--affinity", choices=["broker", "client"], default="broker",
+                        help="broker: MQTT v5 shared subscription; client: hash partitions over a regular subscription")
+    parser.add_argument("--group", default=STATUS_CONSUMER_GROUP, help="shared subscription group (broker affinity)")
+    parser.add_argument("--partitions", type=int, help="total partitions across all hosts (client affinity; default --processes)")
+    parser.add_argument("--first-partition", type=int, default=0, help="partition index of this host's first process (client affinity)")
+    parser.add_argument("--broker-host", default=MQTT_BROKER_HOST)
+    parser.add_argument("--broker-port", type=int, default=MQTT_BROKER_PORT)
+    parser.add_argument("--log-level", default="INFO")
+    parser.add_argument("--log-json", action="store_true", help="write log lines as JSON objects")
+    args = parser.parse_args(argv)
+    args.partitions = args.partitions or args.processes
+    if args.affinity == "client" and args.first_partition + args.processes > args.partitions:
+        parser.error("--first-partition + --processes must not exceed --partitions")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging(level=args.log_level, json_format=args.log_json,
+                      fmt='%(asctime)s - %(levelname)s - StatusConsumer - %(name)s - %(message)s')
+    stop_event = multiprocessing.Event()
+    processes = [multiprocessing.Process(target=run_consumer, args=(args, args.first_partition + offset, stop_event),
+                                         name=f"StatusConsumer-{args.first_partition + offset}")
+                 for offset in range(args.processes)]
+    for process in processes:
+        process.start()
+    logging.info(f"Started {len(processes)} status consumer process(es) ({args.affinity} affinity).")
+
+    def _request_stop(signum, frame):
+        logging.info("Stopping status consumers...")
+        stop_event.set()
+    signal.signal(signal.SIGINT, _request_stop)
+    signal.signal(signal.SIGTERM, _request_stop)
+
+    for process in processes:
+        process.join()
+    return max((process.exitcode or 0) for process in processes)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,517 @@
+"""Faculty desk unit fleet simulator and MQTT load generator.
+
+Simulates N desk units speaking the topic scheme from faculty_desk_unit/src/config.h: each
+unit has its own MQTT connection, publishes presence changes (with optional flapping) and
+periodic status heartbeats like the firmware, and listens on its request topic, acknowledging
+each request ("delivered", then "viewed") on its ack topic the way the firmware does. It reports
+latency percentiles for
+
+  * publish -> DB row update: status publish until faculty.status_updated_at shows it
+    (read by polling the DB; both clocks must agree, so run it on the central system host)
+  * submit -> desk-unit receipt: consultation submitted (DB insert + publish, mirroring
+    DashboardController) until the simulated unit receives it
+
+Run from central_system/ while the central system (or at least MQTTService) is running:
+
+    python -m tools.desk_unit_simulator --provision --units 200 --duration 120 --submit-rate 30
+"""
+import argparse
+import collections
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import selectors
+import sys
+import threading
+import time
+from datetime import datetime
+
+import paho.mqtt.client as mqtt
+
+from utils.latency import LatencyHistogram
+from services.mqtt_service import MQTT_BROKER_HOST, MQTT_BROKER_PORT, MQTT_KEEPALIVE, CONSULTATION_REQUEST_TOPIC_TEMPLATE, department_topic_id
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_H = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'faculty_desk_unit', 'src', 'config.h')
+FIRMWARE_STATUS_PUBLISH_INTERVAL = 5.0 # STATUS_PUBLISH_INTERVAL in faculty_desk_unit/src/main.cpp
+SIM_DEPARTMENT = "Simulation"
+SIM_STUDENT_RFID = "SIMSTUDENT0001"
+RECONNECT_DELAY = 2.0
+
+
+def load_firmware_defines(path):
+    """Returns the string #defines of a firmware header as {name: value}."""
+    defines = {}
+    with open(path) as f:
+        for line in f:
+            match = re.match(r'\s*#define\s+(\w+)\s+"([^"]*)"', line)
+            if match:
+                defines[match.group(1)] = match.group(2)
+    return defines
+
+
+def load_firmware_topics(path):
+    """Reads the desk unit topic templates from config.h, converted to str.format() templates."""
+    defines = load_firmware_defines(path)
+    return {
+        "status": defines["MQTT_STATUS_TOPIC_TEMPLATE"].replace("%s", "{}"),
+        "requests": defines["MQTT_REQUEST_TOPIC_TEMPLATE"].replace("%s", "{}"),
+        "ack": defines["MQTT_ACK_TOPIC_TEMPLATE"].replace("%s", "{}"),
+        "announcements": defines["MQTT_ANNOUNCEMENT_TOPIC"],
+        "department_announcements": defines["MQTT_DEPARTMENT_ANNOUNCEMENT_TOPIC_TEMPLATE"].replace("%s", "{}"),
+        "client_id_prefix": defines.get("MQTT_CLIENT_ID_PREFIX", "FacultyDeskUnit_"),
+    }
+
+
+class SimulatedDeskUnit:
+    def __init__(self, ble_id, client_id):
+        self.ble_id = ble_id
+        self.client = mqtt.Client(client_id=client_id, userdata=self)
+        self.present = random.random() < 0.5
+        self.connected = False
+        self.last_published_status = None
+        self.last_displayed_consultation_id = None
+        self.last_publish = 0.0 # monotonic
+
+
+class DeskUnitFleet:
+    """Drives all simulated units from one thread with a selector over their sockets."""
+
+    def __init__(self, units, topics, args, status_latency, delivery_latency):
+        self.units = units
+        self.topics = topics
+        self.args = args
+        self.status_latency = status_latency
+        self.delivery_latency = delivery_latency
+        self.stats = collections.Counter()
+        self.pending_db = {}  # ble_id -> (status, wall time published), awaiting the DB row update
+        self.pending_lock = threading.Lock()
+        self._selector = selectors.DefaultSelector()
+        self._timers = []     # heap of (due, seq, callback, args)
+        self._timer_seq = itertools.count()
+        self._stop_event = threading.Event()
+
+        for unit in units:
+            client = unit.client
+            client.on_connect = self._on_connect
+            client.on_disconnect = self._on_disconnect
+            client.on_message = self._on_message
+            client.on_socket_open = self._on_socket_open
+            client.on_socket_close = self._on_socket_close
+            client.on_socket_register_write = self._on_socket_register_write
+            client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    # --- Timers ---
+
+    def _schedule(self, delay, callback, *args):
+        heapq.heappush(self._timers, (time.monotonic() + delay, next(self._timer_seq), callback, args))
+
+    def _run_due_timers(self):
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, callback, args = heapq.heappop(self._timers)
+            callback(*args)
+
+    # --- Socket hooks (paho external loop) ---
+
+    def _on_socket_open(self, client, unit, sock):
+        self._selector.register(sock, selectors.EVENT_READ, client)
+
+    def _on_socket_close(self, client, unit, sock):
+        try:
+            self._selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+
+    def _on_socket_register_write(self, client, unit, sock):
+        try:
+            self._selector.modify(sock, selectors.EVENT_READ | selectors.EVENT_WRITE, client)
+        except (KeyError, ValueError):
+            pass
+
+    def _on_socket_unregister_write(self, client, unit, sock):
+        try:
+            self._selector.modify(sock, selectors.EVENT_READ, client)
+        except (KeyError, ValueError):
+            pass
+
+    # --- Unit behaviour ---
+
+    def _connect(self, unit):
+        try:
+            unit.client.connect(self.args.broker_host, self.args.broker_port, MQTT_KEEPALIVE)
+        except OSError as e:
+            logger.warning(f"Simulator: {unit.ble_id} could not connect: {e}. Retrying in {RECONNECT_DELAY}s.")
+            self._schedule(RECONNECT_DELAY, self._connect, unit)
+
+    def _on_connect(self, client, unit, flags, rc):
+        if rc != 0:
+            logger.warning(f"Simulator: {unit.ble_id} connection refused (rc {rc}).")
+            return
+        unit.connected = True
+        self.stats["connects"] += 1
+        client.subscribe([
+            (self.topics["requests"].format(unit.ble_id), 1), # Same QoS as the firmware's subscriptions
+            (self.topics["announcements"], 1),
+            (self.topics["department_announcements"].format(department_topic_id(SIM_DEPARTMENT)), 1),
+        ])
+        self._publish_status(unit, "boot")
+
+    def _on_disconnect(self, client, unit, rc):
+        unit.connected = False
+        if not self._stop_event.is_set():
+            self.stats["disconnects"] += 1
+            self._schedule(RECONNECT_DELAY, self._connect, unit)
+
+    def _on_message(self, client, unit, msg):
+        received_at = time.time()
+        if not msg.topic.endswith("/requests"):
+            if msg.payload: # An empty retained payload is a cleared announcement
+                self.stats["announcements_received"] += 1
+            return
+        self.stats["requests_received"] += 1
+        try:
+            data = json.loads(msg.payload.decode('utf-8'))
+        except (ValueError, UnicodeDecodeError):
+            self.stats["requests_malformed"] += 1
+            return
+        submitted_at = data.get("sim_submitted_at")
+        if submitted_at is None and data.get("requested_at"):
+            try:
+                submitted_at = datetime.fromisoformat(data["requested_at"]).timestamp()
+            except ValueError:
+                submitted_at = None
+        consultation_id = data.get("consultation_id")
+        if consultation_id is not None:
+            self._publish_ack(unit, consultation_id, "delivered")
+            if consultation_id == unit.last_displayed_consultation_id:
+                self.stats["requests_redelivered"] += 1
+                self._publish_ack(unit, consultation_id, "viewed")
+                return
+            unit.last_displayed_consultation_id = consultation_id
+            self._publish_ack(unit, consultation_id, "viewed")
+        if submitted_at is not None:
+            self.delivery_latency.record(received_at - submitted_at)
+
+    def _publish_ack(self, unit, consultation_id, event):
+        # Same payload as mqtt_publish_ack() in the firmware
+        payload = "{\"consultation_id\": %d, \"event\": \"%s\"}" % (consultation_id, event)
+        unit.client.publish(self.topics["ack"].format(unit.ble_id), payload, qos=0)
+        self.stats["acks_published"] += 1
+
+    def _publish_status(self, unit, kind):
+        if not unit.connected:
+            return
+        status = "Available" if unit.present else "Unavailable"
+        # Same payload the firmware builds in update_presence_and_publish_status()
+        payload = "{\"status\": \"%s\"}" % status
+        unit.client.publish(self.topics["status"].format(unit.ble_id), payload, qos=0)
+        unit.last_publish = time.monotonic()
+        self.stats["published"] += 1
+        self.stats[kind] += 1
+        if status == unit.last_published_status:
+            return # The central system debounces repeats, so only changes reach the DB
+        unit.last_published_status = status
+        with self.pending_lock:
+            if unit.ble_id in self.pending_db:
+                self.stats["db_superseded"] += 1 # Previous publish not yet seen in the DB
+            self.pending_db[unit.ble_id] = (status, time.time())
+
+    def _presence_change(self, unit, flaps_left=None):
+        unit.present = not unit.present
+        if flaps_left is None and random.random() < self.args.flap_probability:
+            flaps_left = self.args.flap_toggles # Beacon hovering around the RSSI threshold
+        self._publish_status(unit, "flaps" if flaps_left is not None else "changes")
+        if flaps_left:
+            self._schedule(self.args.flap_interval, self._presence_change, unit, flaps_left - 1)
+        else:
+            self._schedule_next_change(unit)
+
+    def _schedule_next_change(self, unit):
+        if self.args.change_rate > 0:
+            self._schedule(random.expovariate(self.args.change_rate / 3600.0), self._presence_change, unit)
+
+    def _heartbeat(self, unit):
+        # Firmware republishes when STATUS_PUBLISH_INTERVAL has passed since the last publish
+        due = unit.last_publish + self.args.heartbeat
+        if time.monotonic() >= due:
+            self._publish_status(unit, "heartbeats")
+            due = unit.last_publish + self.args.heartbeat
+        self._schedule(max(due - time.monotonic(), 0.01), self._heartbeat, unit)
+
+    # --- Main loop ---
+
+    def run(self, duration, report):
+        for index, unit in enumerate(self.units):
+            # Stagger connects a little so a big fleet does not arrive in one burst
+            self._schedule(index * self.args.connect_spacing, self._connect, unit)
+            self._schedule_next_change(unit)
+            if self.args.heartbeat > 0:
+                self._schedule(random.uniform(0, self.args.heartbeat), self._heartbeat, unit)
+
+        start = time.monotonic()
+        end = start + duration
+        next_misc = start + 1.0
+        next_report = start + self.args.report_interval
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            if now >= end:
+                break
+            deadline = min(end, next_misc, next_report, self._timers[0][0] if self._timers else end)
+            for key, mask in self._selector.select(max(deadline - now, 0)):
+                client = key.data
+                if mask & selectors.EVENT_READ:
+                    client.loop_read()
+                if mask & selectors.EVENT_WRITE:
+                    client.loop_write()
+            self._run_due_timers()
+            now = time.monotonic()
+            if now >= next_misc:
+                for unit in self.units:
+                    unit.client.loop_misc() # Keepalive pings
+                next_misc = now + 1.0
+            if now >= next_report:
+                report(now - start)
+                next_report = now + self.args.report_interval
+
+    def stop(self):
+        self._stop_event.set()
+        for unit in self.units:
+            if unit.connected:
+                unit.client.disconnect()
+                unit.client.loop_write()
+
+    def connected_count(self):
+        return sum(1 for unit in self.units if unit.connected)
+
+
+class DBStatusPoller(threading.Thread):
+    """Matches pending status publishes against faculty.status_updated_at."""
+
+    def __init__(self, db_service, fleet, interval):
+        super().__init__(daemon=True)
+        self.db_service = db_service
+        self.fleet = fleet
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                rows = self.db_service.get_all_faculty(department_filter=SIM_DEPARTMENT) or []
+            except Exception as e:
+                logger.error(f"Simulator: DB poll failed: {e}")
+                continue
+            with self.fleet.pending_lock:
+                for row in rows:
+                    pending = self.fleet.pending_db.get(row.get("ble_identifier"))
+                    updated_at = row.get("status_updated_at")
+                    if not pending or not updated_at or row.get("current_status") != pending[0]:
+                        continue
+                    updated_ts = updated_at.timestamp()
+                    if updated_ts >= pending[1]:
+                        self.fleet.status_latency.record(updated_ts - pending[1])
+                        del self.fleet.pending_db[row["ble_identifier"]]
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class ConsultationSubmitter(threading.Thread):
+    """Submits consultation requests to random simulated units the way DashboardController does."""
+
+    def __init__(self, args, units, db_service, faculty_ids, student):
+        super().__init__(daemon=True)
+        self.args = args
+        self.units = units
+        self.db_service = db_service
+        self.faculty_ids = faculty_ids
+        self.student = student
+        self.submitted = 0
+        self.failed = 0
+        self.client = mqtt.Client(client_id="ConsultEase_Simulator_Submitter")
+        self._stop_event = threading.Event()
+
+    def run(self):
+        self.client.connect(self.args.broker_host, self.args.broker_port, MQTT_KEEPALIVE)
+        self.client.loop_start()
+        interval = 60.0 / self.args.submit_rate
+        while not self._stop_event.wait(random.expovariate(1.0 / interval)):
+            self._submit(random.choice(self.units).ble_id)
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def _submit(self, ble_id):
+        submitted_at = time.time()
+        payload = {
+            "consultation_id": None,
+            "student_name": self.student["name"] if self.student else "Simulated Student",
+            "student_id": self.student["student_id"] if self.student else None,
+            "course_code": "SIM101",
+            "subject": "Load test",
+            "request_details": "Generated by tools/desk_unit_simulator.py",
+            "requested_at": datetime.now().isoformat(),
+            "sim_submitted_at": submitted_at,
+        }
+        if self.db_service and self.student and ble_id in self.faculty_ids:
+            record = self.db_service.add_consultation_request(
+                student_id=self.student["student_id"], faculty_id=self.faculty_ids[ble_id],
+                course_code=payload["course_code"], subject=payload["subject"], request_details=payload["request_details"])
+            if not record:
+                self.failed += 1
+                return
+            payload["consultation_id"] = record["consultation_id"]
+            payload["requested_at"] = record["requested_at"].isoformat()
+        result = self.client.publish(CONSULTATION_REQUEST_TOPIC_TEMPLATE.format(ble_id), json.dumps(payload), qos=1)
+        if result.rc == mqtt.MQTT_ERR_SUCCESS:
+            self.submitted += 1
+        else:
+            self.failed += 1
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def provision(db_service, ble_ids):
+    """Creates faculty rows for the simulated units and a simulated student (existing rows are kept)."""
+    existing = {row["ble_identifier"] for row in db_service.get_all_faculty(department_filter=SIM_DEPARTMENT) or []}
+    for ble_id in ble_ids:
+        if ble_id not in existing:
+            db_service.add_faculty(name=f"Sim Faculty {ble_id}", department=SIM_DEPARTMENT, ble_identifier=ble_id)
+    if not db_service.get_student_by_rfid(SIM_STUDENT_RFID):
+        db_service.add_student(rfid_tag=SIM_STUDENT_RFID, name="Simulated Student", department=SIM_DEPARTMENT)
+    print(f"Provisioned {len(set(ble_ids) - existing)} new simulated faculty ({len(ble_ids)} total).")
+
+
+def deprovision(db_service):
+    """Deletes everything provision() created, including their consultations."""
+    rows = db_service.get_all_faculty(department_filter=SIM_DEPARTMENT) or []
+    for row in rows:
+        db_service.delete_faculty(row["faculty_id"])
+    student = db_service.get_student_by_rfid(SIM_STUDENT_RFID)
+    if student:
+        db_service.delete_student(student["student_id"])
+    print(f"Removed {len(rows)} simulated faculty.")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate a fleet of faculty desk units and measure end-to-end MQTT latency.")
+    parser.add_argument("--units", type=int, default=50, help="number of simulated desk units")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds to run")
+    parser.add_argument("--id-prefix", default="SIM-", help="BLE identifier prefix for simulated units")
+    parser.add_argument("--broker-host", default=MQTT_BROKER_HOST)
+    parser.add_argument("--broker-port", type=int, default=MQTT_BROKER_PORT)
+    parser.add_argument("--config-h", default=DEFAULT_CONFIG_H, help="firmware config.h to read topic templates from")
+    parser.add_argument("--change-rate", type=float, default=6.0, help="presence changes per unit per hour (Poisson)")
+    parser.add_argument("--flap-probability", type=float, default=0.1, help="chance that a presence change flaps")
+    parser.add_argument("--flap-toggles", type=int, default=4, help="extra toggles in a flap burst")
+    parser.add_argument("--flap-interval", type=float, default=2.0, help="seconds between toggles in a flap burst")
+    parser.add_argument("--heartbeat", type=float, default=FIRMWARE_STATUS_PUBLISH_INTERVAL,
+                        help="republish the current status after this many idle seconds (0 disables)")
+    parser.add_argument("--connect-spacing", type=float, default=0.005, help="seconds between unit connects at startup")
+    parser.add_argument("--submit-rate", type=float, default=0.0, help="consultation requests per minute across the fleet")
+    parser.add_argument("--no-db", action="store_true", help="do not use the database (no publish->DB latency)")
+    parser.add_argument("--db-poll-interval", type=float, default=0.25, help="seconds between DB polls for status rows")
+    parser.add_argument("--provision", action="store_true", help="create faculty rows for the simulated units first")
+    parser.add_argument("--deprovision", action="store_true", help="delete simulated faculty and student, then exit")
+    parser.add_argument("--report-interval", type=float, default=10.0)
+    parser.add_argument("--json-out", help="write the final summary to this file")
+    parser.add_argument("--seed", type=int)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    db_service = None
+    if not args.no_db:
+        from services.database_service import DatabaseService
+        try:
+            db_service = DatabaseService()
+        except Exception as e:
+            print(f"Could not connect to the database ({e}). Use --no-db to run without it.")
+            return 1
+    if args.deprovision:
+        if db_service:
+            deprovision(db_service)
+        return 0
+
+    topics = load_firmware_topics(args.config_h)
+    ble_ids = [f"{args.id_prefix}{index:04d}" for index in range(args.units)]
+    if db_service and args.provision:
+        provision(db_service, ble_ids)
+
+    units = [SimulatedDeskUnit(ble_id, f"{topics['client_id_prefix']}{ble_id}") for ble_id in ble_ids]
+    status_latency = LatencyHistogram()
+    delivery_latency = LatencyHistogram()
+    fleet = DeskUnitFleet(units, topics, args, status_latency, delivery_latency)
+
+    poller = DBStatusPoller(db_service, fleet, args.db_poll_interval) if db_service else None
+    submitter = None
+    if args.submit_rate > 0:
+        faculty_ids, student = {}, None
+        if db_service:
+            faculty_ids = {row["ble_identifier"]: row["faculty_id"] for row in db_service.get_all_faculty(department_filter=SIM_DEPARTMENT) or []}
+            student = db_service.get_student_by_rfid(SIM_STUDENT_RFID)
+        submitter = ConsultationSubmitter(args, units, db_service, faculty_ids, student)
+
+    def report(elapsed):
+        stats = fleet.stats
+        print(f"[{elapsed:6.1f}s] connected {fleet.connected_count()}/{len(units)} | published {stats['published']} "
+              f"(changes {stats['changes']}, flaps {stats['flaps']}, heartbeats {stats['heartbeats']}) | "
+              f"requests received {stats['requests_received']} (redelivered {stats['requests_redelivered']}, acks {stats['acks_published']}) | "
+              f"announcements received {stats['announcements_received']}")
+        print(f"          publish->DB     {status_latency.format_summary()}")
+        print(f"          submit->receipt {delivery_latency.format_summary()}")
+
+    print(f"Simulating {len(units)} desk units against {args.broker_host}:{args.broker_port} for {args.duration:.0f}s "
+          f"(status topic {topics['status']}, request topic {topics['requests']}).")
+    if poller:
+        poller.start()
+    if submitter:
+        submitter.start()
+    started = time.monotonic()
+    try:
+        fleet.run(args.duration, report)
+    except KeyboardInterrupt:
+        print("Interrupted.")
+    finally:
+        if submitter:
+            submitter.stop()
+            submitter.join(timeout=5)
+        if poller:
+            time.sleep(args.db_poll_interval * 2) # Let the last publishes reach the DB
+            poller.stop()
+            poller.join(timeout=5)
+        fleet.stop()
+
+    report(time.monotonic() - started)
+    summary = {
+        "units": len(units),
+        "duration_s": time.monotonic() - started,
+        "stats": dict(fleet.stats),
+        "db_pending_unmatched": len(fleet.pending_db),
+        "submitted": submitter.submitted if submitter else 0,
+        "submit_failed": submitter.failed if submitter else 0,
+        "publish_to_db": status_latency.summary() if db_service else None,
+        "submit_to_receipt": delivery_latency.summary(),
+    }
+    if db_service:
+        print(f"Publishes never seen in the DB: {len(fleet.pending_db)} (superseded before the poll: {fleet.stats['db_superseded']}).")
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Summary written to {args.json_out}.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
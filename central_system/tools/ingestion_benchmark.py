@@ -0,0 +1,363 @@
+"""Throughput and latency benchmark for the MQTT status ingestion path, with no external services.
+
+Starts an InProcessBroker, attaches MQTTService (or AsyncMQTTService) to it with an in-memory
+stand-in for DatabaseService, publishes a fixed, seeded sequence of desk unit status messages
+and/or gateway bulk reports, and measures publish -> DB update latency and sustained throughput.
+
+    python -m tools.ingestion_benchmark --messages 20000 --faculty 500
+    python -m tools.ingestion_benchmark --mode bulk --bulk-size 50 --service async
+
+With --consumers N the messages are processed by N MQTTService processes, the way
+status_consumer.py runs them: members of an MQTT v5 shared subscription (--affinity broker, the
+in-process broker assigns members by topic hash) or hash partitions of a regular subscription
+(--affinity client). The report then also counts per-device ordering violations.
+
+    python -m tools.ingestion_benchmark --consumers 4 --messages 40000
+"""
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import multiprocessing
+import random
+import sys
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from utils.latency import LatencyHistogram
+from services.mqtt_service import MQTTService, FACULTY_STATUS_TOPIC_TEMPLATE, FACULTY_BULK_STATUS_TOPIC_TEMPLATE, STATUS_CONSUMER_GROUP
+from services.async_mqtt_service import AsyncMQTTService
+from services.presence_debouncer import PresenceDebouncer
+from tools.inproc_broker import InProcessBroker
+
+
+class InMemoryFacultyDB:
+    """Implements the DatabaseService methods the ingestion path calls and timestamps every update."""
+
+    def __init__(self, ble_ids, histogram):
+        self.rows = {ble_id: {"name": ble_id, "ble_identifier": ble_id, "current_status": "Unavailable"} for ble_id in ble_ids}
+        self.histogram = histogram
+        self.published_at = collections.defaultdict(collections.deque) # ble_id -> publish times, in order
+        self.updates = 0
+        self.last_update = None
+        self.lock = threading.Lock()
+        self.done = threading.Condition(self.lock)
+
+    def expect(self, ble_id, published_at):
+        with self.lock:
+            self.published_at[ble_id].append(published_at)
+
+    def _apply(self, ble_id, new_status, now):
+        row = self.rows.get(ble_id)
+        if row is None:
+            return None
+        row["current_status"] = new_status
+        pending = self.published_at.get(ble_id)
+        if pending:
+            # One publisher connection keeps per-topic order, so updates match publishes FIFO
+            self.histogram.record(now - pending.popleft())
+        self.updates += 1
+        self.last_update = now
+        return row
+
+    def update_faculty_status_by_ble_id(self, ble_identifier, new_status):
+        now = time.perf_counter()
+        with self.lock:
+            row = self._apply(ble_identifier, new_status, now)
+            self.done.notify_all()
+            return dict(row) if row else None
+
+    def update_faculty_status_batch(self, status_updates):
+        now = time.perf_counter()
+        with self.lock:
+            rows = [self._apply(ble_id, status, now) for ble_id, status, _ in status_updates]
+            self.done.notify_all()
+            return [dict(row) for row in rows if row]
+
+    def wait_for(self, count, timeout):
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while self.updates < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.done.wait(remaining)
+        return True
+
+
+class RecordingFacultyDB:
+    """DatabaseService stand-in for consumer processes: records (ble_id, status, wall time) per update.
+
+    Latency is matched in the parent, which knows the publish times; `progress` is a shared
+    counter the parent watches to know when everything has arrived.
+    """
+
+    def __init__(self, progress):
+        self.updates = []
+        self.progress = progress
+
+    def _count(self, count):
+        with self.progress.get_lock():
+            self.progress.value += count
+
+    def update_faculty_status_by_ble_id(self, ble_identifier, new_status):
+        self.updates.append((ble_identifier, new_status, time.time()))
+        self._count(1)
+        return {"name": ble_identifier}
+
+    def update_faculty_status_batch(self, status_updates):
+        now = time.time()
+        self.updates.extend((ble_id, status, now) for ble_id, status, _ in status_updates)
+        self._count(len(status_updates))
+        return [{"ble_identifier": ble_id} for ble_id, _, _ in status_updates]
+
+
+def build_workload(args, ble_ids):
+    """Returns a deterministic list of (topic, payload, [(ble_id, status)]) messages."""
+    rng = random.Random(args.seed)
+    status = {ble_id: "Unavailable" for ble_id in ble_ids}
+    workload = []
+    for index in range(args.messages):
+        bulk = args.mode == "bulk" or (args.mode == "mixed" and index % 2)
+        if bulk:
+            entries = []
+            for ble_id in rng.sample(ble_ids, min(args.bulk_size, len(ble_ids))):
+                status[ble_id] = "Available" if status[ble_id] == "Unavailable" else "Unavailable"
+                entries.append({"ble_id": ble_id, "status": status[ble_id], "rssi": rng.randint(-90, -40), "ts": 1700000000 + index})
+            gateway = f"GW_{index % args.gateways:02d}"
+            workload.append((FACULTY_BULK_STATUS_TOPIC_TEMPLATE.format(gateway), json.dumps(entries), [(e["ble_id"], e["status"]) for e in entries]))
+        else:
+            ble_id = ble_ids[index % len(ble_ids)]
+            status[ble_id] = "Available" if status[ble_id] == "Unavailable" else "Unavailable"
+            workload.append((FACULTY_STATUS_TOPIC_TEMPLATE.format(ble_id), "{\"status\": \"%s\"}" % status[ble_id], [(ble_id, status[ble_id])]))
+    return workload
+
+
+def start_service(args, db, broker):
+    """Starts the service under test and returns (service, stop callable)."""
+    # Every workload message toggles a status, so hysteresis is disabled to measure the raw path
+    passthrough = PresenceDebouncer(rules={}, suppress_repeats=False)
+    if args.service == "thread":
+        service = MQTTService(db, client_id="Benchmark_Central", spool_path=None, broker_host=broker.host, broker_port=broker.port,
+                               presence_debouncer=passthrough)
+        service.start()
+        return service, service.stop
+
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, name="BenchmarkLoop", daemon=True)
+    thread.start()
+    service = AsyncMQTTService(db, client_id="Benchmark_Central", spool_path=None, loop=loop, broker_host=broker.host, broker_port=broker.port,
+                               presence_debouncer=passthrough)
+
+    async def _start():
+        service.start()
+
+    async def _stop():
+        service.stop()
+        await service.wait_closed()
+
+    asyncio.run_coroutine_threadsafe(_start(), loop).result()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(_stop(), loop).result(timeout=5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+    return service, stop
+
+
+def run_benchmark(args):
+    ble_ids = [f"BENCH-{index:05d}" for index in range(args.faculty)]
+    histogram = LatencyHistogram()
+    db = InMemoryFacultyDB(ble_ids, histogram)
+    workload = build_workload(args, ble_ids)
+    expected_updates = sum(len(updates) for _, _, updates in workload)
+
+    with InProcessBroker() as broker:
+        service, stop_service = start_service(args, db, broker)
+        deadline = time.monotonic() + 10
+        while not service.is_connected() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.2) # Let the SUBSCRIBE reach the broker
+
+        publisher = mqtt.Client(client_id="Benchmark_Publisher")
+        publisher.connect(broker.host, broker.port)
+        publisher.loop_start()
+        interval = 1.0 / args.rate if args.rate else 0.0
+        started = time.perf_counter()
+        for index, (topic, payload, updates) in enumerate(workload):
+            if interval:
+                delay = started + index * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            now = time.perf_counter()
+            for ble_id, _ in updates:
+                db.expect(ble_id, now)
+            publisher.publish(topic, payload, qos=args.qos)
+        publish_time = time.perf_counter() - started
+        completed = db.wait_for(expected_updates, args.timeout)
+        publisher.disconnect()
+        publisher.loop_stop()
+        stop_service()
+
+    elapsed = (db.last_update or time.perf_counter()) - started
+    return {
+        "service": args.service,
+        "mode": args.mode,
+        "messages": len(workload),
+        "status_updates": db.updates,
+        "expected_updates": expected_updates,
+        "completed": completed,
+        "publish_s": publish_time,
+        "elapsed_s": elapsed,
+        "messages_per_s": len(workload) / elapsed if elapsed > 0 else None,
+        "updates_per_s": db.updates / elapsed if elapsed > 0 else None,
+        "latency": histogram.summary((50, 90, 99, 99.9)),
+        "latency_text": histogram.format_summary((50, 90, 99, 99.9)),
+    }
+
+
+def _consumer_process(args, index, progress, ready, stop_event, results):
+    """One MQTTService consumer process for the multi-process benchmark."""
+    logging.getLogger().setLevel(args.log_level.upper())
+    db = RecordingFacultyDB(progress)
+    client_affinity = args.affinity == "client"
+    service = MQTTService(db, client_id=f"Benchmark_Consumer_{index}", spool_path=None,
+                          broker_host=args.broker_host, broker_port=args.broker_port,
+                          presence_debouncer=PresenceDebouncer(rules={}, suppress_repeats=False),
+                          handle_acks=False,
+                          shared_group=None if client_affinity else STATUS_CONSUMER_GROUP,
+                          partition=(index, args.consumers) if client_affinity else None)
+    service.start()
+    deadline = time.monotonic() + 10
+    while not service.is_connected() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.2) # Let the SUBSCRIBE reach the broker
+    ready.put(index)
+    stop_event.wait()
+    service.stop()
+    results.put((index, db.updates))
+
+
+def run_multiprocess_benchmark(args):
+    ble_ids = [f"BENCH-{index:05d}" for index in range(args.faculty)]
+    workload = build_workload(args, ble_ids)
+    expected_updates = sum(len(updates) for _, _, updates in workload)
+    histogram = LatencyHistogram()
+    context = multiprocessing.get_context("spawn") # Fresh interpreters, like separate status_consumer.py processes
+    progress = context.Value('i', 0)
+    ready, results, stop_event = context.Queue(), context.Queue(), context.Event()
+
+    with InProcessBroker() as broker:
+        args.broker_host, args.broker_port = broker.host, broker.port
+        consumers = [context.Process(target=_consumer_process, args=(args, index, progress, ready, stop_event, results), daemon=True)
+                     for index in range(args.consumers)]
+        for process in consumers:
+            process.start()
+        for _ in consumers:
+            ready.get(timeout=30)
+
+        publisher = mqtt.Client(client_id="Benchmark_Publisher")
+        publisher.connect(broker.host, broker.port)
+        publisher.loop_start()
+        expected = collections.defaultdict(collections.deque) # ble_id -> (status, publish wall time), in order
+        interval = 1.0 / args.rate if args.rate else 0.0
+        started = time.time()
+        for index, (topic, payload, updates) in enumerate(workload):
+            if interval:
+                delay = started + index * interval - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            now = time.time()
+            for ble_id, status in updates:
+                expected[ble_id].append((status, now))
+            publisher.publish(topic, payload, qos=args.qos)
+        publish_time = time.time() - started
+        deadline = time.monotonic() + args.timeout
+        while progress.value < expected_updates and time.monotonic() < deadline:
+            time.sleep(0.01)
+        completed = progress.value >= expected_updates
+        publisher.disconnect()
+        publisher.loop_stop()
+        stop_event.set()
+        per_consumer = dict(results.get(timeout=30) for _ in consumers)
+        for process in consumers:
+            process.join(timeout=10)
+
+    # Every device's updates should arrive in publish order; match them FIFO per device
+    last_update, out_of_order, per_consumer_updates = started, 0, {}
+    for index, updates in sorted(per_consumer.items()):
+        per_consumer_updates[index] = len(updates)
+        for ble_id, status, updated_at in updates:
+            pending = expected.get(ble_id)
+            if not pending:
+                out_of_order += 1 # Processed by more than one consumer, more updates than publishes
+                continue
+            expected_status, published_at = pending.popleft()
+            if status != expected_status:
+                out_of_order += 1
+            histogram.record(updated_at - published_at)
+            last_update = max(last_update, updated_at)
+
+    updates_total = sum(per_consumer_updates.values())
+    elapsed = last_update - started
+    return {
+        "service": f"thread x{args.consumers} ({args.affinity} affinity)",
+        "mode": args.mode,
+        "messages": len(workload),
+        "status_updates": updates_total,
+        "expected_updates": expected_updates,
+        "completed": completed,
+        "out_of_order": out_of_order,
+        "per_consumer_updates": per_consumer_updates,
+        "publish_s": publish_time,
+        "elapsed_s": elapsed,
+        "messages_per_s": len(workload) / elapsed if elapsed > 0 else None,
+        "updates_per_s": updates_total / elapsed if elapsed > 0 else None,
+        "latency": histogram.summary((50, 90, 99, 99.9)),
+        "latency_text": histogram.format_summary((50, 90, 99, 99.9)),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark MQTT status ingestion against an in-process broker.")
+    parser.add_argument("--service", choices=["thread", "async"], default="thread")
+    parser.add_argument("--consumers", type=int, default=1, help="consumer processes (threaded MQTTService each)")
+    parser.add_argument("--affinity", choices=["broker", "client"], default="broker",
+                        help="with --consumers: shared subscription (broker) or hash partitions (client)")
+    parser.add_argument("--mode", choices=["single", "bulk", "mixed"], default="single")
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--faculty", type=int, default=500)
+    parser.add_argument("--bulk-size", type=int, default=50, help="entries per gateway report")
+    parser.add_argument("--gateways", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=0.0, help="messages per second (0 = as fast as possible)")
+    parser.add_argument("--qos", type=int, choices=[0, 1], default=0)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--json-out")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger().setLevel(args.log_level.upper())
+    result = run_multiprocess_benchmark(args) if args.consumers > 1 else run_benchmark(args)
+    print(f"{result['service']}/{result['mode']}: {result['messages']} messages, "
+          f"{result['status_updates']}/{result['expected_updates']} status updates in {result['elapsed_s']:.2f}s "
+          f"({result['messages_per_s']:.0f} msg/s, {result['updates_per_s']:.0f} updates/s)")
+    print(f"publish->DB latency: {result['latency_text']}")
+    if "out_of_order" in result:
+        print(f"per-consumer updates: {result['per_consumer_updates']}, per-device ordering violations: {result['out_of_order']}")
+    if not result["completed"]:
+        print("WARNING: not all updates arrived before the timeout.")
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump({k: v for k, v in result.items() if k != "latency_text"}, f, indent=2)
+    return 0 if result["completed"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,520 @@
+"""Minimal in-process MQTT 3.1.1/5 broker for tests, benchmarks and development without Mosquitto.
+
+Implements the subset ConsultEase uses: QoS 0 and 1, retained messages, `+`/`#` wildcard
+subscriptions, keepalive, last will and shared subscriptions (`$share/<group>/<filter>`). MQTT 5
+properties are accepted and ignored. Sessions are always clean (nothing is stored for
+disconnected clients) and QoS 2 is not supported. The broker runs on its own thread and
+listens on a real TCP port, so MQTTService attaches to it like any other broker:
+
+    broker = InProcessBroker()  # port=0 picks a free port
+    broker.start()
+    service = MQTTService(db_service, broker_host=broker.host, broker_port=broker.port)
+
+Run it standalone with `python -m tools.inproc_broker --port 1883`.
+"""
+import argparse
+import collections
+import logging
+import selectors
+import socket
+import struct
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Control packet types (upper nibble of the fixed header)
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+CONNACK_ACCEPTED = 0
+CONNACK_BAD_PROTOCOL = 1
+
+MQTT_V311, MQTT_V5 = 4, 5
+SHARED_PREFIX = "$share/"
+# How a message is assigned to one member of a shared subscription group:
+#   hash_topic  - by a hash of the topic, so one device's messages always reach the same member
+#                 (in order) while the group is stable; EMQX's shared_subscription_strategy of the same name
+#   round_robin - members in turn, like Mosquitto
+SHARED_STRATEGIES = ("hash_topic", "round_robin")
+
+
+def topic_matches(topic_filter, topic):
+    """MQTT 3.1.1 topic filter matching, including `+`, `#` and the `$` topic rule."""
+    filter_parts = topic_filter.split('/')
+    topic_parts = topic.split('/')
+    if topic.startswith('$') and filter_parts[0] in ('+', '#'):
+        return False
+    for index, part in enumerate(filter_parts):
+        if part == '#':
+            return True
+        if index >= len(topic_parts):
+            return False
+        if part != '+' and part != topic_parts[index]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def parse_shared_filter(topic_filter):
+    """Splits `$share/<group>/<filter>` into (group, filter); returns None for a regular filter."""
+    if not topic_filter.startswith(SHARED_PREFIX):
+        return None
+    group, _, inner_filter = topic_filter[len(SHARED_PREFIX):].partition('/')
+    if not group or not inner_filter:
+        return None
+    return group, inner_filter
+
+
+def _encode_length(length):
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def _encode_string(value):
+    data = value.encode('utf-8') if isinstance(value, str) else value
+    return struct.pack("!H", len(data)) + data
+
+
+def _packet(packet_type, flags, body):
+    return bytes([(packet_type << 4) | flags]) + _encode_length(len(body)) + body
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def u8(self):
+        self.pos += 1
+        return self.data[self.pos - 1]
+
+    def u16(self):
+        self.pos += 2
+        return struct.unpack_from("!H", self.data, self.pos - 2)[0]
+
+    def binary(self):
+        length = self.u16()
+        self.pos += length
+        return bytes(self.data[self.pos - length:self.pos])
+
+    def string(self):
+        return self.binary().decode('utf-8')
+
+    def varint(self):
+        value, multiplier = 0, 1
+        while True:
+            byte = self.u8()
+            value += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                return value
+
+    def skip_properties(self):
+        """Skips an MQTT 5 property block; the broker does not act on any property."""
+        length = self.varint() # Read first: `self.pos += self.varint()` would lose the length bytes
+        self.pos += length
+
+    def rest(self):
+        return bytes(self.data[self.pos:])
+
+    def remaining(self):
+        return len(self.data) - self.pos
+
+
+class _Session:
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+        self.client_id = None
+        self.protocol_level = MQTT_V311
+        self.subscriptions = {} # topic filter -> granted QoS (shared filters are kept in full)
+        self.will = None        # (topic, payload, qos, retain)
+        self.keepalive = 0
+        self.last_rx = time.monotonic()
+        self.next_mid = 0
+        self.closed = False
+
+    def allocate_mid(self):
+        self.next_mid = self.next_mid % 65535 + 1
+        return self.next_mid
+
+
+class InProcessBroker:
+    def __init__(self, host="127.0.0.1", port=0, shared_strategy="hash_topic"):
+        if shared_strategy not in SHARED_STRATEGIES:
+            raise ValueError(f"shared_strategy must be one of {SHARED_STRATEGIES}")
+        self.host = host
+        self.port = port
+        self.shared_strategy = shared_strategy
+        self.stats = collections.Counter()
+        self._sessions = {}       # socket -> _Session
+        self._client_ids = {}     # client id -> _Session
+        self._retained = {}       # topic -> (payload, qos)
+        self._shared = {}         # (group, filter) -> [[session, granted QoS], ...] in subscription order
+        self._shared_turn = collections.Counter() # (group, filter) -> next member for round_robin
+        self._selector = None
+        self._listener = None
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._pending_calls = collections.deque() # (callback, args, done event) run on the broker thread
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._started = threading.Event()
+
+    # --- Lifecycle ---
+
+    def start(self):
+        """Binds the listening socket and starts the broker thread. Returns once it accepts connections."""
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((self.host, self.port))
+        self._listener.listen(128)
+        self._listener.setblocking(False)
+        self.port = self._listener.getsockname()[1]
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._listener, selectors.EVENT_READ, None)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+        self._thread = threading.Thread(target=self._run, name="InProcessBroker", daemon=True)
+        self._thread.start()
+        self._started.wait()
+        logger.info(f"InProcessBroker: Listening on {self.host}:{self.port}")
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        self._wakeup_w.send(b"\0")
+        if self._thread:
+            self._thread.join(timeout=5)
+        logger.info("InProcessBroker: Stopped.")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def disconnect_client(self, client_id):
+        """Drops a client's connection without a DISCONNECT, as a network failure would (its will is sent)."""
+        self._call_on_broker_thread(self._drop_client, client_id)
+
+    def _call_on_broker_thread(self, callback, *args):
+        done = threading.Event()
+        self._pending_calls.append((callback, args, done))
+        self._wakeup_w.send(b"\0")
+        done.wait(timeout=5)
+
+    def _run(self):
+        self._started.set()
+        while not self._stop_event.is_set():
+            for key, mask in self._selector.select(timeout=1.0):
+                if key.fileobj is self._listener:
+                    self._accept()
+                elif key.fileobj is self._wakeup_r:
+                    self._wakeup_r.recv(4096)
+                else:
+                    session = key.data
+                    if mask & selectors.EVENT_READ:
+                        self._read(session)
+                    if mask & selectors.EVENT_WRITE and not session.closed:
+                        self._flush(session)
+            while self._pending_calls:
+                callback, args, done = self._pending_calls.popleft()
+                callback(*args)
+                done.set()
+            self._check_keepalives()
+        for session in list(self._sessions.values()):
+            self._close(session, send_will=False)
+        self._selector.close()
+        self._listener.close()
+
+    # --- Connections ---
+
+    def _accept(self):
+        try:
+            sock, address = self._listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        session = _Session(sock, address)
+        self._sessions[sock] = session
+        self._selector.register(sock, selectors.EVENT_READ, session)
+
+    def _drop_client(self, client_id):
+        session = self._client_ids.get(client_id)
+        if session:
+            self._close(session, send_will=True)
+
+    def _close(self, session, send_will):
+        if session.closed:
+            return
+        session.closed = True
+        try:
+            self._selector.unregister(session.sock)
+        except (KeyError, ValueError):
+            pass
+        session.sock.close()
+        self._sessions.pop(session.sock, None)
+        if session.client_id and self._client_ids.get(session.client_id) is session:
+            del self._client_ids[session.client_id]
+        for topic_filter in list(session.subscriptions):
+            self._leave_shared(session, topic_filter)
+        if send_will and session.will:
+            topic, payload, qos, retain = session.will
+            self.stats["wills_published"] += 1
+            self._route(topic, payload, qos, retain)
+
+    def _check_keepalives(self):
+        now = time.monotonic()
+        for session in list(self._sessions.values()):
+            # The spec allows one and a half keepalive periods of silence
+            if session.keepalive and now - session.last_rx > session.keepalive * 1.5:
+                logger.info(f"InProcessBroker: Keepalive expired for '{session.client_id}'.")
+                self._close(session, send_will=True)
+
+    def _send(self, session, data):
+        if session.closed:
+            return
+        was_empty = not session.outbuf
+        session.outbuf += data
+        if was_empty:
+            self._flush(session)
+
+    def _flush(self, session):
+        try:
+            sent = session.sock.send(session.outbuf)
+            del session.outbuf[:sent]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._close(session, send_will=True)
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if session.outbuf else 0)
+        self._selector.modify(session.sock, events, session)
+
+    def _read(self, session):
+        try:
+            data = session.sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._close(session, send_will=True)
+            return
+        session.last_rx = time.monotonic()
+        session.inbuf += data
+        while not session.closed:
+            packet = self._take_packet(session)
+            if packet is None:
+                return
+            try:
+                self._handle_packet(session, *packet)
+            except (IndexError, struct.error, UnicodeDecodeError) as e:
+                logger.warning(f"InProcessBroker: Malformed packet from '{session.client_id}': {e}")
+                self._close(session, send_will=True)
+
+    @staticmethod
+    def _take_packet(session):
+        buf = session.inbuf
+        if len(buf) < 2:
+            return None
+        length, multiplier, pos = 0, 1, 1
+        while True:
+            if pos >= len(buf):
+                return None
+            byte = buf[pos]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            pos += 1
+            if not byte & 0x80:
+                break
+        if len(buf) < pos + length:
+            return None
+        header = buf[0]
+        body = bytes(buf[pos:pos + length])
+        del buf[:pos + length]
+        return header >> 4, header & 0x0F, body
+
+    # --- Packet handlers ---
+
+    def _handle_packet(self, session, packet_type, flags, body):
+        if session.client_id is None and packet_type != CONNECT:
+            self._close(session, send_will=False) # First packet must be CONNECT
+            return
+        if packet_type == CONNECT:
+            self._handle_connect(session, body)
+        elif packet_type == PUBLISH:
+            self._handle_publish(session, flags, body)
+        elif packet_type == PUBACK:
+            pass # Outgoing QoS 1 is fire-and-forget over loopback; nothing to retry
+        elif packet_type == SUBSCRIBE:
+            self._handle_subscribe(session, body)
+        elif packet_type == UNSUBSCRIBE:
+            self._handle_unsubscribe(session, body)
+        elif packet_type == PINGREQ:
+            self._send(session, _packet(PINGRESP, 0, b""))
+        elif packet_type == DISCONNECT:
+            self._close(session, send_will=False)
+        else:
+            logger.warning(f"InProcessBroker: Unsupported packet type {packet_type} from '{session.client_id}'.")
+            self._close(session, send_will=True)
+
+    def _handle_connect(self, session, body):
+        reader = _Reader(body)
+        protocol_name = reader.string()
+        protocol_level = reader.u8()
+        connect_flags = reader.u8()
+        session.keepalive = reader.u16()
+        if (protocol_name, protocol_level) not in (("MQTT", MQTT_V311), ("MQTT", MQTT_V5), ("MQIsdp", 3)):
+            self._send(session, _packet(CONNACK, 0, bytes([0, CONNACK_BAD_PROTOCOL])))
+            self._close(session, send_will=False)
+            return
+        session.protocol_level = protocol_level
+        if protocol_level == MQTT_V5:
+            reader.skip_properties()
+        client_id = reader.string() or f"inproc-{id(session):x}"
+        if connect_flags & 0x04: # Will flag
+            if protocol_level == MQTT_V5:
+                reader.skip_properties()
+            will_topic = reader.string()
+            will_payload = reader.binary()
+            session.will = (will_topic, will_payload, (connect_flags >> 3) & 0x03, bool(connect_flags & 0x20))
+        # Username and password are accepted without checking
+
+        existing = self._client_ids.get(client_id)
+        if existing:
+            self._close(existing, send_will=True) # Spec: the older connection with the same id is dropped
+        session.client_id = client_id
+        self._client_ids[client_id] = session
+        self.stats["connects"] += 1
+        connack = bytes([0, CONNACK_ACCEPTED]) + (b"\0" if protocol_level == MQTT_V5 else b"") # Empty property block
+        self._send(session, _packet(CONNACK, 0, connack))
+
+    def _handle_publish(self, session, flags, body):
+        qos = (flags >> 1) & 0x03
+        retain = bool(flags & 0x01)
+        reader = _Reader(body)
+        topic = reader.string()
+        if qos == 2:
+            logger.warning(f"InProcessBroker: QoS 2 publish from '{session.client_id}' is not supported.")
+            self._close(session, send_will=True)
+            return
+        mid = reader.u16() if qos else None
+        if session.protocol_level == MQTT_V5:
+            reader.skip_properties()
+        payload = reader.rest()
+        self.stats["received"] += 1
+        self._route(topic, payload, qos, retain)
+        if qos == 1:
+            self._send(session, _packet(PUBACK, 0, struct.pack("!H", mid)))
+
+    def _route(self, topic, payload, qos, retain):
+        if retain:
+            if payload:
+                self._retained[topic] = (payload, qos)
+            else:
+                self._retained.pop(topic, None) # Empty retained payload clears the topic
+        for session in list(self._sessions.values()):
+            granted = None
+            for topic_filter, sub_qos in session.subscriptions.items():
+                if not topic_filter.startswith(SHARED_PREFIX) and topic_matches(topic_filter, topic):
+                    granted = sub_qos if granted is None else max(granted, sub_qos)
+            if granted is not None:
+                self._deliver(session, topic, payload, min(qos, granted), retain=False)
+        # Each matching shared group gets one copy, delivered to one of its members
+        for (group, topic_filter), members in self._shared.items():
+            if members and topic_matches(topic_filter, topic):
+                if self.shared_strategy == "hash_topic":
+                    index = zlib.crc32(topic.encode('utf-8')) % len(members)
+                else:
+                    index = self._shared_turn[(group, topic_filter)] % len(members)
+                    self._shared_turn[(group, topic_filter)] += 1
+                session, sub_qos = members[index]
+                self.stats["shared_delivered"] += 1
+                self._deliver(session, topic, payload, min(qos, sub_qos), retain=False)
+
+    def _deliver(self, session, topic, payload, qos, retain):
+        flags = (qos << 1) | (1 if retain else 0)
+        body = _encode_string(topic)
+        if qos:
+            body += struct.pack("!H", session.allocate_mid())
+        if session.protocol_level == MQTT_V5:
+            body += b"\0" # Empty property block
+        self.stats["delivered"] += 1
+        self._send(session, _packet(PUBLISH, flags, body + payload))
+
+    def _handle_subscribe(self, session, body):
+        reader = _Reader(body)
+        mid = reader.u16()
+        if session.protocol_level == MQTT_V5:
+            reader.skip_properties()
+        granted = []
+        new_filters = []
+        while reader.remaining():
+            topic_filter = reader.string()
+            qos = min(reader.u8() & 0x03, 1) # MQTT 5 subscription options beyond QoS are ignored
+            self._leave_shared(session, topic_filter) # Re-subscribing replaces the old grant
+            session.subscriptions[topic_filter] = qos
+            granted.append(qos)
+            shared = parse_shared_filter(topic_filter)
+            if shared:
+                self._shared.setdefault(shared, []).append([session, qos])
+            else:
+                new_filters.append((topic_filter, qos))
+        properties = b"\0" if session.protocol_level == MQTT_V5 else b""
+        self._send(session, _packet(SUBACK, 0, struct.pack("!H", mid) + properties + bytes(granted)))
+        # Retained messages matching a new (non-shared) subscription are sent with the retain flag set
+        for topic, (payload, retained_qos) in self._retained.items():
+            for topic_filter, qos in new_filters:
+                if topic_matches(topic_filter, topic):
+                    self._deliver(session, topic, payload, min(retained_qos, qos), retain=True)
+                    break
+
+    def _handle_unsubscribe(self, session, body):
+        reader = _Reader(body)
+        mid = reader.u16()
+        if session.protocol_level == MQTT_V5:
+            reader.skip_properties()
+        count = 0
+        while reader.remaining():
+            topic_filter = reader.string()
+            self._leave_shared(session, topic_filter)
+            session.subscriptions.pop(topic_filter, None)
+            count += 1
+        # MQTT 5 UNSUBACK carries a property block and one reason code (0 = success) per filter
+        extra = b"\0" + bytes(count) if session.protocol_level == MQTT_V5 else b""
+        self._send(session, _packet(UNSUBACK, 0, struct.pack("!H", mid) + extra))
+
+    def _leave_shared(self, session, topic_filter):
+        shared = parse_shared_filter(topic_filter)
+        if not shared or topic_filter not in session.subscriptions:
+            return
+        members = [member for member in self._shared.get(shared, []) if member[0] is not session]
+        if members:
+            self._shared[shared] = members
+        else:
+            self._shared.pop(shared, None)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the in-process MQTT broker standalone.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--shared-strategy", choices=SHARED_STRATEGIES, default="hash_topic")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    broker = InProcessBroker(args.host, args.port, args.shared_strategy).start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        broker.stop()
@@ -0,0 +1,207 @@
+"""Records RFID reader input and replays it through RFIDService and the login path, without a card.
+
+`record` captures the raw input of one or more readers (serial bytes, evdev key events) with
+timestamps, the same as setting RFID_RECORD_FILE in main.py:
+
+    python -m tools.rfid_replay record scans.jsonl --serial /dev/ttyUSB0 --duration 120
+    python -m tools.rfid_replay record scans.jsonl --serial auto --evdev-keyword RFID
+
+`replay` feeds a recording back through ReplayTagReaders into a real RFIDService, whose tags go
+to a real AuthenticationController backed by an in-memory student table, and reports the
+scan-to-login latency: from the first byte (or key event) of a tag reaching the reader to the
+login screen being told the outcome. --speed 10 plays the recording ten times faster (duplicate
+suppression windows are scaled with it), --speed 0 as fast as possible.
+
+    python -m tools.rfid_replay replay scans.jsonl --speed 0 --db-latency 5
+"""
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from utils.latency import LatencyHistogram
+from services.rfid_service import RFIDService, RFID_DUPLICATE_WINDOW, RFID_CAPTURE_DUPLICATE_WINDOW
+from services.rfid_readers import SerialTagReader, EvdevTagReader
+from services.rfid_recording import replay_readers
+from controllers.authentication_controller import AuthenticationController
+
+
+class InMemoryStudentDB:
+    """Implements DatabaseService.get_student_by_rfid: every tag is a student unless listed in `unknown_tags`."""
+
+    def __init__(self, unknown_tags=(), latency=0.0):
+        self.unknown_tags = set(unknown_tags)
+        self.latency = latency
+        self.lookups = 0
+        self.last_tag = None
+
+    def get_student_by_rfid(self, rfid_tag):
+        self.lookups += 1
+        self.last_tag = rfid_tag
+        if self.latency:
+            time.sleep(self.latency)
+        if rfid_tag in self.unknown_tags:
+            return None
+        return {"student_id": self.lookups, "name": f"Student {rfid_tag}", "rfid_tag": rfid_tag}
+
+
+class LoginOutcomeRecorder(QObject):
+    """Stands in for AuthenticationScreen and times each login outcome against the tag's first byte."""
+
+    request_rfid_scan_start = pyqtSignal()
+    request_rfid_scan_stop = pyqtSignal()
+
+    def __init__(self, readers, db):
+        super().__init__()
+        self.readers = readers
+        self.db = db
+        self.latency = LatencyHistogram()
+        self.outcomes = {"success": 0, "failed": 0}
+        self._lock = threading.Lock()
+
+    def set_status_message(self, message, is_error=False, is_success=False, duration_ms=0):
+        pass
+
+    def _on_login_success(self, student_data):
+        self._record("success")
+
+    def _on_login_failed(self, reason=""):
+        self._record("failed")
+
+    def _record(self, outcome):
+        now = time.monotonic()
+        # The controller handles one tag at a time on the RFID I/O thread: the tag it just looked
+        # up, and that tag's newest read is the one being answered
+        rfid_tag = self.db.last_tag
+        first_byte_at = max(reader.first_byte_at[rfid_tag] for reader in self.readers if rfid_tag in reader.first_byte_at)
+        self.latency.record(now - first_byte_at)
+        with self._lock:
+            self.outcomes[outcome] += 1
+
+    def answered(self):
+        with self._lock:
+            return sum(self.outcomes.values())
+
+
+def run_replay(args):
+    readers = replay_readers(args.recording, speed=args.speed)
+    if not readers:
+        raise ValueError(f"{args.recording} contains no reader input")
+    scale = 1.0 / args.speed if args.speed > 0 else 0.0
+    rfid_service = RFIDService(readers=readers, duplicate_window=RFID_DUPLICATE_WINDOW * scale,
+                               capture_duplicate_window=RFID_CAPTURE_DUPLICATE_WINDOW * scale, hotplug=False)
+    db = InMemoryStudentDB(unknown_tags=args.unknown_tag, latency=args.db_latency / 1000.0)
+    view = LoginOutcomeRecorder(readers, db)
+    AuthenticationController(rfid_service=rfid_service, db_service=db, auth_view=view)
+
+    def replayed():
+        # The end marker can be read together with the last tags, whose logins then still run
+        if not all(reader.finished.is_set() for reader in readers):
+            return False
+        read_stats = rfid_service.get_read_stats()
+        delivered = read_stats.get("delivered", 0)
+        return (delivered + read_stats.get("suppressed", 0) >= sum(reader.tags_read for reader in readers)
+                and view.answered() >= delivered)
+
+    started = time.monotonic()
+    rfid_service.start_scanning()
+    deadline = started + args.timeout
+    completed = replayed()
+    while not completed and time.monotonic() < deadline:
+        time.sleep(0.01)
+        completed = replayed()
+    elapsed = time.monotonic() - started
+    rfid_service.close()
+
+    read_stats = rfid_service.get_read_stats()
+    return {
+        "recording": args.recording,
+        "speed": args.speed,
+        "readers": {reader.name: reader.source_kind for reader in readers},
+        "completed": completed,
+        "elapsed_s": elapsed,
+        "tags_delivered": read_stats.get("delivered", 0),
+        "duplicates_suppressed": read_stats.get("suppressed", 0),
+        "logins": dict(view.outcomes),
+        "scan_to_login": view.latency.summary((50, 90, 99, 99.9)),
+        "scan_to_login_text": view.latency.format_summary((50, 90, 99, 99.9)),
+        "scan_to_callback": {name: stats["latency"] for name, stats in rfid_service.get_reader_stats().items()},
+    }
+
+
+def run_record(args):
+    readers = [SerialTagReader(f"serial-{index}", port=None if port == "auto" else port) for index, port in enumerate(args.serial, 1)]
+    readers += [EvdevTagReader(f"evdev-{index}", path=path) for index, path in enumerate(args.evdev, 1)]
+    readers += [EvdevTagReader(f"evdev-kw-{index}", name_keyword=keyword) for index, keyword in enumerate(args.evdev_keyword, 1)]
+    if not readers:
+        raise ValueError("give at least one of --serial, --evdev, --evdev-keyword")
+    rfid_service = RFIDService(readers=readers)
+    if rfid_service.simulation_mode:
+        raise RuntimeError("none of the readers can be used")
+    rfid_service.register_rfid_callback(lambda tag, reader_name: print(f"{reader_name}: {tag}"), with_reader=True)
+    rfid_service.start_recording(args.recording)
+    rfid_service.start_scanning()
+    print(f"Recording to {args.recording}" + (f" for {args.duration:g}s" if args.duration else "") + "; Ctrl-C stops.")
+    try:
+        if args.duration:
+            time.sleep(args.duration)
+        else:
+            threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    entries = rfid_service.recorder.entries
+    rfid_service.close()
+    print(f"{entries} entries recorded; reader stats: {rfid_service.get_read_stats()}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Record RFID reader input, or replay a recording through the login path.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record = commands.add_parser("record", help="capture raw reader input to a file")
+    record.add_argument("recording")
+    record.add_argument("--serial", action="append", default=[], help="serial port, or 'auto' to find the reader by VID:PID")
+    record.add_argument("--evdev", action="append", default=[], help="evdev device path")
+    record.add_argument("--evdev-keyword", action="append", default=[], help="evdev device name keyword")
+    record.add_argument("--duration", type=float, default=0.0, help="seconds (0 = until Ctrl-C)")
+
+    replay = commands.add_parser("replay", help="replay a recording and report scan-to-login latency")
+    replay.add_argument("recording")
+    replay.add_argument("--speed", type=float, default=1.0, help="playback speed factor (0 = as fast as possible)")
+    replay.add_argument("--db-latency", type=float, default=0.0, help="simulated student lookup time, in ms")
+    replay.add_argument("--unknown-tag", action="append", default=[], help="tag to reject as unregistered")
+    replay.add_argument("--timeout", type=float, default=600.0)
+    replay.add_argument("--json-out")
+
+    record.add_argument("--log-level", default="WARNING")
+    replay.add_argument("--log-level", default="ERROR", help="the login path warns about every rejected tag")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger().setLevel(args.log_level.upper())
+    if args.command == "record":
+        run_record(args)
+        return 0
+
+    result = run_replay(args)
+    print(f"Replayed {args.recording} ({', '.join(f'{name}: {kind}' for name, kind in result['readers'].items())}) "
+          f"at {f'{args.speed:g}x' if args.speed else 'full'} speed in {result['elapsed_s']:.2f}s: {result['tags_delivered']} tags, "
+          f"{result['logins']['success']} logins, {result['logins']['failed']} rejected, "
+          f"{result['duplicates_suppressed']} duplicates suppressed")
+    print(f"scan->login latency: {result['scan_to_login_text']}")
+    if not result["completed"]:
+        print("WARNING: the replay did not finish before the timeout.")
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump({k: v for k, v in result.items() if k != "scan_to_login_text"}, f, indent=2)
+    return 0 if result["completed"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,24 @@
+import random
+
+
+class ExponentialBackoff:
+    """Jittered exponential backoff for reconnect loops.
+
+    Each call to next_delay() doubles the ceiling (up to max_delay) and picks a random
+    delay between min_delay and that ceiling, so many clients restarting together
+    (e.g. after a broker restart) do not reconnect in lockstep.
+    """
+
+    def __init__(self, min_delay=0.5, max_delay=30.0, factor=2.0):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.attempts = 0
+
+    def next_delay(self):
+        ceiling = min(self.max_delay, self.min_delay * (self.factor ** self.attempts))
+        self.attempts += 1
+        return random.uniform(self.min_delay, ceiling)
+
+    def reset(self):
+        self.attempts = 0
@@ -0,0 +1,74 @@
+import hashlib
+import math
+import threading
+
+
+class BloomFilter:
+    """Set membership test that can answer "definitely not present" without storing the items.
+
+    `capacity` items at `error_rate` false positives size the bit array
+    (m = -n ln p / ln^2 2 bits, k = m/n ln 2 hashes). The k bit positions come from one 128-bit
+    BLAKE2b digest split into two halves (double hashing), so a lookup costs a hash and k bit
+    tests. Items cannot be removed; a filter that has taken in removed or more than `capacity`
+    items is rebuilt with from_items(). Lookups need no lock, since bits only ever go from 0 to 1.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.num_bits = max(64, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._lock = threading.Lock() # add() is read-modify-write on bytes another add() may share
+        self.count = 0 # Items that set at least one new bit, i.e. an estimate of distinct items added
+
+    @classmethod
+    def from_items(cls, items, error_rate=0.001, headroom=1.5, min_capacity=1024):
+        """Builds a filter sized for len(items) * headroom, so later add()s do not overfill it at once."""
+        items = list(items)
+        bloom = cls(max(min_capacity, math.ceil(len(items) * headroom)), error_rate)
+        for item in items:
+            bloom.add(item)
+        return bloom
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1 # Odd, so the k positions differ
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        positions = self._positions(item)
+        added = False
+        with self._lock:
+            for position in positions:
+                mask = 1 << (position & 7)
+                if not self._bits[position >> 3] & mask:
+                    self._bits[position >> 3] |= mask
+                    added = True
+            if added:
+                self.count += 1
+
+    def __contains__(self, item):
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def is_full(self):
+        return self.count >= self.capacity
+
+    def fill_ratio(self):
+        """Fraction of bits set."""
+        return bin(int.from_bytes(self._bits, "little")).count("1") / self.num_bits
+
+    def false_positive_rate(self):
+        """Current chance that an item never added tests as present: fill_ratio ** num_hashes."""
+        return self.fill_ratio() ** self.num_hashes
+
+    def size_bytes(self):
+        return len(self._bits)
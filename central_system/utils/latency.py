@@ -0,0 +1,72 @@
+import bisect
+import math
+import threading
+
+
+class LatencyHistogram:
+    """Fixed-memory latency histogram with logarithmic buckets.
+
+    Samples (in seconds) are counted into buckets whose width grows by `precision` per step,
+    so any percentile is reported within that relative error no matter how many samples are
+    recorded. Min, max and mean are exact. Thread-safe.
+    """
+
+    def __init__(self, min_value=0.0001, max_value=600.0, precision=0.02):
+        self._bounds = []
+        bound = min_value
+        while bound < max_value:
+            self._bounds.append(bound)
+            bound *= 1.0 + precision
+        self._bounds.append(max_value)
+        self._counts = [0] * (len(self._bounds) + 1) # Last bucket collects values above max_value
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counts = [0] * len(self._counts)
+            self.count = 0
+            self.total = 0.0
+            self.min = None
+            self.max = None
+
+    def record(self, value):
+        value = max(value, 0.0) # Clock skew between hosts can make tiny negative latencies
+        with self._lock:
+            self._counts[bisect.bisect_left(self._bounds, value)] += 1
+            self.count += 1
+            self.total += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, pct):
+        """Returns the value at percentile `pct` (0-100), or None when empty."""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = max(1, math.ceil(self.count * pct / 100.0))
+            seen = 0
+            for index, bucket_count in enumerate(self._counts):
+                seen += bucket_count
+                if seen >= rank:
+                    upper = self._bounds[index] if index < len(self._bounds) else self.max
+                    return min(upper, self.max)
+            return self.max
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """Returns {"count", "mean", "min", "max", "p50", ...} with values in seconds."""
+        result = {"count": self.count, "mean": self.total / self.count if self.count else None,
+                  "min": self.min, "max": self.max}
+        for pct in percentiles:
+            result[f"p{pct:g}"] = self.percentile(pct)
+        return result
+
+    def format_summary(self, percentiles=(50, 90, 99)):
+        """One-line human-readable summary in milliseconds."""
+        summary = self.summary(percentiles)
+        if not summary["count"]:
+            return "n=0"
+        parts = [f"n={summary['count']}"]
+        for key in [f"p{pct:g}" for pct in percentiles] + ["max"]:
+            parts.append(f"{key}={summary[key] * 1000:.1f}ms")
+        return " ".join(parts)
@@ -0,0 +1,261 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+DEFAULT_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+DEFAULT_QUEUE_SIZE = 10000 # Records waiting for the listener thread; beyond this they are dropped, never waited for
+
+# Logger name prefix -> (records per second, burst). Records at ERROR and above are never limited.
+DEFAULT_RATE_LIMITS = {
+    "services.mqtt_service": (20.0, 100),
+    "services.async_mqtt_service": (20.0, 100),
+    "services.database_service": (20.0, 100),
+    "services.rfid_service": (10.0, 50),
+}
+# Logger name prefix -> (first, every): of each repeated message template below WARNING, keep the
+# first `first` records and then one in `every`. Templates are the unformatted `msg`, so this only
+# groups messages logged with %-style arguments, e.g. logger.debug("Status %s from %s", a, b).
+DEFAULT_SAMPLING = {
+    "services": (20, 100),
+}
+
+_STANDARD_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+_IMMUTABLE_ARG_TYPES = (str, int, float, bool, type(None), bytes)
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def _match_prefix(name, table):
+    """Returns the longest `table` key that is `name` or a dotted parent of it, or None."""
+    while name:
+        if name in table:
+            return name
+        name = name.rpartition('.')[0]
+    return None
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per logger name prefix.
+
+    Records below `max_level` that find their bucket empty are dropped. The next record that gets
+    through carries a note of how many were dropped in between, so floods stay visible in the log.
+    """
+
+    def __init__(self, limits, max_level=logging.ERROR, clock=time.monotonic):
+        super().__init__()
+        self.max_level = max_level
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._limits = dict(limits)
+        self._buckets = {} # prefix -> [tokens, last refill time, suppressed count]
+        self._by_name = {} # logger name -> prefix (or None), so the prefix walk happens once per logger
+        self.suppressed_total = 0
+
+    def filter(self, record):
+        if record.levelno >= self.max_level:
+            return True
+        try:
+            prefix = self._by_name[record.name]
+        except KeyError:
+            prefix = self._by_name[record.name] = _match_prefix(record.name, self._limits)
+        if prefix is None:
+            return True
+        rate, burst = self._limits[prefix]
+        now = self._clock()
+        with self._lock:
+            bucket = self._buckets.get(prefix)
+            if bucket is None:
+                bucket = self._buckets[prefix] = [float(burst), now, 0]
+            bucket[0] = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1.0:
+                bucket[2] += 1
+                self.suppressed_total += 1
+                return False
+            bucket[0] -= 1.0
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.msg = f"{record.msg} [{suppressed} earlier message(s) from {prefix} suppressed by rate limit]"
+            record.suppressed = suppressed
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps the first `first` records of each (logger, template) and then one in `every`.
+
+    Only applies below `max_level`. At most `max_templates` counters are kept; when that many
+    distinct templates have been seen the counters start over.
+    """
+
+    def __init__(self, sampling, max_level=logging.WARNING, max_templates=4096):
+        super().__init__()
+        self.max_level = max_level
+        self.max_templates = max_templates
+        self._sampling = dict(sampling)
+        self._by_name = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+        self.sampled_out_total = 0
+
+    def filter(self, record):
+        if record.levelno >= self.max_level:
+            return True
+        try:
+            rule = self._by_name[record.name]
+        except KeyError:
+            prefix = _match_prefix(record.name, self._sampling)
+            rule = self._by_name[record.name] = self._sampling[prefix] if prefix else None
+        if rule is None:
+            return True
+        first, every = rule
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg))
+        with self._lock:
+            count = self._counts.get(key, 0) + 1
+            if count == 1 and len(self._counts) >= self.max_templates:
+                self._counts.clear()
+            self._counts[key] = count
+            if count <= first or (count - first) % every == 0:
+                return True
+            self.sampled_out_total += 1
+            return False
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, thread, message, plus any `extra` fields."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in _STANDARD_RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the logging thread and formats as little as possible there.
+
+    The stock prepare() renders every message before queueing it, which is most of the cost of a
+    log call. Records whose arguments are immutable are queued as they are and rendered by the
+    listener thread; only records with mutable arguments or exceptions are rendered here, so they
+    show the values as they were when logged.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        args = record.args
+        if record.exc_info or (args and not (isinstance(args, tuple) and all(isinstance(arg, _IMMUTABLE_ARG_TYPES) for arg in args))):
+            record = copy.copy(record)
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _LoggingPipeline:
+    def __init__(self, queue_handler, listener, filters):
+        self.queue_handler = queue_handler
+        self.listener = listener
+        self.filters = filters
+        self.pid = os.getpid()
+
+    def stop(self):
+        logging.getLogger().removeHandler(self.queue_handler)
+        if self.pid == os.getpid(): # A forked child inherits the pipeline but not its listener thread
+            self.listener.stop()
+
+
+def configure_logging(level="INFO", json_format=False, fmt=DEFAULT_FORMAT, log_file=None,
+                      rate_limits=None, sampling=None, queue_size=DEFAULT_QUEUE_SIZE, stream=None):
+    """Routes all logging through a queue to a listener thread that does the formatting and I/O.
+
+    Logging calls on the MQTT, RFID and database threads only run the filters and put the record
+    on a queue. `rate_limits` and `sampling` map logger name prefixes to limits (see
+    DEFAULT_RATE_LIMITS and DEFAULT_SAMPLING, used when None; pass {} to disable). With
+    `json_format` each line is a JSON object. Replaces any handlers already on the root logger,
+    so calling it again reconfigures. Returns the QueueListener; it is stopped (and the queue
+    flushed) at exit.
+    """
+    global _pipeline
+    formatter = JsonFormatter() if json_format else logging.Formatter(fmt)
+    handlers = [logging.StreamHandler(stream or sys.stderr)]
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(log_file, maxBytes=10 * 1024 * 1024, backupCount=5))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = _NonBlockingQueueHandler(log_queue)
+    filters = [
+        SamplingFilter(DEFAULT_SAMPLING if sampling is None else sampling),
+        RateLimitFilter(DEFAULT_RATE_LIMITS if rate_limits is None else rate_limits),
+    ]
+    for log_filter in filters: # On the queue handler, so dropped records never reach the queue
+        queue_handler.addFilter(log_filter)
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    with _pipeline_lock:
+        if _pipeline is not None:
+            _pipeline.stop()
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+            handler.close()
+        root.setLevel(level.upper() if isinstance(level, str) else level)
+        root.addHandler(queue_handler)
+        listener.start()
+        if _pipeline is None:
+            atexit.register(_stop_pipeline)
+        _pipeline = _LoggingPipeline(queue_handler, listener, filters)
+    return listener
+
+
+def _stop_pipeline():
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is not None:
+            _pipeline.stop()
+            _pipeline = None
+
+
+def get_logging_stats():
+    """Counts of records dropped by sampling, rate limiting and a full queue since configure_logging()."""
+    with _pipeline_lock:
+        if _pipeline is None:
+            return None
+        sampling, rate_limit = _pipeline.filters
+        return {
+            "sampled_out": sampling.sampled_out_total,
+            "rate_limited": rate_limit.suppressed_total,
+            "queue_full_dropped": _pipeline.queue_handler.dropped,
+            "queued": _pipeline.queue_handler.queue.qsize(),
+        }
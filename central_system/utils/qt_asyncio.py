@@ -0,0 +1,23 @@
+import asyncio
+import logging
+
+try:
+    import qasync
+    QASYNC_AVAILABLE = True
+except ImportError:
+    QASYNC_AVAILABLE = False
+    logging.warning("qasync library not found. Asyncio services cannot share the Qt event loop. Please install it: pip install qasync")
+
+
+def create_qt_event_loop(app):
+    """Installs an asyncio event loop that runs on the Qt event loop of `app`.
+
+    Coroutines and socket readers registered on the returned loop are serviced by the GUI
+    thread between Qt events, so asyncio services need no thread of their own. Start it with
+    `loop.run_forever()` instead of `app.exec_()`.
+    """
+    if not QASYNC_AVAILABLE:
+        raise RuntimeError("qasync is required to run asyncio on the Qt event loop.")
+    loop = qasync.QEventLoop(app)
+    asyncio.set_event_loop(loop)
+    return loop
@@ -0,0 +1,104 @@
+import logging
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+logger = logging.getLogger(__name__)
+
+
+class _TaskSignals(QObject):
+    # Emitted from the pool thread; Qt queues them to the loader's (GUI) thread
+    finished = pyqtSignal(str, int, object)
+    failed = pyqtSignal(str, int, str)
+
+
+class _LoadTask(QRunnable):
+    def __init__(self, key, generation, fn, is_current, signals):
+        super().__init__()
+        self.key = key
+        self.generation = generation
+        self.fn = fn
+        self.is_current = is_current
+        self.signals = signals
+
+    def run(self):
+        if not self.is_current(self.key, self.generation):
+            return # Cancelled before a pool thread got to it
+        try:
+            result = self.fn()
+        except Exception as e:
+            self.signals.failed.emit(self.key, self.generation, str(e))
+            return
+        self.signals.finished.emit(self.key, self.generation, result)
+
+
+class BackgroundLoader(QObject):
+    """Runs blocking loads (database queries) on a QThreadPool and hands results back to the GUI thread.
+
+    Each load is submitted under a key, e.g. "faculty". Submitting again under the same key, or
+    cancel(key), makes every earlier load for that key stale: it is skipped if it has not started
+    yet, and its result is dropped instead of emitted if it has. `loaded` and `failed` are only
+    emitted for the current load of a key, on the thread the loader lives in.
+    """
+
+    loaded = pyqtSignal(str, object) # key, result
+    failed = pyqtSignal(str, str)    # key, error message
+
+    def __init__(self, max_threads=None, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        if max_threads:
+            self.pool.setMaxThreadCount(max_threads)
+        self._lock = threading.Lock()
+        self._generations = {}
+        self._pending = set()
+        self._signals = _TaskSignals()
+        self._signals.finished.connect(self._on_finished)
+        self._signals.failed.connect(self._on_failed)
+
+    def submit(self, key, fn):
+        """Runs fn() on the pool, superseding any load still in flight for `key`."""
+        with self._lock:
+            generation = self._generations.get(key, 0) + 1
+            self._generations[key] = generation
+            self._pending.add(key)
+        self.pool.start(_LoadTask(key, generation, fn, self._is_current, self._signals))
+        return generation
+
+    def cancel(self, key=None):
+        """Drops the load in flight for `key`, or for every key."""
+        with self._lock:
+            keys = [key] if key is not None else list(self._generations)
+            for k in keys:
+                self._generations[k] = self._generations.get(k, 0) + 1
+                self._pending.discard(k)
+
+    def is_pending(self, key):
+        with self._lock:
+            return key in self._pending
+
+    def wait(self, msecs=-1):
+        """Blocks until the pool is idle, e.g. before shutdown. Returns False on timeout."""
+        return self.pool.waitForDone(msecs)
+
+    def _is_current(self, key, generation):
+        with self._lock:
+            return self._generations.get(key) == generation
+
+    def _take_current(self, key, generation):
+        with self._lock:
+            if self._generations.get(key) != generation:
+                return False
+            self._pending.discard(key)
+            return True
+
+    def _on_finished(self, key, generation, result):
+        if self._take_current(key, generation):
+            self.loaded.emit(key, result)
+        else:
+            logger.debug("Dropped stale result of background load %r", key)
+
+    def _on_failed(self, key, generation, error):
+        if self._take_current(key, generation):
+            logger.error(f"Background load '{key}' failed: {error}")
+            self.failed.emit(key, error)
@@ -0,0 +1,64 @@
+import math
+
+
+class TimingWheel:
+    """Hashed timing wheel: one timer per key, all driven by a single advance() call.
+
+    Time is split into ticks of `tick` seconds, and each key sits in the slot of the tick its
+    deadline falls in (modulo the number of slots). schedule() and cancel() are O(1) and moving a
+    key (e.g. on every heartbeat) just moves it between two slot sets. advance() only visits the
+    slots of the ticks that have passed, so its cost depends on how many keys expire rather than
+    how many are scheduled. Deadlines further out than one revolution (tick * slots) stay in their
+    slot until a later pass. Deadlines are rounded up to the next tick, so keys expire up to one
+    tick late, never early.
+    """
+
+    def __init__(self, tick=1.0, slots=512, now=0.0):
+        self.tick = tick
+        self._slots = [set() for _ in range(slots)]
+        self._deadlines = {} # key -> deadline tick
+        self._current_tick = int(now // tick)
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def schedule(self, key, deadline):
+        """(Re)schedules `key` to expire at `deadline`, replacing any earlier schedule."""
+        deadline_tick = max(math.ceil(deadline / self.tick), self._current_tick + 1)
+        previous = self._deadlines.get(key)
+        if previous is not None:
+            self._slots[previous % len(self._slots)].discard(key)
+        self._deadlines[key] = deadline_tick
+        self._slots[deadline_tick % len(self._slots)].add(key)
+
+    def cancel(self, key):
+        deadline_tick = self._deadlines.pop(key, None)
+        if deadline_tick is not None:
+            self._slots[deadline_tick % len(self._slots)].discard(key)
+
+    def advance(self, now):
+        """Moves the wheel to `now` and returns the keys whose deadline has passed, in deadline order."""
+        target_tick = int(now // self.tick)
+        if target_tick <= self._current_tick:
+            return []
+        expired = []
+        # After a long pause every slot is due once; visiting more than a full revolution adds nothing
+        first_tick = max(self._current_tick + 1, target_tick - len(self._slots) + 1)
+        for tick in range(first_tick, target_tick + 1):
+            slot = self._slots[tick % len(self._slots)]
+            due = [key for key in slot if self._deadlines[key] <= target_tick]
+            for key in due:
+                slot.discard(key)
+                expired.append((self._deadlines.pop(key), key))
+        self._current_tick = target_tick
+        expired.sort(key=lambda item: item[0])
+        return [key for _, key in expired]
+
+    def next_tick_time(self):
+        """Time at which advance() may next expire something, or None when the wheel is empty."""
+        if not self._deadlines:
+            return None
+        return (self._current_tick + 1) * self.tick
@@ -1,12 +1,14 @@
 import logging
 import os
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QTabWidget, QLabel, QLineEdit,
-                             QPushButton, QTableWidget, QTableWidgetItem, QMessageBox,
+                             QPushButton, QTableView, QMessageBox,
                              QFormLayout, QGroupBox, QHBoxLayout, QHeaderView, QAbstractItemView,
                              QSizePolicy, QSpacerItem)
 from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot
 from PyQt5.QtGui import QFont, QColor
 
+from views.paged_table_model import PagedTableModel
+
 logger_admin_dash = logging.getLogger(__name__)
 
 # Color constants (some might be used for dynamic styling if QSS doesn't cover all cases)
@@ -16,6 +18,49 @@ STATUS_GREEN = "#2ECC71"
 STATUS_RED = "#E74C3C"
 STATUS_ORANGE = "#F39C12"
 
+
+def _text(key):
+    return lambda row: '' if row.get(key) is None else str(row.get(key))
+
+
+def _timestamp(key):
+    def format_timestamp(row):
+        value = row.get(key)
+        if not value:
+            return ''
+        return value.strftime("%Y-%m-%d %H:%M") if hasattr(value, 'strftime') else str(value)
+    return format_timestamp
+
+
+def _status_cell_style(status_key, default_status, status_column):
+    """Returns a PagedTableModel cell_style that colours, bolds and centres the status column."""
+    def cell_style(row, column, role):
+        if column != status_column:
+            return None
+        if role == Qt.ForegroundRole:
+            return _status_color(row.get(status_key) or default_status)
+        if role == Qt.FontRole:
+            font = QFont()
+            font.setBold(True)
+            return font
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+        return None
+    return cell_style
+
+
+def _status_color(status_text):
+    status_text = status_text.lower()
+    if status_text == 'available' or status_text == 'approved':
+        return QColor(STATUS_GREEN)
+    elif status_text == 'unavailable' or status_text == 'rejected' or status_text == 'cancelled':
+        return QColor(STATUS_RED)
+    elif status_text == 'busy' or status_text == 'pending' or status_text == 'in-progress' or status_text == 'delivered' or status_text == 'viewed':
+        return QColor(STATUS_ORANGE)
+    elif status_text == 'offline' or status_text == 'completed' or status_text == 'deferred':
+        return QColor(Qt.darkGray)
+    return QColor(Qt.black) # Default
+
 class AdminDashboardScreen(QWidget):
     # Signals for controller interaction if needed later, for now direct calls
     # e.g., request_load_students = pyqtSignal()
@@ -112,10 +157,9 @@ class AdminDashboardScreen(QWidget):
         # Connect signal from controller for RFID tag scanned for new student
         self.admin_controller.rfid_tag_scanned_for_student.connect(self.update_rfid_tag_entry_for_new_student)
 
-    def _create_general_table(self, headers): # Renamed from _create_table to avoid conflict if any base class has it
-        table = QTableWidget()
-        table.setColumnCount(len(headers))
-        table.setHorizontalHeaderLabels(headers)
+    def _create_general_table(self, model): # Renamed from _create_table to avoid conflict if any base class has it
+        table = QTableView()
+        table.setModel(model) # Rows are loaded page by page as the table is scrolled
         table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         table.setSelectionBehavior(QAbstractItemView.SelectRows)
         table.setSelectionMode(QAbstractItemView.SingleSelection)
@@ -179,8 +223,12 @@ class AdminDashboardScreen(QWidget):
 
         table_group = QGroupBox("Registered Students")
         table_layout = QVBoxLayout()
-        headers = ["ID", "Name", "Student No.", "Course", "Department", "RFID Tag", "Created At"]
-        self.students_table = self._create_general_table(headers)
+        self.students_model = PagedTableModel(
+            [("ID", _text('student_id')), ("Name", _text('name')), ("Student No.", _text('student_number')),
+             ("Course", _text('course')), ("Department", _text('department')), ("RFID Tag", _text('rfid_tag')),
+             ("Created At", _timestamp('created_at'))],
+            self.admin_controller.get_students_page, parent=self)
+        self.students_table = self._create_general_table(self.students_model)
         table_layout.addWidget(self.students_table)
         table_group.setLayout(table_layout)
 
@@ -190,7 +238,7 @@ class AdminDashboardScreen(QWidget):
         self.add_student_button.clicked.connect(self._add_student)
         self.update_student_button.clicked.connect(self._update_student)
         self.clear_student_form_button.clicked.connect(self._clear_student_form)
-        self.students_table.itemDoubleClicked.connect(self._load_student_data_to_form) # Keep double click to load
+        self.students_table.doubleClicked.connect(self._load_student_data_to_form) # Keep double click to load
         self.scan_rfid_button_student.clicked.connect(self._on_scan_rfid_for_student_clicked)
         self._clear_student_form() # Initialize form state
         return student_tab_content
@@ -219,19 +267,19 @@ class AdminDashboardScreen(QWidget):
         self.update_student_button.setEnabled(False)
         self.add_student_button.setEnabled(True)
 
-    def _load_student_data_to_form(self, item=None): # Item can be None if called after add/update
-        selected_rows = self.students_table.selectedItems()
-        if not selected_rows and item is None:
+    def _load_student_data_to_form(self, index=None): # Index can be None if called after add/update
+        selected_rows = self.students_table.selectionModel().selectedRows()
+        if not selected_rows and index is None:
             self._clear_student_form()
             return
         
-        row = item.row() if item else selected_rows[0].row()
-        self.student_id_entry.setText(self.students_table.item(row, 0).text())
-        self.student_name_entry.setText(self.students_table.item(row, 1).text())
-        self.student_number_entry.setText(self.students_table.item(row, 2).text() if self.students_table.item(row, 2) else "")
-        self.course_entry.setText(self.students_table.item(row, 3).text() if self.students_table.item(row, 3) else "")
-        self.department_entry.setText(self.students_table.item(row, 4).text() if self.students_table.item(row, 4) else "")
-        self.rfid_tag_entry.setText(self.students_table.item(row, 5).text() if self.students_table.item(row, 5) else "")
+        student = self.students_model.row_data(index.row() if index is not None else selected_rows[0].row())
+        self.student_id_entry.setText(str(student.get('student_id', '')))
+        self.student_name_entry.setText(student.get('name') or "")
+        self.student_number_entry.setText(student.get('student_number') or "")
+        self.course_entry.setText(student.get('course') or "")
+        self.department_entry.setText(student.get('department') or "")
+        self.rfid_tag_entry.setText(student.get('rfid_tag') or "")
         self.update_student_button.setEnabled(True)
         self.add_student_button.setEnabled(False)
 
@@ -350,9 +398,15 @@ class AdminDashboardScreen(QWidget):
 
         table_group = QGroupBox("Registered Faculty")
         table_layout = QVBoxLayout()
-        headers = ["ID", "Name", "Department", "BLE ID", "Office", "Contact", "Status", "Status Updated"]
-        self.faculty_table = self._create_general_table(headers)
-        self.faculty_table.itemSelectionChanged.connect(self._load_faculty_to_form) # Changed from itemDoubleClicked
+        self.faculty_model = PagedTableModel(
+            [("ID", _text('faculty_id')), ("Name", _text('name')), ("Department", _text('department')),
+             ("BLE ID", _text('ble_identifier')), ("Office", _text('office_location')),
+             ("Contact", _text('contact_details')), ("Status", lambda row: row.get('current_status') or 'Offline'),
+             ("Status Updated", _timestamp('status_updated_at'))],
+            self.admin_controller.get_faculty_page, cell_style=_status_cell_style('current_status', 'Offline', 6),
+            parent=self)
+        self.faculty_table = self._create_general_table(self.faculty_model)
+        self.faculty_table.selectionModel().selectionChanged.connect(self._load_faculty_to_form) # Changed from itemDoubleClicked
         
         # Refresh button might not be needed if data is auto-refreshed via signals
         # self.faculty_refresh_button = QPushButton("Refresh List")
@@ -381,19 +435,19 @@ class AdminDashboardScreen(QWidget):
         self.faculty_update_button.setEnabled(False)
         self.faculty_add_button.setEnabled(True)
 
-    def _load_faculty_to_form(self):
-        selected_rows = self.faculty_table.selectedItems()
+    def _load_faculty_to_form(self, *_):
+        selected_rows = self.faculty_table.selectionModel().selectedRows()
         if not selected_rows:
             self._clear_faculty_fields()
             return
         
-        row = selected_rows[0].row()
-        self.faculty_id_label.setText(self.faculty_table.item(row, 0).text())
-        self.faculty_name_edit.setText(self.faculty_table.item(row, 1).text())
-        self.faculty_dept_edit.setText(self.faculty_table.item(row, 2).text())
-        self.faculty_ble_edit.setText(self.faculty_table.item(row, 3).text())
-        self.faculty_office_edit.setText(self.faculty_table.item(row, 4).text() if self.faculty_table.item(row, 4) else "")
-        self.faculty_contact_edit.setText(self.faculty_table.item(row, 5).text() if self.faculty_table.item(row, 5) else "")
+        faculty = self.faculty_model.row_data(selected_rows[0].row())
+        self.faculty_id_label.setText(str(faculty.get('faculty_id', '')))
+        self.faculty_name_edit.setText(faculty.get('name') or "")
+        self.faculty_dept_edit.setText(faculty.get('department') or "")
+        self.faculty_ble_edit.setText(faculty.get('ble_identifier') or "")
+        self.faculty_office_edit.setText(faculty.get('office_location') or "")
+        self.faculty_contact_edit.setText(faculty.get('contact_details') or "")
         self.faculty_update_button.setEnabled(True)
         self.faculty_add_button.setEnabled(False)
 
@@ -465,8 +519,17 @@ class AdminDashboardScreen(QWidget):
         # ... add filter widgets ...
         # table_layout.addLayout(filter_layout)
         
-        headers = ["ID", "Student", "Faculty", "Course", "Subject", "Status", "Requested At", "Updated At"]
-        self.consultation_table = self._create_general_table(headers)
+        self.consultation_model = PagedTableModel(
+            [("ID", _text('consultation_id')),
+             ("Student", lambda row: f"{row.get('student_name', 'N/A')} (ID: {row.get('student_id', 'N/A')})"),
+             ("Faculty", lambda row: f"{row.get('faculty_name', 'N/A')} (ID: {row.get('faculty_id', 'N/A')})"),
+             ("Course", _text('course_code')), ("Subject", _text('subject')),
+             # Details can be long, consider tooltip or separate view if too much for table
+             ("Status", lambda row: row.get('status') or 'Pending'),
+             ("Requested At", _timestamp('requested_at')), ("Updated At", _timestamp('updated_at'))],
+            self.admin_controller.get_consultations_page, cell_style=_status_cell_style('status', 'Pending', 5),
+            parent=self)
+        self.consultation_table = self._create_general_table(self.consultation_model)
         # Consider making subject/details columns wider or allowing text wrap
         # self.consultation_table.setWordWrap(True) # For all cells - might be too much
         # self.consultation_table.resizeRowsToContents() # If word wrap is enabled
@@ -491,82 +554,15 @@ class AdminDashboardScreen(QWidget):
 
     def load_students_data(self):
         logger_admin_dash.debug("Loading students data...")
-        students = self.admin_controller.get_all_students()
-        self.students_table.setRowCount(0) 
-        if students:
-            for row_num, student_data in enumerate(students):
-                self.students_table.insertRow(row_num)
-                self.students_table.setItem(row_num, 0, QTableWidgetItem(str(student_data.get('student_id', ''))))
-                self.students_table.setItem(row_num, 1, QTableWidgetItem(student_data.get('name', '')))
-                self.students_table.setItem(row_num, 2, QTableWidgetItem(student_data.get('student_number', '')))
-                self.students_table.setItem(row_num, 3, QTableWidgetItem(student_data.get('course', '')))
-                self.students_table.setItem(row_num, 4, QTableWidgetItem(student_data.get('department', '')))
-                self.students_table.setItem(row_num, 5, QTableWidgetItem(student_data.get('rfid_tag', '')))
-                created_at = student_data.get('created_at')
-                self.students_table.setItem(row_num, 6, QTableWidgetItem(str(created_at.strftime("%Y-%m-%d %H:%M")) if created_at else ''))
-        # self.students_table.resizeColumnsToContents() # Can make UI jumpy, QSS can define column widths or header stretch
+        self.students_model.reload()
 
     def load_faculty_data(self):
         logger_admin_dash.debug("Loading faculty data...")
-        faculty_list = self.admin_controller.get_all_faculty()
-        self.faculty_table.setRowCount(0)
-        if faculty_list:
-            for row_num, faculty_data in enumerate(faculty_list):
-                self.faculty_table.insertRow(row_num)
-                self.faculty_table.setItem(row_num, 0, QTableWidgetItem(str(faculty_data.get('faculty_id', ''))))
-                self.faculty_table.setItem(row_num, 1, QTableWidgetItem(faculty_data.get('name', '')))
-                self.faculty_table.setItem(row_num, 2, QTableWidgetItem(faculty_data.get('department', '')))
-                self.faculty_table.setItem(row_num, 3, QTableWidgetItem(faculty_data.get('ble_identifier', '')))
-                self.faculty_table.setItem(row_num, 4, QTableWidgetItem(faculty_data.get('office_location', '')))
-                self.faculty_table.setItem(row_num, 5, QTableWidgetItem(faculty_data.get('contact_details', '')))
-                status_item = QTableWidgetItem(faculty_data.get('current_status', 'Offline'))
-                self.faculty_table.setItem(row_num, 6, status_item)
-                status_updated_at = faculty_data.get('status_updated_at')
-                self.faculty_table.setItem(row_num, 7, QTableWidgetItem(str(status_updated_at.strftime("%Y-%m-%d %H:%M")) if status_updated_at else ''))
-                self._style_status_cell(status_item, faculty_data.get('current_status', 'Offline'))
+        self.faculty_model.reload()
 
     def load_consultations_data(self):
         logger_admin_dash.debug("Loading consultations data...")
-        consultations = self.admin_controller.get_all_consultations()
-        self.consultation_table.setRowCount(0)
-        if consultations:
-            for row_num, consult_data in enumerate(consultations):
-                self.consultation_table.insertRow(row_num)
-                self.consultation_table.setItem(row_num, 0, QTableWidgetItem(str(consult_data.get('consultation_id', ''))))
-                student_info = f"{consult_data.get('student_name', 'N/A')} (ID: {consult_data.get('student_id', 'N/A')})"
-                self.consultation_table.setItem(row_num, 1, QTableWidgetItem(student_info))
-                faculty_info = f"{consult_data.get('faculty_name', 'N/A')} (ID: {consult_data.get('faculty_id', 'N/A')})"
-                self.consultation_table.setItem(row_num, 2, QTableWidgetItem(faculty_info))
-                self.consultation_table.setItem(row_num, 3, QTableWidgetItem(consult_data.get('course_code', '')))
-                self.consultation_table.setItem(row_num, 4, QTableWidgetItem(consult_data.get('subject', '')))
-                # Details can be long, consider tooltip or separate view if too much for table
-                # details_item = QTableWidgetItem(consult_data.get('request_details', ''))
-                # self.consultation_table.setItem(row_num, 5, details_item)
-                status_item = QTableWidgetItem(consult_data.get('status', 'Pending'))
-                self.consultation_table.setItem(row_num, 5, status_item) # Index changed from 6 due to removing details
-                self._style_status_cell(status_item, consult_data.get('status', 'Pending'))
-                
-                requested_at = consult_data.get('requested_at')
-                self.consultation_table.setItem(row_num, 6, QTableWidgetItem(str(requested_at.strftime("%Y-%m-%d %H:%M")) if requested_at else ''))
-                updated_at = consult_data.get('updated_at')
-                self.consultation_table.setItem(row_num, 7, QTableWidgetItem(str(updated_at.strftime("%Y-%m-%d %H:%M")) if updated_at else ''))
-    
-    def _style_status_cell(self, item: QTableWidgetItem, status_text: str):
-        status_text = status_text.lower()
-        color = QColor(Qt.black) # Default
-        if status_text == 'available' or status_text == 'approved':
-            color = QColor(STATUS_GREEN)
-        elif status_text == 'unavailable' or status_text == 'rejected' or status_text == 'cancelled':
-            color = QColor(STATUS_RED)
-        elif status_text == 'busy' or status_text == 'pending' or status_text == 'in-progress':
-            color = QColor(STATUS_ORANGE)
-        elif status_text == 'offline' or status_text == 'completed' or status_text == 'deferred':
-            color = QColor(Qt.darkGray)
-        item.setForeground(color)
-        font = item.font()
-        font.setBold(True)
-        item.setFont(font)
-        item.setTextAlignment(Qt.AlignCenter)
+        self.consultation_model.reload()
 
 if __name__ == '__main__':
     import sys
@@ -601,6 +597,14 @@ if __name__ == '__main__':
                 {'consultation_id': 2, 'student_name': 'Bob', 'student_id':2, 'faculty_name': 'Prof. Pax', 'faculty_id':2, 'course_code': 'CYB202', 'subject': 'AI Ethics', 'request_details': 'Project discussion.', 'status': 'Approved', 'requested_at': '2023-10-09 14:00', 'updated_at': '2023-10-09 15:00'},
             ]
 
+        # The tables load pages of these lists as they are scrolled
+        def _page(self, rows, limit, after):
+            start = rows.index(after) + 1 if after in rows else 0
+            return rows[start:start + limit]
+        def get_students_page(self, limit, after=None): return self._page(self.get_all_students(), limit, after)
+        def get_faculty_page(self, limit, after=None): return self._page(self.get_all_faculty(), limit, after)
+        def get_consultations_page(self, limit, after=None): return self._page(self.get_all_consultations(), limit, after)
+
     app = QApplication(sys.argv)
     admin_screen = AdminDashboardScreen(MockAdminController())
     admin_screen.show()
@@ -21,6 +21,7 @@ STATUS_RED = "#E74C3C"
 class AuthenticationScreen(QWidget):
     # Signal to indicate successful authentication, carries student data (e.g., name or ID)
     login_successful = pyqtSignal(dict) # dict will contain student info
+    authenticated = pyqtSignal(dict) # Emitted as soon as the scan is accepted, before login_successful
     # Signal to request RFID scan start/stop
     request_rfid_scan_start = pyqtSignal()
     request_rfid_scan_stop = pyqtSignal()
@@ -143,6 +144,8 @@ class AuthenticationScreen(QWidget):
     # This method will be called by the controller upon successful login
     def _on_login_success(self, student_data):
         self.set_status_message(f"Authenticated as {student_data.get('name', 'Student')}. Redirecting...", is_success=True, duration_ms=2000)
+        # Lets the dashboard load the student's data while the success message is showing
+        self.authenticated.emit(student_data)
         # Emit signal for main app/controller to handle view switching
         # Adding a slight delay before emitting to allow user to see success message.
         QTimer.singleShot(1000, lambda: self.login_successful.emit(student_data))
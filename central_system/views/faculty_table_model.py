@@ -0,0 +1,160 @@
+import bisect
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QVariant
+from PyQt5.QtGui import QColor
+
+
+class FacultyTableModel(QAbstractTableModel):
+    """Faculty directory rows for a QTableView, updated in place from each refreshed list.
+
+    set_faculty() matches the new list to the rows shown by faculty_id and only reports what
+    differs: removed rows, moved rows, inserted rows, and dataChanged for the cells whose text
+    changed. Selection and scroll position survive a refresh, and a refresh that changes nothing
+    emits no signal, so the view does not repaint. Qt.UserRole on any cell returns the faculty
+    member's full dict (faculty_id, ble_identifier, ...).
+    """
+
+    COLUMNS = (("Name", "name", "N/A"),
+               ("Department", "department", "N/A"),
+               ("Office", "office_location", "N/A"),
+               ("Status", "current_status", "Unknown"))
+    STATUS_COLUMN = 3
+    STATUS_COLORS = { # lower-case status -> (background, foreground)
+        "available": (QColor("#ccffcc"), QColor("darkGreen")),
+        "unavailable": (QColor("#ffcccc"), QColor("darkRed")),
+    }
+    DEFAULT_STATUS_BACKGROUND = QColor("#f0f0f0")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []   # faculty dicts, in display order
+        self._ids = []    # faculty_id of each row
+        self._cells = []  # displayed text of each row, a tuple per row
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal and 0 <= section < len(self.COLUMNS):
+            return self.COLUMNS[section][0]
+        return QVariant()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < len(self._rows):
+            return QVariant()
+        row, column = index.row(), index.column()
+        if role == Qt.DisplayRole:
+            return self._cells[row][column]
+        if role == Qt.UserRole:
+            return self._rows[row]
+        if column == self.STATUS_COLUMN:
+            colors = self.STATUS_COLORS.get(self._cells[row][column].lower())
+            if role == Qt.BackgroundRole:
+                return colors[0] if colors else self.DEFAULT_STATUS_BACKGROUND
+            if role == Qt.ForegroundRole and colors:
+                return colors[1]
+            if role == Qt.TextAlignmentRole:
+                return Qt.AlignCenter
+        return QVariant()
+
+    def faculty_at(self, row):
+        return self._rows[row] if 0 <= row < len(self._rows) else None
+
+    def clear(self):
+        self.set_faculty([])
+
+    def _cells_of(self, faculty_member):
+        cells = []
+        for _, key, missing in self.COLUMNS:
+            value = faculty_member.get(key)
+            cells.append(missing if value is None else str(value))
+        return tuple(cells)
+
+    def set_faculty(self, faculty_list):
+        """Makes the rows equal to `faculty_list` (dicts with faculty_id), in its order, with minimal change signals."""
+        faculty_list = list(faculty_list or [])
+        new_ids = [faculty_member['faculty_id'] for faculty_member in faculty_list]
+        wanted = set(new_ids)
+
+        # Removals first, bottom-up, one signal per contiguous run
+        row = len(self._ids) - 1
+        while row >= 0:
+            if self._ids[row] in wanted:
+                row -= 1
+                continue
+            last = row
+            while row > 0 and self._ids[row - 1] not in wanted:
+                row -= 1
+            self.beginRemoveRows(QModelIndex(), row, last)
+            del self._rows[row:last + 1], self._ids[row:last + 1], self._cells[row:last + 1]
+            self.endRemoveRows()
+            row -= 1
+
+        # Reorder what is left. Rows on a longest increasing run of their new positions stay put;
+        # each other row is moved once, next to the nearest row already in order before it
+        target = {faculty_id: position for position, faculty_id in enumerate(new_ids)}
+        settled = self._longest_ordered_run(self._ids, target)
+        for faculty_id in sorted(set(self._ids) - settled, key=target.get):
+            current = self._ids.index(faculty_id)
+            destination = 0
+            for row, other_id in enumerate(self._ids):
+                if other_id in settled and target[other_id] < target[faculty_id]:
+                    destination = row + 1
+            if destination not in (current, current + 1):
+                self.beginMoveRows(QModelIndex(), current, current, QModelIndex(), destination)
+                if destination > current:
+                    destination -= 1
+                for rows in (self._rows, self._ids, self._cells):
+                    rows.insert(destination, rows.pop(current))
+                self.endMoveRows()
+            settled.add(faculty_id)
+
+        # The rows left are now in the new order; insert the new ones between them and compare the rest
+        position = 0
+        while position < len(faculty_list):
+            if new_ids[position] in settled:
+                self._update_row(position, faculty_list[position])
+                position += 1
+                continue
+            end = position
+            while end + 1 < len(faculty_list) and new_ids[end + 1] not in settled:
+                end += 1
+            self.beginInsertRows(QModelIndex(), position, end)
+            for row in range(position, end + 1):
+                self._rows.insert(row, faculty_list[row])
+                self._ids.insert(row, new_ids[row])
+                self._cells.insert(row, self._cells_of(faculty_list[row]))
+            self.endInsertRows()
+            position = end + 1
+
+    @staticmethod
+    def _longest_ordered_run(ids, target):
+        """Returns the ids of a longest subsequence of `ids` whose target positions increase."""
+        tails, tail_rows, previous = [], [], [None] * len(ids)
+        for row, faculty_id in enumerate(ids):
+            slot = bisect.bisect_left(tails, target[faculty_id])
+            previous[row] = tail_rows[slot - 1] if slot else None
+            if slot == len(tails):
+                tails.append(target[faculty_id])
+                tail_rows.append(row)
+            else:
+                tails[slot], tail_rows[slot] = target[faculty_id], row
+        run = set()
+        row = tail_rows[-1] if tail_rows else None
+        while row is not None:
+            run.add(ids[row])
+            row = previous[row]
+        return run
+
+    def _update_row(self, row, faculty_member):
+        self._rows[row] = faculty_member # Fields that are not shown (e.g. ble_identifier) need no repaint
+        cells = self._cells_of(faculty_member)
+        previous = self._cells[row]
+        if cells == previous:
+            return
+        self._cells[row] = cells
+        changed = [column for column, (old, new) in enumerate(zip(previous, cells)) if old != new]
+        self.dataChanged.emit(self.index(row, changed[0]), self.index(row, changed[-1]))
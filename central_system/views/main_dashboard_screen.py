@@ -1,13 +1,16 @@
 import sys
-import os
 import logging
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
     QLineEdit, QComboBox, QGroupBox, QDialog, QScrollArea, QFrame,
-    QSizePolicy, QGridLayout, QTextEdit, QSpacerItem, QMessageBox
+    QSizePolicy, QGridLayout, QTextEdit, QSpacerItem, QMessageBox, QListWidget,
+    QTableView, QAbstractItemView, QHeaderView
 )
-from PyQt5.QtGui import QFont, QColor
-from PyQt5.QtCore import Qt, pyqtSignal, QTimer
+from PyQt5.QtGui import QFont, QColor, QPalette
+from PyQt5.QtCore import Qt, pyqtSignal, QTimer, QModelIndex
+
+from utils.qt_workers import BackgroundLoader
+from views.faculty_table_model import FacultyTableModel
 
 # NU Color Palette (for dynamic parts if needed)
 NU_BLUE = "#003DA7"
@@ -118,8 +121,12 @@ class MainDashboardScreen(QWidget):
     request_logout = pyqtSignal()
     request_faculty_data_refresh = pyqtSignal()
     request_open_admin_panel = pyqtSignal()
+    submit_consultation_request = pyqtSignal(dict) # Handled by DashboardController
+
+    PREFETCH_KEYS = ("faculty", "departments", "consultations")
+    SEARCH_DEBOUNCE_MS = 250
 
-    def __init__(self, db_service_getter, parent=None):
+    def __init__(self, db_service_getter, parent_stacked_widget=None, parent=None):
         super().__init__(parent)
         self.setObjectName("mainDashboardScreen") # For QSS root styling
         self.db_service_getter = db_service_getter
@@ -131,9 +138,24 @@ class MainDashboardScreen(QWidget):
         
         # Timer for periodic refresh of faculty availability
         self.refresh_timer = QTimer(self)
-        self.refresh_timer.timeout.connect(self.load_faculty_data) # Or connect to a controller method
+        self.refresh_timer.timeout.connect(self._refresh_faculty_data) # Or connect to a controller method
         self.refresh_interval_ms = 10000 # Refresh every 10 seconds, adjust as needed
 
+        # Typing in the name search reloads once the user pauses rather than on every keystroke
+        self.search_debounce_timer = QTimer(self)
+        self.search_debounce_timer.setSingleShot(True)
+        self.search_debounce_timer.setInterval(self.SEARCH_DEBOUNCE_MS)
+        self.search_debounce_timer.timeout.connect(self.load_faculty_data)
+        self.faculty_name_search_input.textChanged.connect(self.search_debounce_timer.start)
+
+        # Loads the dashboard's data off the GUI thread, so a slow or unreachable database never
+        # stalls the touchscreen. prefetch() starts them right after the RFID scan is accepted, so
+        # they overlap the login success message instead of following it.
+        self.loader = BackgroundLoader(max_threads=len(self.PREFETCH_KEYS), parent=self)
+        self.loader.loaded.connect(self._on_background_loaded)
+        self.loader.failed.connect(self._on_background_load_failed)
+        self._prefetch_student_id = None # Student whose data was prefetched, None when there is none
+
     def init_ui(self):
         main_layout = QVBoxLayout()
         main_layout.setContentsMargins(20, 20, 20, 20)
@@ -170,7 +192,6 @@ class MainDashboardScreen(QWidget):
         self.faculty_name_search_input = QLineEdit()
         self.faculty_name_search_input.setPlaceholderText("Enter faculty name...")
         self.faculty_name_search_input.setFont(QFont("Arial", 10))
-        self.faculty_name_search_input.textChanged.connect(self.load_faculty_data) # Trigger refresh on text change
         filter_layout.addWidget(self.faculty_name_search_input)
 
         filter_layout.addWidget(QLabel("  Department:"))
@@ -193,16 +214,18 @@ class MainDashboardScreen(QWidget):
         filter_layout.addWidget(refresh_button)
         faculty_layout.addLayout(filter_layout)
 
-        self.faculty_table = QTableWidget()
+        # Refreshes update the model's rows in place, keeping selection and scroll position
+        self.faculty_model = FacultyTableModel(self) # Name, Department, Office, Status
+        self.faculty_table = QTableView()
+        self.faculty_table.setModel(self.faculty_model)
         self.faculty_table.setFont(QFont("Arial", 11))
-        self.faculty_table.setColumnCount(4) # Name, Department, Office, Status
-        self.faculty_table.setHorizontalHeaderLabels(["Name", "Department", "Office", "Status"])
         self.faculty_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.faculty_table.horizontalHeader().setFont(QFont("Arial", 12, QFont.Bold))
-        self.faculty_table.setEditTriggers(QTableWidget.NoEditTriggers) # Read-only
-        self.faculty_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.faculty_table.verticalHeader().setVisible(False)
+        self.faculty_table.setEditTriggers(QAbstractItemView.NoEditTriggers) # Read-only
+        self.faculty_table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.faculty_table.setAlternatingRowColors(True)
-        self.faculty_table.itemDoubleClicked.connect(self._handle_faculty_selection_for_request)
+        self.faculty_table.doubleClicked.connect(self._handle_faculty_selection_for_request)
         faculty_layout.addWidget(self.faculty_table)
         faculty_group.setLayout(faculty_layout)
         main_layout.addWidget(faculty_group)
@@ -255,6 +278,17 @@ class MainDashboardScreen(QWidget):
         consultation_group.setLayout(consult_form_layout)
         main_layout.addWidget(consultation_group)
 
+        # --- Student's Open Requests ---
+        open_requests_group = QGroupBox("Your Open Requests")
+        open_requests_group.setFont(QFont("Arial", 14, QFont.Bold))
+        open_requests_layout = QVBoxLayout()
+        self.open_requests_list = QListWidget()
+        self.open_requests_list.setFont(QFont("Arial", 11))
+        self.open_requests_list.setMaximumHeight(120)
+        open_requests_layout.addWidget(self.open_requests_list)
+        open_requests_group.setLayout(open_requests_layout)
+        main_layout.addWidget(open_requests_group)
+
         main_layout.addStretch(1)
         self.setLayout(main_layout)
         self._selected_faculty_for_request = None # Store full faculty data dictionary
@@ -267,77 +301,46 @@ class MainDashboardScreen(QWidget):
             self.welcome_label.setText("Welcome, Student!")
 
     def load_faculty_data(self):
+        """Reloads the faculty table for the current filters in the background.
+
+        Returns at once; the table is filled when the query completes. A load still in flight for
+        earlier filters is superseded, so its result is never shown.
+        """
         logging.info("MainDashboard: Attempting to load/refresh faculty data.")
-        self._clear_faculty_cards()
+        self.search_debounce_timer.stop()
         db_service = self.db_service_getter()
         if not db_service:
             logging.error("MainDashboard: DatabaseService not available to load faculty data.")
-            self.faculty_table.setRowCount(0) # Clear table
+            self.loader.cancel("faculty")
+            self.faculty_model.clear()
             QMessageBox.warning(self, "Error", "Could not connect to database to load faculty.")
             return
 
-        try:
-            # Get filter values
-            name_filter = self.faculty_name_search_input.text().strip()
-            dept_filter_val = self.dept_filter_combo.currentText()
-            if dept_filter_val == "All Departments": dept_filter_val = None
-            
-            status_filter_val = self.status_filter_combo.currentText()
-            if status_filter_val == "All Statuses": status_filter_val = None
-
-            faculty_list = db_service.get_all_faculty(name_filter=name_filter if name_filter else None,
-                                                      department_filter=dept_filter_val,
-                                                      status_filter=status_filter_val)
-
-            self.faculty_table.setRowCount(0) # Clear existing rows
-            if faculty_list:
-                self.faculty_table.setRowCount(len(faculty_list))
-                for row_idx, faculty_member in enumerate(faculty_list):
-                    self._populate_faculty_row(row_idx, faculty_member)
-            else:
-                logging.info("MainDashboard: No faculty data found.")
-        except Exception as e:
-            logging.error(f"MainDashboard: Error loading faculty data: {e}")
-            self.faculty_table.setRowCount(0)
-            QMessageBox.critical(self, "Load Error", f"Failed to load faculty data: {e}")
-
-    def _populate_faculty_row(self, row_idx, faculty_member):
-        name_item = QTableWidgetItem(str(faculty_member.get('name', 'N/A')))
-        dept_item = QTableWidgetItem(str(faculty_member.get('department', 'N/A')))
-        office_item = QTableWidgetItem(str(faculty_member.get('office_location', 'N/A')))
-        status_item = QTableWidgetItem(str(faculty_member.get('current_status', 'Unknown')))
-
-        status_text = faculty_member.get('current_status', 'Unknown').lower()
-        if status_text == 'available':
-            status_item.setBackground(QColor("#ccffcc")) # Light green
-            status_item.setForeground(QColor("darkGreen"))
-        elif status_text == 'unavailable':
-            status_item.setBackground(QColor("#ffcccc")) # Light red
-            status_item.setForeground(QColor("darkRed"))
-        else:
-            status_item.setBackground(QColor("#f0f0f0")) # Light grey
-
-        # Center align status for better visuals
-        status_item.setTextAlignment(Qt.AlignCenter)
+        name_filter, dept_filter_val, status_filter_val = self._current_faculty_filters()
+        self.loader.submit("faculty", lambda: db_service.get_all_faculty(name_filter=name_filter,
+                                                                          department_filter=dept_filter_val,
+                                                                          status_filter=status_filter_val))
 
-        self.faculty_table.setItem(row_idx, 0, name_item)
-        self.faculty_table.setItem(row_idx, 1, dept_item)
-        self.faculty_table.setItem(row_idx, 2, office_item)
-        self.faculty_table.setItem(row_idx, 3, status_item)
+    def _refresh_faculty_data(self):
+        # A periodic refresh leaves a slow load alone instead of restarting it every interval
+        if self.loader.is_pending("faculty"):
+            logging.debug("MainDashboard: Previous faculty load still running; skipping refresh.")
+            return
+        self.load_faculty_data()
 
-        # Store faculty_id and ble_identifier in the name item for later retrieval
-        name_item.setData(Qt.UserRole, faculty_member) # Store the whole dict
+    def _show_faculty(self, faculty_list):
+        self.faculty_model.set_faculty(faculty_list)
+        if not faculty_list:
+            logging.info("MainDashboard: No faculty data found.")
 
     def _handle_logout(self):
         self.request_logout.emit()
         # The main application will handle switching back to the auth screen.
 
-    def _handle_faculty_selection_for_request(self, item: QTableWidgetItem):
-        # item is the cell item that was double-clicked, usually the name item
-        # We want the data stored in the first column (name_item) of that row
-        name_cell_item = self.faculty_table.item(item.row(), 0)
-        if name_cell_item:
-            faculty_data = name_cell_item.data(Qt.UserRole)
+    def _handle_faculty_selection_for_request(self, index: QModelIndex):
+        # Any cell of the double-clicked row carries the faculty member's dict
+        if index.isValid():
+            faculty_data = self.faculty_model.faculty_at(index.row())
             if faculty_data and isinstance(faculty_data, dict):
                 self._selected_faculty_for_request = faculty_data
                 self.selected_faculty_label.setText(f"Selected Faculty: {faculty_data.get('name', 'N/A')} (Dept: {faculty_data.get('department', 'N/A')})")
@@ -399,11 +402,81 @@ class MainDashboardScreen(QWidget):
         self.submit_request_button.setEnabled(False)
         # self.request_status_label.setText("") # Cleared by timer or next status
 
+    def prefetch(self, student_data):
+        """Starts loading the faculty directory, departments and the student's open requests in the background.
+
+        Called as soon as a login is accepted; the results fill the (still hidden) dashboard as they
+        arrive, so it is complete when view_did_appear() runs. A prefetch for an earlier student is
+        superseded. cancel_prefetch() drops it when the session ends first.
+        """
+        db_service = self.db_service_getter()
+        student_id = (student_data or {}).get('student_id')
+        if not db_service or student_id is None:
+            self._prefetch_student_id = None
+            return
+        self._prefetch_student_id = student_id
+        self.open_requests_list.clear()
+        self._populate_department_filter()
+        self.load_faculty_data()
+        self.loader.submit("consultations", lambda: db_service.get_open_consultations_for_student(student_id))
+        logging.info(f"MainDashboard: Prefetching dashboard data for student {student_id}.")
+
+    def cancel_prefetch(self):
+        """Drops prefetched data and loads still in flight, e.g. on logout."""
+        self.loader.cancel()
+        self._prefetch_student_id = None
+        self.open_requests_list.clear()
+
+    def _current_faculty_filters(self):
+        name_filter = self.faculty_name_search_input.text().strip() or None
+        dept_filter_val = self.dept_filter_combo.currentText()
+        if dept_filter_val == "All Departments": dept_filter_val = None
+        status_filter_val = self.status_filter_combo.currentText()
+        if status_filter_val == "All Statuses": status_filter_val = None
+        return name_filter, dept_filter_val, status_filter_val
+
+    def _on_background_loaded(self, key, result):
+        if key == "faculty":
+            self._show_faculty(result)
+        elif key == "departments":
+            self._show_departments([row['department'] for row in result or []])
+        elif key == "consultations":
+            self._show_open_requests(result)
+
+    def _on_background_load_failed(self, key, error):
+        if not self.isVisible():
+            self._prefetch_student_id = None # view_did_appear() loads it again, in the foreground
+        elif key == "faculty":
+            self.faculty_model.clear()
+            QMessageBox.critical(self, "Load Error", f"Failed to load faculty data: {error}")
+
+    def load_open_requests(self):
+        """Reloads the student's open requests in the background, e.g. after submitting one."""
+        db_service = self.db_service_getter()
+        student_id = (self.current_student_data or {}).get('student_id')
+        if db_service and student_id is not None:
+            self.loader.submit("consultations", lambda: db_service.get_open_consultations_for_student(student_id))
+
+    def _show_open_requests(self, consultations):
+        self.open_requests_list.clear()
+        for consultation in consultations or []:
+            requested_at = consultation.get('requested_at')
+            when = requested_at.strftime('%b %d %H:%M') if requested_at else ''
+            self.open_requests_list.addItem(
+                f"{consultation.get('faculty_name', 'N/A')}: {consultation.get('subject') or '(no subject)'}"
+                f" - {consultation.get('status', 'Unknown')} {when}".rstrip())
+        if not consultations:
+            self.open_requests_list.addItem("No open requests.")
+
     def view_did_appear(self):
         """Called when this view becomes active."""
         logging.info("MainDashboardScreen appeared.")
-        self._populate_department_filter() # Populate departments before loading data
-        self.load_faculty_data() # Load data when view is shown
+        student_id = (self.current_student_data or {}).get('student_id')
+        if self._prefetch_student_id is None or self._prefetch_student_id != student_id:
+            self._populate_department_filter() # Populate departments before loading data
+            self.load_faculty_data() # Load data when view is shown
+            self.load_open_requests()
+        # Otherwise prefetch() already filled the view, or is about to
         if not self.refresh_timer.isActive():
             self.refresh_timer.start(self.refresh_interval_ms)
 
@@ -412,42 +485,33 @@ class MainDashboardScreen(QWidget):
         logging.info("MainDashboardScreen disappeared.")
         if self.refresh_timer.isActive():
             self.refresh_timer.stop()
+        self._prefetch_student_id = None # Data shown from here on comes from the refresh timer
 
     def _populate_department_filter(self):
+        """Reloads the department filter's choices in the background."""
         logging.debug("Populating department filter...")
         db_service = self.db_service_getter()
         if not db_service:
             logging.warning("Cannot populate department filter, DB service not available.")
             return
+        self.loader.submit("departments", db_service.get_all_departments)
+
+    def _show_departments(self, departments):
+        current_selection = self.dept_filter_combo.currentText()
+        self.dept_filter_combo.blockSignals(True)
         try:
-            current_selection = self.dept_filter_combo.currentText()
-            self.dept_filter_combo.blockSignals(True)
             self.dept_filter_combo.clear()
             self.dept_filter_combo.addItem("All Departments")
-            # This could be optimized by getting distinct departments from DB
-            all_faculty = db_service.get_all_faculty() 
-            if all_faculty:
-                departments = sorted(list(set(f['department'] for f in all_faculty if f.get('department'))))
-                for dept in departments:
-                    self.dept_filter_combo.addItem(dept)
-            
+            for dept in departments:
+                self.dept_filter_combo.addItem(dept)
+
             idx = self.dept_filter_combo.findText(current_selection)
             if idx != -1: self.dept_filter_combo.setCurrentIndex(idx)
             else: self.dept_filter_combo.setCurrentIndex(0)
-            
-        except Exception as e:
-            logging.error(f"Error populating department filter: {e}")
         finally:
             self.dept_filter_combo.blockSignals(False)
-
-    def _clear_faculty_cards(self):
-        for i in reversed(range(self.faculty_grid_layout.count())):
-            widget_to_remove = self.faculty_grid_layout.itemAt(i).widget()
-            if widget_to_remove:
-                self.faculty_grid_layout.removeWidget(widget_to_remove)
-                widget_to_remove.setParent(None)
-                widget_to_remove.deleteLater()
-        self.faculty_cards = []
+        if self.dept_filter_combo.currentText() != current_selection:
+            self.load_faculty_data() # The selected department is gone; the table was filtered by it
 
 # Example of how to run this screen standalone (for testing)
 if __name__ == '__main__':
@@ -463,6 +527,10 @@ if __name__ == '__main__':
                 {'faculty_id': 2, 'name': 'Prof. Beta', 'department': 'Physics', 'office_location': 'B203', 'current_status': 'Unavailable', 'ble_identifier': 'BLE_B'},
                 {'faculty_id': 3, 'name': 'Dr. Gamma', 'department': 'CompSci', 'office_location': 'A102', 'current_status': 'Available', 'ble_identifier': 'BLE_G'},
             ]
+        def get_all_departments(self):
+            return [{'department': 'CompSci', 'faculty_count': 2}, {'department': 'Physics', 'faculty_count': 1}]
+        def get_open_consultations_for_student(self, student_id):
+            return []
     mock_db_dash = MockDBServiceForDashboard()
     
     # The dashboard needs a way to get the db_service, so we provide a simple lambda
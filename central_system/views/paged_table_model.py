@@ -0,0 +1,93 @@
+import logging
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QVariant
+
+DEFAULT_PAGE_SIZE = 100
+
+
+class PagedTableModel(QAbstractTableModel):
+    """Read-only table model that loads its rows a page at a time as a view scrolls to them.
+
+    `columns` is a sequence of (header, format) pairs, where format maps a row dict to the cell
+    text. `fetch_page(limit, after)` returns up to `limit` row dicts following `after`, the last
+    row loaded so far (None for the first page), or None when the fetch failed, e.g.
+    AdminController.get_students_page. The view asks canFetchMore()/fetchMore() for another page
+    when it scrolls near the end of the loaded rows; a page shorter than `page_size` ends the
+    table. A failed fetch does not: fetching pauses until reload(), so a database error is not
+    retried on every scroll. Pages are loaded only as they are scrolled to, then stay loaded until
+    reload(), and no per-cell objects are created. `cell_style(row, column, role)` may return
+    the value for roles other than display text (colours, font, alignment), or None.
+    Qt.UserRole returns the row dict.
+    """
+
+    def __init__(self, columns, fetch_page, page_size=DEFAULT_PAGE_SIZE, cell_style=None, parent=None):
+        super().__init__(parent)
+        self.columns = list(columns)
+        self.fetch_page = fetch_page
+        self.page_size = page_size
+        self.cell_style = cell_style
+        self._rows = []
+        self._complete = False
+        self.fetch_failed = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal and 0 <= section < len(self.columns):
+            return self.columns[section][0]
+        return QVariant()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < len(self._rows):
+            return QVariant()
+        row = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            return self.columns[index.column()][1](row)
+        if role == Qt.UserRole:
+            return row
+        if self.cell_style:
+            value = self.cell_style(row, index.column(), role)
+            if value is not None:
+                return value
+        return QVariant()
+
+    def row_data(self, row):
+        return self._rows[row] if 0 <= row < len(self._rows) else None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._complete and not self.fetch_failed
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        try:
+            page = self.fetch_page(self.page_size, self._rows[-1] if self._rows else None)
+        except Exception as e:
+            logging.error(f"PagedTableModel: Error fetching a page: {e}")
+            page = None
+        if page is None:
+            self.fetch_failed = True
+            logging.warning(f"PagedTableModel: fetching paused after {len(self._rows)} rows until the table is reloaded.")
+            return
+        page = list(page)
+        if len(page) < self.page_size:
+            self._complete = True
+        if not page:
+            return
+        self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(page) - 1)
+        self._rows.extend(page)
+        self.endInsertRows()
+        logging.debug(f"PagedTableModel: loaded {len(page)} rows ({len(self._rows)} in total).")
+
+    def reload(self):
+        """Drops the loaded rows and loads the first page again, e.g. after the table changed."""
+        self.beginResetModel()
+        self._rows = []
+        self._complete = False
+        self.fetch_failed = False
+        self.endResetModel()
+        self.fetchMore()
@@ -11,6 +11,9 @@
 #define MQTT_CLIENT_ID_PREFIX "FacultyDeskUnit_" // Will append BLE ID for uniqueness
 #define MQTT_STATUS_TOPIC_TEMPLATE "consultease/faculty/%s/status" // %s will be FACULTY_BLE_IDENTIFIER
 #define MQTT_REQUEST_TOPIC_TEMPLATE "consultease/faculty/%s/requests" // %s will be FACULTY_BLE_IDENTIFIER
+#define MQTT_ACK_TOPIC_TEMPLATE "consultease/faculty/%s/ack" // Delivery/viewed acks for consultation requests
+#define MQTT_ANNOUNCEMENT_TOPIC "consultease/announcements/all" // Campus-wide announcements
+#define MQTT_DEPARTMENT_ANNOUNCEMENT_TOPIC_TEMPLATE "consultease/announcements/department/%s" // %s: FACULTY_DEPARTMENT as a topic id
 // Backward compatibility topics (optional, implement if needed)
 // #define MQTT_PROFESSOR_STATUS_TOPIC "professor/status"
 // #define MQTT_PROFESSOR_MESSAGES_TOPIC "professor/messages"
@@ -27,5 +30,7 @@
 
 // --- Display Configuration ---
 #define FACULTY_NAME "Dr. Placeholder" // Replace with actual faculty name or load dynamically if possible later
+#define FACULTY_DEPARTMENT "Computer Science" // Must match the faculty's department in the central system (for department announcements)
+#define ANNOUNCEMENT_DISPLAY_MS 60000 // How long an announcement stays on screen
 
 #endif // CONFIG_H 
\ No newline at end of file
@@ -13,6 +13,9 @@ unsigned long last_status_publish_time = 0;
 const unsigned long STATUS_PUBLISH_INTERVAL = 5000; // Publish status every 5 seconds regardless of change
 String current_wifi_status_str = "WiFi: Init";
 String current_mqtt_status_str = "MQTT: Init";
+long last_displayed_consultation_id = -1; // Requests are redelivered until acked; don't redraw duplicates
+bool announcement_visible = false;
+unsigned long announcement_shown_at = 0;
 
 // --- Forward Declarations for MQTT Message Handling (Phase 3) ---
 void handle_incoming_mqtt_message(const char* topic, const char* payload);
@@ -87,6 +90,30 @@ void update_connection_status_display(){
     }
 }
 
+// Value of a string field in a flat JSON object, e.g. json_string_field(payload, "title")
+String json_string_field(const String& payload, const char* key) {
+    String marker = String("\"") + key + "\": \"";
+    int idx = payload.indexOf(marker);
+    if (idx == -1) return String();
+    int start = idx + marker.length();
+    int end = payload.indexOf("\"", start);
+    return end == -1 ? String() : payload.substring(start, end);
+}
+
+void handle_announcement(const char* payload) {
+    String payload_str = String(payload);
+    if (payload_str.length() == 0) {
+        return; // A cleared retained announcement
+    }
+    String title = json_string_field(payload_str, "title");
+    String message = json_string_field(payload_str, "message");
+    char display_title[50];
+    snprintf(display_title, sizeof(display_title), "Notice: %s", title.c_str());
+    display_show_message(display_title, message.c_str(), ANNOUNCEMENT_DISPLAY_MS);
+    announcement_visible = true;
+    announcement_shown_at = millis();
+}
+
 // --- MQTT Message Handler (Phase 3 Placeholder) ---
 void handle_incoming_mqtt_message(const char* topic, const char* payload) {
     Serial.printf("[Main] MQTT Message Received - Topic: %s, Payload: %s\n", topic, payload);
@@ -101,6 +128,20 @@ void handle_incoming_mqtt_message(const char* topic, const char* payload) {
         // Simple parsing assuming payload is like: 
         // {"student_name": "Jane Doe", "course_code": "PHY202", "subject": "Black Holes", ...}
         String payload_str = String(payload);
+
+        // Acknowledge receipt first so the central system stops redelivering this request
+        long consultation_id = -1;
+        int consultation_id_idx = payload_str.indexOf("\"consultation_id\": ");
+        if (consultation_id_idx != -1) {
+            consultation_id = payload_str.substring(consultation_id_idx + 19).toInt(); // length of "\"consultation_id\": "
+            mqtt_publish_ack(consultation_id, "delivered");
+            if (consultation_id == last_displayed_consultation_id) {
+                Serial.printf("Consultation %ld is already displayed; acked the redelivery.\n", consultation_id);
+                mqtt_publish_ack(consultation_id, "viewed");
+                return;
+            }
+        }
+
         String student_name = "Unknown Student";
         String course_code = "N/A";
         String subject = "No Subject";
@@ -139,6 +180,14 @@ void handle_incoming_mqtt_message(const char* topic, const char* payload) {
         // Display the message. For MVP, it shows one at a time.
         // A list/queue of requests would be a post-MVP improvement.
         display_show_message(display_title, display_msg, 0); // Show indefinitely until next status or message
+        announcement_visible = false; // The request replaced it
+        if (consultation_id != -1) {
+            last_displayed_consultation_id = consultation_id;
+            mqtt_publish_ack(consultation_id, "viewed"); // The unit has no input, so shown on screen counts as viewed
+        }
+    } else if (strcmp(topic, MQTT_ANNOUNCEMENT_TOPIC) == 0 || String(topic) == mqtt_department_announcement_topic) {
+        Serial.println("Received an announcement.");
+        handle_announcement(payload);
     } else {
         Serial.printf("Ignoring message on unhandled topic: %s\n", topic);
     }
@@ -166,6 +215,14 @@ void loop() {
         last_conn_display_update = current_time;
     }
 
+    // Take an announcement off the screen once ANNOUNCEMENT_DISPLAY_MS has passed
+    if (announcement_visible && current_time - announcement_shown_at > ANNOUNCEMENT_DISPLAY_MS) {
+        announcement_visible = false;
+        display_clear();
+        display_set_status(is_faculty_present ? "Available" : "Unavailable", is_faculty_present);
+        display_show_connection_status(current_wifi_status_str.c_str(), current_mqtt_status_str.c_str());
+    }
+
     // Add other non-blocking tasks here if needed
     delay(10); // Small delay to be cooperative
 } 
\ No newline at end of file
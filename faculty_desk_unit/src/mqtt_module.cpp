@@ -8,10 +8,30 @@ mqtt_message_callback_t external_mqtt_callback = nullptr;
 
 char mqtt_status_topic[100];
 char mqtt_request_topic[100];
+char mqtt_ack_topic[100];
+char mqtt_department_announcement_topic[100];
 char mqtt_client_id[100];
 
 unsigned long lastReconnectAttempt = 0;
 
+// "Computer Science" -> "computer-science"; must match department_topic_id() in the central system
+void _department_topic_id(const char* department, char* out, size_t out_len) {
+    size_t pos = 0;
+    bool pending_dash = false;
+    for (const char* c = department; *c && pos + 1 < out_len; c++) {
+        if (isalnum((unsigned char)*c)) {
+            if (pending_dash && pos > 0 && pos + 2 < out_len) {
+                out[pos++] = '-';
+            }
+            pending_dash = false;
+            out[pos++] = tolower((unsigned char)*c);
+        } else {
+            pending_dash = true;
+        }
+    }
+    out[pos] = '\0';
+}
+
 void _callback_wrapper(char* topic, byte* payload, unsigned int length) {
     payload[length] = '\0'; // Null terminate payload
     String topic_str = String(topic);
@@ -55,7 +75,11 @@ bool _reconnect_mqtt() {
     if (mqttClient.connect(mqtt_client_id)) {
         Serial.println("MQTT Connected!");
         // Subscribe to topics
-        mqttClient.subscribe(mqtt_request_topic);
+        mqttClient.subscribe(mqtt_request_topic, 1); // QoS 1: requests are redelivered until acked, duplicates are filtered in main
+        // Announcements are published once by the central system and fanned out by the broker
+        mqttClient.subscribe(MQTT_ANNOUNCEMENT_TOPIC, 1);
+        mqttClient.subscribe(mqtt_department_announcement_topic, 1);
+        Serial.print("Subscribed to: "); Serial.println(mqtt_department_announcement_topic);
         Serial.print("Subscribed to: "); Serial.println(mqtt_request_topic);
         // Add other subscriptions if needed (e.g., backward compatibility)
         // mqttClient.subscribe(MQTT_PROFESSOR_MESSAGES_TOPIC);
@@ -72,6 +96,10 @@ void mqtt_init(const char* unique_client_id_suffix, const char* faculty_ble_id)
     snprintf(mqtt_client_id, sizeof(mqtt_client_id), "%s%s", MQTT_CLIENT_ID_PREFIX, unique_client_id_suffix);
     snprintf(mqtt_status_topic, sizeof(mqtt_status_topic), MQTT_STATUS_TOPIC_TEMPLATE, faculty_ble_id);
     snprintf(mqtt_request_topic, sizeof(mqtt_request_topic), MQTT_REQUEST_TOPIC_TEMPLATE, faculty_ble_id);
+    snprintf(mqtt_ack_topic, sizeof(mqtt_ack_topic), MQTT_ACK_TOPIC_TEMPLATE, faculty_ble_id);
+    char department_id[60];
+    _department_topic_id(FACULTY_DEPARTMENT, department_id, sizeof(department_id));
+    snprintf(mqtt_department_announcement_topic, sizeof(mqtt_department_announcement_topic), MQTT_DEPARTMENT_ANNOUNCEMENT_TOPIC_TEMPLATE, department_id);
 
     _connect_wifi();
     mqttClient.setServer(MQTT_BROKER_HOST, MQTT_BROKER_PORT);
@@ -116,4 +144,20 @@ bool mqtt_publish_status(const char* faculty_ble_id, const char* status_payload)
         Serial.println("MQTT: Status publish FAILED.");
         return false;
     }
+}
+
+bool mqtt_publish_ack(long consultation_id, const char* event) {
+    if (!mqtt_is_connected()) {
+        Serial.println("MQTT: Cannot publish ack, not connected.");
+        return false;
+    }
+    char ack_payload[80];
+    snprintf(ack_payload, sizeof(ack_payload), "{\"consultation_id\": %ld, \"event\": \"%s\"}", consultation_id, event);
+    Serial.printf("MQTT: Publishing to %s: %s\n", mqtt_ack_topic, ack_payload);
+    if (mqttClient.publish(mqtt_ack_topic, ack_payload)) { // Not retained; the central system batches these
+        return true;
+    } else {
+        Serial.println("MQTT: Ack publish FAILED.");
+        return false;
+    }
 } 
\ No newline at end of file
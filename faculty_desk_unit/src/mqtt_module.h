@@ -12,5 +12,9 @@ void mqtt_set_callback(mqtt_message_callback_t callback);
 void mqtt_loop(); // Needs to be called regularly to maintain connection and process messages
 bool mqtt_is_connected();
 bool mqtt_publish_status(const char* faculty_ble_id, const char* status_payload); // payload: "Available" or "Unavailable" or JSON
+bool mqtt_publish_ack(long consultation_id, const char* event); // event: "delivered" or "viewed"
+
+extern char mqtt_request_topic[100]; // Formatted in mqtt_init
+extern char mqtt_department_announcement_topic[100]; // Formatted in mqtt_init from FACULTY_DEPARTMENT
 
 #endif // MQTT_MODULE_H 
\ No newline at end of file